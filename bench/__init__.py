@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# bot modules are imported the way shinogramma.py imports them
+sys.path.insert(0, str(object=Path(__file__).resolve().parent.parent / "src"))
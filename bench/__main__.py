@@ -0,0 +1,82 @@
+import logging
+import argparse
+import asyncio
+import json
+import platform
+import time
+from pathlib import Path
+from typing import Any
+from bench.scenarios import SCENARIOS
+
+logger = logging.getLogger(name=__name__)
+'''
+Runs the benchmark scenarios against local fake Shinobi and Telegram servers:
+    python -m bench --scenario notifier --scenario videos --output results.json
+'''
+DEFAULTS: dict[str, Any] = {
+    "monitors": 10,
+    "videos": 10000,
+    "jpeg_size": 50000,
+    "shinobi_latency": 0.01, # in seconds
+    "telegram_latency": 0.02, # in seconds
+    "events": 500,
+    "concurrency": 20,
+    "recipients": 2,
+    "workers": 2,
+    "telegram_global_rate": 1000, # messages per second, above Telegram limits on purpose
+    "timeout": 60, # in seconds
+    "iterations": 50,
+    "steps": 200,
+    "links": 1000,
+    "chats": 10,
+}
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Shinogramma benchmarks")
+    parser.add_argument(
+        "--scenario", action="append", choices=list(SCENARIOS),
+        help="scenario to run, can be repeated (default: all)",
+    )
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    parser.add_argument("--log-level", default="WARNING")
+    for key, value in DEFAULTS.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    return parser.parse_args()
+
+
+async def runScenarios(names: list[str], config: dict[str, Any]) -> dict[str, Any]:
+    results = {}
+    for name in names:
+        logger.warning(msg=f"Running {name}...")
+        started = time.monotonic()
+        try:
+            results[name] = await SCENARIOS[name](config)
+        except Exception as e:
+            logger.error(msg=f"Scenario {name} failed: {e}")
+            results[name] = {"error": str(object=e)}
+        results[name]["wall_seconds"] = round(time.monotonic() - started, 3)
+    return results
+
+
+def main() -> None:
+    args = parseArgs()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    config = {key: getattr(args, key) for key in DEFAULTS}
+    names = args.scenario or list(SCENARIOS)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "scenarios": asyncio.run(runScenarios(names=names, config=config)),
+    }
+    text = json.dumps(obj=report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        Path(args.output).write_text(data=text + "\n")
+        logger.warning(msg=f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import logging
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any
+from quart import Quart, request, Response, jsonify
+
+logger = logging.getLogger(name=__name__)
+
+class FakeShinobi:
+    """
+    A class representing a local stand-in for the Shinobi API endpoints used by
+    Shinogramma, with generated monitors and recordings and a configurable latency.
+    """
+    def __init__(
+        self,
+        apiKey: str = "apikey",
+        groupKey: str = "group",
+        monitors: int = 10,
+        videos: int = 10000,
+        jpegSize: int = 50000,
+        latency: float = 0.01,
+    ) -> None:
+        self.apiKey = apiKey
+        self.groupKey = groupKey
+        self.latency = latency
+        self.requests: Counter[str] = Counter()
+        self.app = Quart(import_name=__name__)
+        self.monitors: dict[str, dict[str, Any]] = {}
+        for number in range(monitors):
+            self.addMonitor(mid=f"mid{number:04d}")
+        # every monitor shares the same recordings, newest first
+        newest = datetime(year=2024, month=1, day=1) + timedelta(minutes=videos)
+        self.videos: list[dict[str, Any]] = []
+        for number in range(videos):
+            start = newest - timedelta(minutes=number)
+            self.videos.append(
+                {
+                    "filename": f"{start.strftime('%Y-%m-%dT%H-%M-%S')}.mp4",
+                    "time": start.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "end": (start + timedelta(seconds=50)).strftime("%Y-%m-%dT%H:%M:%S"),
+                    "objects": "person" if number % 7 == 0 else "",
+                    "status": 1,
+                    "size": 1000000,
+                }
+            )
+        self.jpeg = b"\xff\xd8\xff" + b"\0" * max(0, jpegSize - 3)
+        self.states = [{"name": f"state{number}"} for number in range(5)]
+        routes = {
+            "/<apiKey>/monitor/<groupKey>": self.monitorList,
+            "/<apiKey>/monitor/<groupKey>/<mid>": self.monitor,
+            "/<apiKey>/videos/<groupKey>/<mid>": self.videoList,
+            "/<apiKey>/jpeg/<groupKey>/<mid>/s.jpg": self.snapshot,
+            "/<apiKey>/monitorStates/<groupKey>": self.stateList,
+            "/<apiKey>/monitorStates/<groupKey>/<name>": self.activateState,
+            "/<apiKey>/toggleSubstream/<groupKey>/<mid>": self.toggleSubstream,
+        }
+        for rule, view in routes.items():
+            self.app.add_url_rule(rule=rule, endpoint=view.__name__, view_func=view, methods=["GET"])
+
+    def addMonitor(self, mid: str) -> None:
+        number = len(self.monitors)
+        self.monitors[mid] = {
+            "mid": mid,
+            "ke": self.groupKey,
+            "name": f"Camera {number}",
+            "tags": "door" if number % 2 else "yard",
+            "status": "Watching",
+            "subStreamActive": False,
+            "streams": [f"/{self.apiKey}/hls/{self.groupKey}/{mid}/s.m3u8"],
+            "details": {
+                "snap": "1",
+                "stream_type": "hls",
+                "geolocation": "45.0,9.0",
+                "substream": {"output": {"stream_type": "hls"}},
+            },
+        }
+
+    async def _wait(self, endpoint: str) -> None:
+        self.requests[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(delay=self.latency)
+
+    def setSubstreams(self, active: bool, mids: list[str] | None = None) -> None:
+        for mid in mids or list(self.monitors):
+            self.monitors[mid]["subStreamActive"] = active
+
+    async def monitorList(self, apiKey: str, groupKey: str) -> Response:
+        await self._wait(endpoint="monitor")
+        return jsonify(list(self.monitors.values()))
+
+    async def monitor(self, apiKey: str, groupKey: str, mid: str) -> Response:
+        await self._wait(endpoint="monitor")
+        if mid not in self.monitors:
+            return jsonify([])
+        return jsonify([self.monitors[mid]])
+
+    async def videoList(self, apiKey: str, groupKey: str, mid: str) -> Response:
+        await self._wait(endpoint="videos")
+        args = request.args
+        start, end = args.get("start"), args.get("end")
+        startOperator = args.get("startOperator", ">=")
+        endOperator = args.get("endOperator", "<=")
+        limit = int(args.get("limit", 100))
+        compare = {
+            ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+            "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+        }
+        videos = []
+        for video in self.videos:
+            if start and not compare[startOperator](video["time"], start):
+                continue
+            if end and not compare[endOperator](video["time"], end):
+                continue
+            videos.append(dict(video, mid=mid))
+            if len(videos) >= limit:
+                break
+        return jsonify({"ok": True, "videos": videos})
+
+    async def snapshot(self, apiKey: str, groupKey: str, mid: str) -> Response:
+        await self._wait(endpoint="jpeg")
+        return Response(response=self.jpeg, content_type="image/jpeg")
+
+    async def stateList(self, apiKey: str, groupKey: str) -> Response:
+        await self._wait(endpoint="monitorStates")
+        return jsonify({"ok": True, "presets": self.states})
+
+    async def activateState(self, apiKey: str, groupKey: str, name: str) -> Response:
+        await self._wait(endpoint="monitorStates")
+        return jsonify({"ok": True})
+
+    async def toggleSubstream(self, apiKey: str, groupKey: str, mid: str) -> Response:
+        await self._wait(endpoint="toggleSubstream")
+        self.monitors[mid]["subStreamActive"] = not self.monitors[mid]["subStreamActive"]
+        return jsonify({"ok": True})
+
+
+if __name__ == "__main__":
+    raise SystemExit
@@ -0,0 +1,76 @@
+import logging
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Any
+from quart import Quart, request, Response, jsonify
+
+logger = logging.getLogger(name=__name__)
+
+class FakeTelegram:
+    """
+    A class representing a local stand-in for the Telegram Bot API, it accepts the
+    methods Shinogramma uses and answers like Telegram would after `latency` seconds.
+    """
+    def __init__(self, latency: float = 0.02) -> None:
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.bytesReceived: int = 0
+        # times the messages were received, to measure delivery latency
+        self.received: list[float] = []
+        self.messageId: int = 0
+        self.app = Quart(import_name=__name__)
+        self.app.add_url_rule(
+            rule="/bot<token>/<method>", endpoint="method", view_func=self.method, methods=["POST", "GET"]
+        )
+
+    def _message(self, chatId: Any, photo: bool = False, **fields: Any) -> dict[str, Any]:
+        self.messageId += 1
+        message: dict[str, Any] = {
+            "message_id": self.messageId,
+            "date": int(time.time()),
+            "chat": {"id": int(chatId or 1), "type": "private"},
+            **fields,
+        }
+        if photo:
+            message["photo"] = [
+                {
+                    "file_id": f"photo{self.messageId}",
+                    "file_unique_id": f"unique{self.messageId}",
+                    "width": 640,
+                    "height": 480,
+                }
+            ]
+        self.received.append(time.monotonic())
+        return message
+
+    async def method(self, token: str, method: str) -> Response:
+        self.calls[method] += 1
+        self.bytesReceived += request.content_length or 0
+        form = await request.form
+        await request.files
+        if self.latency:
+            await asyncio.sleep(delay=self.latency)
+        chatId = form.get("chat_id")
+        if method == "getMe":
+            result: Any = {
+                "id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot",
+                "can_join_groups": False, "can_read_all_group_messages": False,
+                "supports_inline_queries": False,
+            }
+        elif method in ("sendMessage", "editMessageText"):
+            result = self._message(chatId=chatId, text=form.get("text", ""))
+        elif method in ("sendPhoto", "sendVideo", "sendDocument"):
+            result = self._message(chatId=chatId, photo=method == "sendPhoto")
+        elif method == "sendMediaGroup":
+            media = json.loads(form.get("media", "[]"))
+            result = [self._message(chatId=chatId, photo=True) for _ in media]
+        else:
+            # deleteMessages, answerCallbackQuery, sendChatAction...
+            result = True
+        return jsonify({"ok": True, "result": result})
+
+
+if __name__ == "__main__":
+    raise SystemExit
@@ -0,0 +1,332 @@
+import logging
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from urllib.parse import quote
+import httpx
+from bench.scenarios import BenchServer, Environment, Served, freePort, percentiles
+
+logger = logging.getLogger(name=__name__)
+'''
+Replays Shinobi INNER_EVENT_INFO payloads against /notifier/ at an open loop arrival
+rate: events are sent when they are due, whether or not the previous ones have been
+answered, like cameras do. Everything runs offline against the fake servers:
+    python -m bench.loadgen --rate 50 --duration 30 --burst-size 200 --burst-every 10
+'''
+METHODS = ("get", "post", "multipart")
+
+def synthesize(mids: list[str], count: int, seed: int = 0) -> list[dict[str, Any]]:
+    generator = random.Random(seed)
+    reasons = ("motion", "object", "face")
+    payloads = []
+    for number in range(count):
+        reason = generator.choice(reasons)
+        payloads.append(
+            {"info": {
+                "mid": generator.choice(mids),
+                "title": reason.capitalize(),
+                "description": f"Synthetic event {number}",
+                "eventDetails": {
+                    "reason": reason,
+                    "matrices": [{"tag": "person", "confidence": 0.9}] if reason == "object" else None,
+                },
+            }}
+        )
+    return payloads
+
+
+def readPayloads(path: Path) -> list[dict[str, Any]]:
+    """
+    Recorded payloads, as a JSON list or one JSON object per line.
+    """
+    text = path.read_text()
+    if text.lstrip().startswith("["):
+        return json.loads(s=text)
+    return [json.loads(s=line) for line in text.splitlines() if line.strip()]
+
+
+def arrivals(rate: float, duration: float, burstSize: int, burstEvery: float, seed: int = 0) -> list[float]:
+    """
+    Seconds from the start at which events are sent: Poisson arrivals at `rate` per
+    second plus `burstSize` simultaneous events every `burstEvery` seconds.
+    """
+    generator = random.Random(seed)
+    times = []
+    now = 0.0
+    while rate > 0:
+        now += generator.expovariate(rate)
+        if now >= duration:
+            break
+        times.append(now)
+    if burstSize and burstEvery:
+        burst = burstEvery
+        while burst < duration:
+            times.extend([burst] * burstSize)
+            burst += burstEvery
+    return sorted(times)
+
+
+def maxRss() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+class LoadGenerator:
+    """
+    A class representing a Shinobi instance sending events to /notifier/.
+    """
+    def __init__(
+        self, url: str, method: str = "get", images: int = 2, image: bytes = b"",
+        timeout: float = 5, connections: int = 1000,
+    ) -> None:
+        self.url = url
+        self.method = method
+        self.images = images
+        self.image = image
+        self.timeout = timeout
+        self.connections = connections
+        self.latencies: list[float] = []
+        self.statuses: dict[str, int] = {}
+        self.methods: dict[str, int] = {}
+        self.late: list[float] = []
+
+    def _count(self, status: str) -> None:
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    async def fire(self, http: httpx.AsyncClient, payload: dict[str, Any], number: int) -> None:
+        method = self.method if self.method in METHODS else METHODS[number % len(METHODS)]
+        self.methods[method] = self.methods.get(method, 0) + 1
+        url = f"/notifier/?message={quote(string=json.dumps(obj=payload))}"
+        started = time.monotonic()
+        try:
+            if method == "get":
+                response = await http.get(url=url)
+            elif method == "post":
+                response = await http.post(url=url)
+            else:
+                files = {
+                    f"image{index}": (f"image{index}.jpg", self.image, "image/jpeg")
+                    for index in range(self.images)
+                }
+                response = await http.post(url=url, files=files)
+            self._count(status=str(object=response.status_code))
+        except httpx.TimeoutException:
+            self._count(status="timeout")
+        except httpx.HTTPError as e:
+            logger.debug(msg=f"Error sending event {number}: {e}")
+            self._count(status="error")
+        finally:
+            self.latencies.append(time.monotonic() - started)
+
+    async def run(self, payloads: list[dict[str, Any]], schedule: list[float]) -> float:
+        """
+        Returns:
+            float: seconds taken to send all the events and get all the answers.
+        """
+        async with httpx.AsyncClient(
+            base_url=self.url,
+            timeout=httpx.Timeout(timeout=self.timeout),
+            limits=httpx.Limits(max_connections=self.connections),
+        ) as http:
+            tasks = []
+            started = time.monotonic()
+            for number, due in enumerate(schedule):
+                delay = started + due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay=delay)
+                else:
+                    # the generator itself could not keep up
+                    self.late.append(-delay)
+                tasks.append(
+                    asyncio.create_task(
+                        coro=self.fire(http=http, payload=payloads[number % len(payloads)], number=number)
+                    )
+                )
+            await asyncio.gather(*tasks)
+            return time.monotonic() - started
+
+
+async def drain(server: BenchServer, timeout: float) -> None:
+    """
+    Waits for queued and held events to be notified, at most `timeout` seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.events.queue.empty() and not server.limiter.pending:
+            await asyncio.wait_for(fut=server.events.queue.join(), timeout=max(0, deadline - time.monotonic()))
+            return
+        await asyncio.sleep(delay=0.1)
+    logger.warning(msg="Events still pending after drain timeout")
+
+
+async def loadTest(config: dict[str, Any]) -> dict[str, Any]:
+    async with Environment(config=config) as environment:
+        mids = list(environment.shinobi.monitors)
+        if config["payloads"]:
+            payloads = readPayloads(path=Path(config["payloads"]))
+            # recorded mids must be known to the fake Shinobi
+            for payload in payloads:
+                mid = payload.get("info", {}).get("mid")
+                if mid and mid not in environment.shinobi.monitors:
+                    environment.shinobi.addMonitor(mid=mid)
+        else:
+            payloads = synthesize(mids=mids, count=max(1, config["mids"] * 10), seed=config["seed"])
+        schedule = arrivals(
+            rate=config["rate"],
+            duration=config["duration"],
+            burstSize=config["burst_size"],
+            burstEvery=config["burst_every"],
+            seed=config["seed"],
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            server = BenchServer(
+                client=environment.client,
+                registry=environment.registry,
+                snapshots=environment.snapshots,
+                webhooks=None,
+                port=freePort(),
+                requestsRateLimit=config["rate_limit"],
+                rateLimitBurst=config["rate_limit_burst"],
+                toNotify=list(range(1, config["recipients"] + 1)),
+                application=SimpleNamespace(bot=environment.bot),
+                telegramGlobalRate=config["telegram_global_rate"],
+                telegramChatInterval=config["telegram_chat_interval"],
+                queueSize=config["queue_size"],
+                workers=config["workers"],
+                overflowPolicy=config["overflow_policy"],
+                journal=str(object=Path(directory) / "journal") if config["journal"] else None,
+            )
+            server.expected = len(schedule)
+            if server.journal:
+                await server.journal.open()
+            server.events.start()
+            depth = {"max": 0}
+            async def sampleDepth() -> None:
+                while True:
+                    depth["max"] = max(depth["max"], server.events.queue.qsize())
+                    await asyncio.sleep(delay=0.05)
+            sampler = asyncio.create_task(coro=sampleDepth(), name="SampleDepth")
+            generator = LoadGenerator(
+                url="",
+                method=config["method"],
+                images=config["images"],
+                image=environment.shinobi.jpeg,
+                timeout=config["client_timeout"],
+                connections=config["connections"],
+            )
+            rssBefore = maxRss()
+            async with Served(app=server.app, port=server.port) as served:
+                generator.url = served.url
+                sending = await generator.run(payloads=payloads, schedule=schedule)
+                await drain(server=server, timeout=config["drain"])
+            sampler.cancel()
+            await server.events.stop()
+            if server.journal:
+                await server.journal.close()
+    limiter = server.limiter.stats()
+    singles = len(server.latencies) - server.digests
+    pending = server.events.queue.qsize() + limiter["pending"]
+    return {
+        "sent": len(schedule),
+        "offered_per_second": round(len(schedule) / max(config["duration"], 1e-9), 1),
+        "send_seconds": round(sending, 3),
+        "methods": generator.methods,
+        "statuses": generator.statuses,
+        "accept_latency_ms": percentiles(samples=generator.latencies),
+        "generator_late_ms": percentiles(samples=generator.late),
+        "delivered": {
+            "events": singles + limiter["coalesced"] - limiter["pending"],
+            "notifications": len(server.latencies),
+            "digests": server.digests,
+            "coalesced_events": limiter["coalesced"],
+        },
+        "dropped": {
+            "rejected": server.events.rejected,
+            "dropped_oldest": server.events.droppedOldest,
+            "rate_limited": limiter["dropped"],
+            "failed": server.events.failed,
+            "pending_at_end": pending,
+        },
+        "end_to_end_ms": percentiles(samples=server.latencies),
+        "queue_depth_max": depth["max"],
+        "stages": server.events.timings.stats(),
+        "telegram_calls": dict(environment.telegram.calls),
+        "memory": {
+            # the generator and the fake servers run in the same process
+            "max_rss_mb_before": rssBefore,
+            "max_rss_mb": maxRss(),
+        },
+    }
+
+
+DEFAULTS: dict[str, Any] = {
+    "rate": 20, # events per second
+    "duration": 10, # in seconds
+    "burst_size": 0,
+    "burst_every": 0, # in seconds
+    "mids": 50,
+    "method": "mixed", # get, post, multipart or mixed
+    "images": 2, # per multipart event
+    "jpeg_size": 50000,
+    "payloads": "", # recorded payloads file, synthesized when empty
+    "seed": 0,
+    "client_timeout": 5, # in seconds, Shinobi gives up after this
+    "connections": 1000,
+    "drain": 30, # in seconds
+    "rate_limit": 10, # the notifier settings, see README
+    "rate_limit_burst": 1,
+    "queue_size": 100,
+    "workers": 2,
+    "overflow_policy": "drop_oldest",
+    "journal": True,
+    "recipients": 2,
+    "telegram_global_rate": 30,
+    "telegram_chat_interval": 1,
+    "shinobi_latency": 0.01,
+    "telegram_latency": 0.05,
+}
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench.loadgen", description="Load /notifier/ with Shinobi events")
+    parser.add_argument("--output", default="-", help="JSON results file (default: stdout)")
+    parser.add_argument("--log-level", default="WARNING")
+    for key, value in DEFAULTS.items():
+        option = f"--{key.replace('_', '-')}"
+        if isinstance(value, bool):
+            parser.add_argument(option, action=argparse.BooleanOptionalAction, default=value)
+        else:
+            parser.add_argument(option, type=type(value), default=value)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parseArgs()
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    config = {key: getattr(args, key) for key in DEFAULTS}
+    # what the fake servers need besides the load settings
+    config.update(monitors=config["mids"], videos=0)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": asyncio.run(loadTest(config=config)),
+    }
+    text = json.dumps(obj=report, indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        Path(args.output).write_text(data=text + "\n")
+        logger.warning(msg=f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
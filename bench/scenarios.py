@@ -0,0 +1,366 @@
+import logging
+import asyncio
+import json
+import socket
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from urllib.parse import quote
+import httpx
+from quart import Quart
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from callbackData import pack, setKey
+from keyboards import KeyboardCache
+from metrics import TimedRequest
+from monitor import Monitor, SubStream
+from monitorRegistry import MonitorRegistry
+from notify import WebhookServer
+from shinobiClient import ShinobiClient
+from snapshot import SnapshotService
+from substreamWatcher import SubstreamWatcher
+from video import VideoCache
+from bench.fakeShinobi import FakeShinobi
+from bench.fakeTelegram import FakeTelegram
+
+logger = logging.getLogger(name=__name__)
+
+def freePort() -> int:
+    with socket.socket(family=socket.AF_INET, type=socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """
+    Summary of `samples` (in seconds) as milliseconds.
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.fmean(ordered) * 1000, 3),
+        "p50": at(fraction=0.5),
+        "p90": at(fraction=0.9),
+        "p99": at(fraction=0.99),
+        "max": round(ordered[-1] * 1000, 3),
+    }
+
+
+class Served:
+    """
+    A class representing a Quart app served on a local port for the duration of an
+    `async with` block.
+    """
+    def __init__(self, app: Quart, port: int | None = None) -> None:
+        self.app = app
+        self.port = port or freePort()
+        self.stopEvent = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def __aenter__(self) -> "Served":
+        self.task = asyncio.create_task(
+            coro=self.app.run_task(
+                host="127.0.0.1", port=self.port, shutdown_trigger=self.stopEvent.wait
+            ),
+            name=f"Served {self.port}",
+        )
+        for _ in range(200):
+            if self.task.done():
+                self.task.result()
+            with socket.socket(family=socket.AF_INET, type=socket.SOCK_STREAM) as sock:
+                if sock.connect_ex(("127.0.0.1", self.port)) == 0:
+                    return self
+            await asyncio.sleep(delay=0.025)
+        raise RuntimeError(f"Server on port {self.port} did not start")
+
+    async def __aexit__(self, *exc: Any) -> None:
+        self.stopEvent.set()
+        if self.task is not None:
+            await asyncio.gather(self.task, return_exceptions=True)
+
+
+class Environment:
+    """
+    A class representing fake Shinobi and Telegram servers and the bot objects
+    talking to them, shared by a scenario.
+    """
+    def __init__(self, config: dict[str, Any]) -> None:
+        self.config = config
+        self.shinobi = FakeShinobi(
+            monitors=config["monitors"],
+            videos=config["videos"],
+            jpegSize=config["jpeg_size"],
+            latency=config["shinobi_latency"],
+        )
+        self.telegram = FakeTelegram(latency=config["telegram_latency"])
+        self.shinobiServer = Served(app=self.shinobi.app)
+        self.telegramServer = Served(app=self.telegram.app)
+
+    async def __aenter__(self) -> "Environment":
+        await self.shinobiServer.__aenter__()
+        await self.telegramServer.__aenter__()
+        self.client = ShinobiClient(
+            baseUrl="http://127.0.0.1",
+            port=self.shinobiServer.port,
+            apiKey=self.shinobi.apiKey,
+            groupKey=self.shinobi.groupKey,
+        )
+        self.registry = MonitorRegistry(client=self.client)
+        self.videos = VideoCache(client=self.client)
+        self.snapshots = SnapshotService(client=self.client, registry=self.registry)
+        self.bot = Bot(
+            token="123:bench",
+            base_url=f"{self.telegramServer.url}/bot",
+            request=TimedRequest(connection_pool_size=256),
+        )
+        await self.bot.initialize()
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.bot.shutdown()
+        await self.client.close()
+        await self.telegramServer.__aexit__()
+        await self.shinobiServer.__aexit__()
+
+    def monitor(self, mid: str, chatId: int = 1) -> Monitor:
+        # Monitor only needs the callback query of the update it answers
+        update = SimpleNamespace(callback_query=None)
+        context = SimpleNamespace(bot=self.bot)
+        return Monitor(
+            update=update, context=context, chatId=chatId, client=self.client,
+            registry=self.registry, videos=self.videos, snapshots=self.snapshots,
+            mid=mid, name=mid, proxyPageUrl=None, proxyPageTimeout=6000,
+        )
+
+
+class BenchServer(WebhookServer):
+    """
+    A class representing the webhook server, recording how long every event takes
+    from its arrival to its delivery.
+    """
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.latencies: list[float] = []
+        self.delivered = asyncio.Event()
+        self.expected: int = 0
+        self.digests: int = 0
+
+    async def deliver(self, event: dict, messageToSend: str | None = None) -> bool:
+        result = await super().deliver(event=event, messageToSend=messageToSend)
+        if messageToSend is not None:
+            self.digests += 1
+        self.latencies.append(time.time() - event["received"])
+        if len(self.latencies) >= self.expected:
+            self.delivered.set()
+        return result
+
+
+async def notifierThroughput(config: dict[str, Any]) -> dict[str, Any]:
+    """
+    Events sent to /notifier/ as fast as `concurrency` Shinobi connections allow,
+    each one notified to `recipients` chats with a snapshot.
+    """
+    events = config["events"]
+    async with Environment(config=config) as environment:
+        with tempfile.TemporaryDirectory() as directory:
+            server = BenchServer(
+                client=environment.client,
+                registry=environment.registry,
+                snapshots=environment.snapshots,
+                webhooks=None,
+                port=freePort(),
+                requestsRateLimit=0,
+                toNotify=list(range(1, config["recipients"] + 1)),
+                application=SimpleNamespace(bot=environment.bot),
+                telegramGlobalRate=config["telegram_global_rate"],
+                telegramChatInterval=0,
+                queueSize=events,
+                workers=config["workers"],
+                journal=str(object=Path(directory) / "journal"),
+            )
+            server.expected = events
+            await server.journal.open()  # type: ignore
+            server.events.start()
+            mids = list(environment.shinobi.monitors)
+            accept: list[float] = []
+            statuses: dict[int, int] = {}
+            semaphore = asyncio.Semaphore(value=config["concurrency"])
+            async with Served(app=server.app, port=server.port) as served, httpx.AsyncClient(
+                base_url=served.url,
+                limits=httpx.Limits(max_connections=config["concurrency"]),
+            ) as http:
+                async def send(number: int) -> None:
+                    message = json.dumps(
+                        obj={"info": {
+                            "mid": mids[number % len(mids)],
+                            "title": "Motion",
+                            "description": f"Event {number}",
+                            "eventDetails": {"reason": "motion"},
+                        }}
+                    )
+                    async with semaphore:
+                        started = time.monotonic()
+                        response = await http.get(url=f"/notifier/?message={quote(string=message)}")
+                        accept.append(time.monotonic() - started)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                started = time.monotonic()
+                await asyncio.gather(*(send(number=number) for number in range(events)))
+                accepted = time.monotonic() - started
+                try:
+                    await asyncio.wait_for(fut=server.delivered.wait(), timeout=config["timeout"])
+                except asyncio.TimeoutError:
+                    logger.warning(msg=f"Only {len(server.latencies)} of {events} events delivered")
+                elapsed = time.monotonic() - started
+                await server.events.stop()
+                await server.journal.close()  # type: ignore
+    return {
+        "events": events,
+        "statuses": statuses,
+        "accept_seconds": round(accepted, 3),
+        "accepted_per_second": round(events / accepted, 1),
+        "delivered": len(server.latencies),
+        "delivered_per_second": round(len(server.latencies) / elapsed, 1),
+        "accept_latency_ms": percentiles(samples=accept),
+        "end_to_end_ms": percentiles(samples=server.latencies),
+        "stages": server.events.stats()["stages"],
+        "telegram_calls": dict(environment.telegram.calls),
+        "shinobi_requests": dict(environment.shinobi.requests),
+    }
+
+
+async def monitorsMenu(config: dict[str, Any]) -> dict[str, Any]:
+    """
+    What /monitors does: list the monitors, take the keyboard from the cache (built
+    once per version of the list) and send it. The first run finds the registry empty.
+    """
+    setKey(secret="bench")
+    keyboards = KeyboardCache()
+    async with Environment(config=config) as environment:
+        def build(monitors: list[dict]) -> InlineKeyboardMarkup:
+            return InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(
+                    text=monitor["name"],
+                    callback_data=pack(tag="monitors_command", mid=monitor["mid"]),
+                )]
+                for monitor in monitors
+            ])
+        async def menu() -> float:
+            started = time.monotonic()
+            monitors = await environment.registry.getAll(stale=True) or []
+            markup = keyboards.get(
+                kind="monitors",
+                permissions="p0",
+                version=environment.registry.version(kind="monitors") or "",
+                build=lambda: build(monitors=monitors),
+            )
+            await environment.bot.send_message(
+                chat_id=1, text="Select one monitor:", reply_markup=markup
+            )
+            return time.monotonic() - started
+        cold = await menu()
+        warm = [await menu() for _ in range(config["iterations"])]
+    return {
+        "monitors": config["monitors"],
+        "cold_ms": round(cold * 1000, 3),
+        "warm_ms": percentiles(samples=warm),
+        "keyboards_built": keyboards.misses,
+        "shinobi_requests": dict(environment.shinobi.requests),
+    }
+
+
+async def videoPaging(config: dict[str, Any]) -> dict[str, Any]:
+    """
+    Pages back through the recordings of one monitor a video at a time, then jumps
+    back to the newest one.
+    """
+    async with Environment(config=config) as environment:
+        mid = next(iter(environment.shinobi.monitors))
+        started = time.monotonic()
+        window = await environment.videos.newest(mid=mid)
+        first = time.monotonic() - started
+        assert window is not None
+        cursor = window.videos[0]["filename"]
+        steps: list[float] = []
+        for _ in range(config["steps"]):
+            started = time.monotonic()
+            found = await environment.videos.locate(mid=mid, cursor=cursor, step=1)
+            steps.append(time.monotonic() - started)
+            if found is None:
+                break
+            window, index = found
+            cursor = window.videos[index]["filename"]
+        started = time.monotonic()
+        await environment.videos.newest(mid=mid)
+        back = time.monotonic() - started
+    return {
+        "videos": config["videos"],
+        "steps": len(steps),
+        "newest_ms": round(first * 1000, 3),
+        "step_ms": percentiles(samples=steps),
+        "back_to_newest_ms": round(back * 1000, 3),
+        "cache_hits": environment.videos.hits,
+        "cache_misses": environment.videos.misses,
+        "shinobi_requests": dict(environment.shinobi.requests),
+    }
+
+
+async def substreamChecker(config: dict[str, Any]) -> dict[str, Any]:
+    """
+    One check of `links` substream links spread over all monitors and `chats`
+    chats while substreams are active, then one after they all stopped.
+    """
+    async with Environment(config=config) as environment:
+        watcher = SubstreamWatcher(registry=environment.registry)
+        environment.shinobi.setSubstreams(active=True)
+        mids = list(environment.shinobi.monitors)
+        subStreams = {}
+        for mid in mids:
+            subStream = SubStream(monitor=environment.monitor(mid=mid))
+            await subStream.verifySubStream()
+            subStreams[mid] = subStream
+        for number in range(config["links"]):
+            watcher.track(
+                subStream=subStreams[mids[number % len(mids)]],
+                chatId=number % config["chats"] + 1,
+                messageId=number,
+            )
+        environment.shinobi.requests.clear()
+        started = time.monotonic()
+        await watcher.check(bot=environment.bot)
+        active = time.monotonic() - started
+        activeRequests = dict(environment.shinobi.requests)
+        environment.shinobi.setSubstreams(active=False)
+        environment.telegram.calls.clear()
+        started = time.monotonic()
+        await watcher.check(bot=environment.bot)
+        inactive = time.monotonic() - started
+    return {
+        "links": config["links"],
+        "chats": config["chats"],
+        "check_active_ms": round(active * 1000, 3),
+        "check_active_shinobi_requests": activeRequests,
+        "check_inactive_ms": round(inactive * 1000, 3),
+        "check_inactive_telegram_calls": dict(environment.telegram.calls),
+        "still_tracked": len(watcher.active),
+    }
+
+
+SCENARIOS = {
+    "notifier": notifierThroughput,
+    "monitors": monitorsMenu,
+    "videos": videoPaging,
+    "substreams": substreamChecker,
+}
+
+if __name__ == "__main__":
+    raise SystemExit
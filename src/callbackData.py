@@ -0,0 +1,124 @@
+import logging
+import base64
+import hashlib
+import hmac
+from typing import Any
+
+logger = logging.getLogger(name=__name__)
+'''
+Inline buttons carry plain strings (at most 64 bytes) instead of python objects kept
+in memory and pickled by persistence: a version, the tag of the button, its fields in
+a fixed order and a truncated signature, e.g. "1|v|mid|2024-01-01T10-00-00.mp4|1||sig"
+Names that do not fit (long state names, mids or filenames) are replaced by their
+`shortKey` and looked up again by the receiver.
+'''
+VERSION = "1"
+SEP = "|"
+MAX_BYTES = 64
+SIGNATURE_BYTES = 6
+# tag -> (code, fields in order)
+SCHEMAS: dict[str, tuple[str, tuple[str, ...]]] = {
+    "states_command": ("s", ("choice",)),
+    "monitors_command": ("m", ("mid",)),
+    "monitors_subcommand": ("o", ("mid", "choice")),
+    "getStream": ("t", ("mid",)),
+    "getVideo": ("v", ("mid", "cursor", "step", "operation")),
+    "BOTsettings_command": ("b", ("choice",)),
+}
+CODES: dict[str, str] = {code: tag for tag, (code, _) in SCHEMAS.items()}
+INT_FIELDS = {"step"}
+# fields whose receiver can find the original value from its shortKey
+SHORT_FIELDS = ("choice", "mid", "cursor")
+SHORT_KEY_BYTES = 11
+_key: bytes = b""
+
+def setKey(secret: str) -> None:
+    """
+    Derives the signing key from `secret` (the bot token), buttons signed with another
+    key are rejected.
+    """
+    global _key
+    _key = hashlib.sha256(("callback_data" + secret).encode()).digest()
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(key=_key, msg=payload.encode(), digestmod=hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).decode()
+
+def shortKey(value: str) -> str:
+    """
+    A short stand in for values too long (or not allowed) in callback data, the
+    receiver finds the original comparing it with `shortKey` of the candidates.
+    """
+    return "#" + hashlib.sha1(value.encode()).hexdigest()[:10]
+
+def isShortKey(value: Any) -> bool:
+    return isinstance(value, str) and len(value) == SHORT_KEY_BYTES and value.startswith("#")
+
+def pack(tag: str, **fields: Any) -> str:
+    """
+    Fields in SHORT_FIELDS too long for the button, or containing the separator, are
+    replaced by their `shortKey`, the longest first.
+
+    Raises:
+        ValueError: if the tag is unknown, another field contains the separator or
+        the result still does not fit in 64 bytes.
+    """
+    code, names = SCHEMAS[tag]
+    values = {}
+    for name in names:
+        value = fields.get(name)
+        value = "" if value is None else str(object=value)
+        if SEP in value:
+            if name not in SHORT_FIELDS:
+                raise ValueError(f"{name} can not contain {SEP}")
+            value = shortKey(value=value)
+        values[name] = value
+    while True:
+        payload = SEP.join([VERSION, code, *values.values()])
+        data = f"{payload}{SEP}{_sign(payload=payload)}"
+        if len(data.encode()) <= MAX_BYTES:
+            return data
+        longer = [
+            name for name in names
+            if name in SHORT_FIELDS and len(values[name].encode()) > SHORT_KEY_BYTES
+        ]
+        if not longer:
+            raise ValueError(f"Callback data for {tag} longer than {MAX_BYTES} bytes")
+        name = max(longer, key=lambda name: len(values[name].encode()))
+        logger.debug(msg=f"{name} of {tag} too long for a button, sent as its shortKey")
+        values[name] = shortKey(value=values[name])
+
+def unpack(data: str) -> dict[str, Any] | None:
+    """
+    Returns:
+        dict | None: tag and fields of the button, None if it comes from another
+        version or has been tampered with.
+    """
+    payload, _, signature = data.rpartition(SEP)
+    parts = payload.split(SEP)
+    if len(parts) < 2 or parts[0] != VERSION:
+        logger.debug(msg=f"Callback data of another version: {data}")
+        return None
+    if not hmac.compare_digest(signature, _sign(payload=payload)):
+        logger.warning(msg=f"Rejected callback data with invalid signature: {data}")
+        return None
+    tag = CODES.get(parts[1])
+    if tag is None or len(parts) != len(SCHEMAS[tag][1]) + 2:
+        logger.warning(msg=f"Rejected malformed callback data: {data}")
+        return None
+    result: dict[str, Any] = {"tag": tag}
+    for name, value in zip(SCHEMAS[tag][1], parts[2:]):
+        if value == "":
+            result[name] = None
+        elif name in INT_FIELDS:
+            try:
+                result[name] = int(value)
+            except ValueError:
+                return None
+        else:
+            result[name] = value
+    return result
+
+
+if __name__ == "__main__":
+    raise SystemExit
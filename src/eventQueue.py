@@ -0,0 +1,145 @@
+import logging
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(name=__name__)
+
+class StageTimings:
+    """
+    A class representing running count, average and maximum duration of each stage
+    events go through.
+    """
+    def __init__(self) -> None:
+        # stage -> [count, total seconds, max seconds]
+        self.stages: dict[str, list] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        values = self.stages.get(stage)
+        if values is None:
+            self.stages[stage] = [1, seconds, seconds]
+        else:
+            values[0] += 1
+            values[1] += seconds
+            if seconds > values[2]:
+                values[2] = seconds
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        return {
+            stage: {
+                "count": count,
+                "avg": round(total / count, 4),
+                "max": round(maximum, 4),
+            }
+            for stage, (count, total, maximum) in self.stages.items()
+        }
+
+
+class EventQueue:
+    """
+    A class representing a bounded in-process queue of events consumed by a pool of
+    async workers.
+    When full, the oldest waiting event is dropped ("drop_oldest") or the new one is
+    refused ("reject").
+    """
+    POLICIES = ("drop_oldest", "reject")
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        size: int = 100,
+        workers: int = 2,
+        policy: str = "drop_oldest",
+        onDrop: Callable[[dict], None] | None = None,
+    ) -> None:
+        if policy not in self.POLICIES:
+            logger.warning(msg=f"Unknown overflow policy {policy}, using drop_oldest")
+            policy = "drop_oldest"
+        self.handler = handler
+        self.size = size
+        self.workersCount = max(1, workers)
+        self.policy = policy
+        self.onDrop = onDrop
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=size)
+        self.workers: list[asyncio.Task] = []
+        self.timings = StageTimings()
+        self.accepted: int = 0
+        self.rejected: int = 0
+        self.droppedOldest: int = 0
+        self.processed: int = 0
+        self.failed: int = 0
+
+    def put(self, event: dict) -> bool:
+        """
+        Returns:
+            bool: False if the event was refused because the queue is full.
+        """
+        if self.queue.full():
+            if self.policy == "reject":
+                self.rejected += 1
+                return False
+            dropped = self.queue.get_nowait()
+            self.queue.task_done()
+            self.droppedOldest += 1
+            logger.warning(msg="Events queue full, oldest event dropped...")
+            if self.onDrop:
+                self.onDrop(dropped)
+        event["queued"] = time.monotonic()
+        self.queue.put_nowait(event)
+        self.accepted += 1
+        return True
+
+    async def putWait(self, event: dict) -> None:
+        """
+        Waits for room in the queue instead of applying the overflow policy.
+        """
+        event["queued"] = time.monotonic()
+        await self.queue.put(event)
+        self.accepted += 1
+
+    def start(self) -> None:
+        for number in range(self.workersCount):
+            self.workers.append(
+                asyncio.create_task(coro=self._work(), name=f"EventWorker-{number}")
+            )
+        logger.debug(msg=f"Started {self.workersCount} event workers")
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def _work(self) -> None:
+        while True:
+            event = await self.queue.get()
+            self.timings.record(stage="queue", seconds=time.monotonic() - event["queued"])
+            started = time.monotonic()
+            try:
+                await self.handler(event)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(msg=f"Error processing event: {e}")
+            finally:
+                self.timings.record(stage="total", seconds=time.monotonic() - started)
+                self.queue.task_done()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "depth": self.queue.qsize(),
+            "size": self.size,
+            "policy": self.policy,
+            "workers": len(self.workers),
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "dropped_oldest": self.droppedOldest,
+            "processed": self.processed,
+            "failed": self.failed,
+            "stages": self.timings.stats(),
+        }
+
+
+if __name__ == "__main__":
+    raise SystemExit
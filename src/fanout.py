@@ -0,0 +1,159 @@
+import logging
+import asyncio
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable
+from telegram import error
+from rateLimit import TokenBucket
+
+logger = logging.getLogger(name=__name__)
+
+class FanOut:
+    """
+    A class representing the concurrent delivery of one notification to many chats,
+    within Telegram global and per chat limits.
+    """
+    def __init__(
+        self, globalRate: float = 30, chatInterval: float = 1,
+        retries: int = 3, backoff: float = 1,
+    ) -> None:
+        # 0 (or less) lifts the global limit, a bucket with no interval is always full
+        self.globalBucket = TokenBucket(
+            interval=1 / globalRate if globalRate > 0 else 0, burst=max(1, int(globalRate))
+        )
+        self.chatInterval = chatInterval
+        self.chatBuckets: dict[int | str, TokenBucket] = {}
+        self.retries = retries
+        self.backoff = backoff
+        self.sent: int = 0
+        self.failed: int = 0
+        self.retried: int = 0
+        # chat id -> seconds from dispatch to delivery of the last notification
+        self.latencies: dict[int | str, float] = {}
+
+    async def _acquire(self, bucket: TokenBucket, cost: int = 1) -> None:
+        for _ in range(cost):
+            while True:
+                now = time.monotonic()
+                if bucket.available(now=now):
+                    bucket.take(now=now)
+                    break
+                await asyncio.sleep(delay=bucket.waitTime(now=now))
+
+    def _chatBucket(self, chatId: int | str) -> TokenBucket:
+        bucket = self.chatBuckets.get(chatId)
+        if bucket is None:
+            bucket = TokenBucket(interval=self.chatInterval, burst=1)
+            self.chatBuckets[chatId] = bucket
+        return bucket
+
+    async def _sendOne(
+        self, chatId: int | str, send: Callable[[int | str], Awaitable[Any]],
+        cost: int, started: float,
+    ) -> Any:
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            await self._acquire(bucket=self._chatBucket(chatId=chatId))
+            await self._acquire(bucket=self.globalBucket, cost=cost)
+            try:
+                result = await send(chatId)
+                self.latencies[chatId] = time.monotonic() - started
+                self.sent += 1
+                return result
+            except error.RetryAfter as e:
+                wait = e.retry_after
+                if isinstance(wait, timedelta):
+                    wait = wait.total_seconds()
+                if attempt == self.retries:
+                    logger.error(msg=f"Telegram flood control for {chatId}, giving up")
+                    break
+                logger.info(msg=f"Telegram flood control for {chatId}, retrying in {wait}s")
+                await asyncio.sleep(delay=float(wait))
+            except (error.TimedOut, error.NetworkError) as e:
+                if isinstance(e, error.BadRequest):
+                    logger.error(msg=f"Error notifying {chatId}: {e}")
+                    break
+                if attempt == self.retries:
+                    logger.error(msg=f"Network error notifying {chatId}, giving up: {e}")
+                    break
+                logger.warning(msg=f"Network error notifying {chatId}, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay=delay)
+                delay *= 2
+            except error.TelegramError as e:
+                logger.error(msg=f"Error notifying {chatId}: {e}")
+                break
+            if attempt < self.retries:
+                self.retried += 1
+        self.failed += 1
+        return None
+
+    async def send(
+        self, recipients: list, send: Callable[[int | str], Awaitable[Any]], cost: int = 1,
+        started: float | None = None,
+    ) -> dict[int | str, Any]:
+        """
+        Calls `send(chat_id)` for every recipient concurrently.
+        `cost` is how many messages a single call counts against the global limit
+        (e.g. the size of a media group).
+        Returns:
+            dict: chat id -> result of `send`, None when delivery failed.
+        """
+        if started is None:
+            started = time.monotonic()
+        results = await asyncio.gather(
+            *(
+                self._sendOne(chatId=chatId, send=send, cost=cost, started=started)
+                for chatId in recipients
+            )
+        )
+        if recipients:
+            slowest = max(self.latencies.get(chatId, 0) for chatId in recipients)
+            logger.debug(
+                msg=f"Notification delivered to {sum(r is not None for r in results)}/"
+                f"{len(recipients)} chats, slowest after {slowest:.3f}s"
+            )
+        return dict(zip(recipients, results))
+
+    async def sendUploading(
+        self,
+        recipients: list,
+        upload: Callable[[int | str], Awaitable[Any]],
+        reuse: Callable[[Any], Callable[[int | str], Awaitable[Any]] | None],
+        cost: int = 1,
+    ) -> dict[int | str, Any]:
+        """
+        Uploads to one recipient at a time until an upload succeeds, then sends to
+        all the others concurrently with the callable `reuse` builds from its result
+        (e.g. resending Telegram file_ids instead of the same bytes).
+        Returns:
+            dict: chat id -> result, None when delivery failed.
+        """
+        started = time.monotonic()
+        results: dict[int | str, Any] = {}
+        remaining = list(recipients)
+        while remaining:
+            chatId = remaining.pop(0)
+            result = await self._sendOne(chatId=chatId, send=upload, cost=cost, started=started)
+            results[chatId] = result
+            if result is not None:
+                send = reuse(result)
+                if send is None:
+                    logger.debug(msg="Nothing to reuse from upload, uploading to everyone")
+                    send = upload
+                results.update(
+                    await self.send(recipients=remaining, send=send, cost=cost, started=started)
+                )
+                break
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "latencies": {str(object=chatId): round(latency, 3) for chatId, latency in self.latencies.items()},
+        }
+
+
+if __name__ == "__main__":
+    raise SystemExit
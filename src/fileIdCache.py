@@ -0,0 +1,195 @@
+import logging
+import asyncio
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+from mediaSettings import FileIdsSettings
+from metrics import Gauge
+
+logger = logging.getLogger(name=__name__)
+'''
+Telegram gives every file it receives a file_id, sending it again by file_id moves no
+bytes. Recordings never change once written, so their file_id is kept in SQLite and
+survives restarts; snapshots are kept in memory by content hash, only identical
+images (e.g. a still scene or a camera showing its offline frame) repeat.
+'''
+HIT_RATIO = Gauge(
+    name="shinogramma_file_ids_hit_ratio",
+    help="Share of videos and snapshots sent again by Telegram file_id",
+)
+
+def fileIdOf(sent: Any) -> str | None:
+    """
+    The file_id of the video or photo in `sent`, a Message or a message dict as
+    returned by the Bot API.
+    """
+    if isinstance(sent, dict):
+        for kind in ("video", "animation", "document"):
+            if isinstance(sent.get(kind), dict):
+                return sent[kind].get("file_id")
+        if sent.get("photo"):
+            return sent["photo"][-1].get("file_id")
+        return None
+    for kind in ("video", "animation", "document"):
+        media = getattr(sent, kind, None)
+        if media is not None:
+            return media.file_id
+    if getattr(sent, "photo", None):
+        return sent.photo[-1].file_id
+    return None
+
+
+class FileIdCache:
+    """
+    A class representing the file_ids of videos (by mid, filename and variant, e.g. a
+    preview) and snapshots (by content hash) already sent to Telegram.
+    """
+    # settings live in a light module so they can be read without importing fileIdCache
+    SETTINGS = FileIdsSettings.SETTINGS
+    def __init__(self, path: Path | None = None, maxVideos: int = 10000, maxPhotos: int = 256) -> None:
+        self.path = path
+        self.maxVideos = maxVideos
+        self.maxPhotos = maxPhotos
+        self.connection: sqlite3.Connection | None = None
+        # writes are done in a thread, one at a time
+        self.writing = asyncio.Lock()
+        # (mid, filename, variant) -> file_id, least recently used first
+        self.videos: OrderedDict[tuple[str, str, str], str] = OrderedDict()
+        # content hash -> file_id, least recently used first
+        self.photos: OrderedDict[str, str] = OrderedDict()
+        # (mid, filename, variant) -> use time, of videos sent again since the last write
+        self.touched: dict[tuple[str, str, str], float] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+        HIT_RATIO.function = lambda: self.hits / max(1, self.hits + self.misses)
+
+    def _open(self) -> list[tuple[str, str, str, str]]:
+        assert self.path is not None
+        self.connection = sqlite3.connect(database=self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS videos (mid TEXT NOT NULL, filename TEXT NOT NULL, "
+            "variant TEXT NOT NULL, file_id TEXT NOT NULL, used REAL NOT NULL, "
+            "PRIMARY KEY (mid, filename, variant))"
+        )
+        self.connection.commit()
+        return self.connection.execute(
+            "SELECT mid, filename, variant, file_id FROM videos ORDER BY used"
+        ).fetchall()
+
+    async def open(self) -> None:
+        if self.path is None:
+            return
+        try:
+            rows = await asyncio.to_thread(self._open)
+        except sqlite3.Error as e:
+            logger.error(msg=f"Error opening {self.path}, file_ids kept in memory only: {e}")
+            self.connection = None
+            return
+        for mid, fileName, variant, fileId in rows:
+            self.videos[(mid, fileName, variant)] = fileId
+        logger.debug(msg=f"{len(self.videos)} video file_ids loaded")
+
+    async def close(self) -> None:
+        if self.connection:
+            await self._write()
+            async with self.writing:
+                await asyncio.to_thread(self.connection.close)
+            self.connection = None
+
+    async def _write(self, sql: str | None = None, *params: Any) -> None:
+        """
+        Runs `sql` together with the use times of the videos sent again since the last
+        write, so reading a file_id never waits for the disk.
+        """
+        if self.connection is None:
+            return
+        touched = [(used, *key) for key, used in self.touched.items()]
+        self.touched.clear()
+        def execute() -> None:
+            assert self.connection is not None
+            if touched:
+                self.connection.executemany(
+                    "UPDATE videos SET used = ? WHERE mid = ? AND filename = ? AND variant = ?",
+                    touched,
+                )
+            if sql is not None:
+                self.connection.execute(sql, params)
+            self.connection.commit()
+        try:
+            async with self.writing:
+                await asyncio.to_thread(execute)
+        except sqlite3.Error as e:
+            logger.error(msg=f"Error writing file_ids to {self.path}: {e}")
+
+    def getVideo(self, mid: str, fileName: str, variant: str = "") -> str | None:
+        key = (mid, fileName, variant)
+        fileId = self.videos.get(key)
+        if fileId is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.videos.move_to_end(key=key)
+        if self.connection is not None:
+            self.touched[key] = time.time()
+        return fileId
+
+    async def putVideo(self, mid: str, fileName: str, fileId: str, variant: str = "") -> None:
+        self.videos[(mid, fileName, variant)] = fileId
+        self.videos.move_to_end(key=(mid, fileName, variant))
+        await self._write(
+            "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?)",
+            mid, fileName, variant, fileId, time.time(),
+        )
+        while len(self.videos) > self.maxVideos:
+            (oldMid, oldName, oldVariant), _ = self.videos.popitem(last=False)
+            await self._write(
+                "DELETE FROM videos WHERE mid = ? AND filename = ? AND variant = ?",
+                oldMid, oldName, oldVariant,
+            )
+
+    async def forgetVideo(self, mid: str, fileName: str, variant: str | None = None) -> None:
+        """
+        Drops `variant` of a video, or all of them (the recording was deleted).
+        """
+        for key in [key for key in self.videos if key[:2] == (mid, fileName)]:
+            if variant is None or key[2] == variant:
+                del self.videos[key]
+        if variant is None:
+            await self._write("DELETE FROM videos WHERE mid = ? AND filename = ?", mid, fileName)
+        else:
+            await self._write(
+                "DELETE FROM videos WHERE mid = ? AND filename = ? AND variant = ?",
+                mid, fileName, variant,
+            )
+
+    def photoKey(self, content: bytes) -> str:
+        return hashlib.sha1(content).hexdigest()
+
+    def getPhoto(self, content: bytes) -> str | None:
+        key = self.photoKey(content=content)
+        fileId = self.photos.get(key)
+        if fileId is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.photos.move_to_end(key=key)
+        return fileId
+
+    def putPhoto(self, content: bytes, fileId: str) -> None:
+        key = self.photoKey(content=content)
+        self.photos[key] = fileId
+        self.photos.move_to_end(key=key)
+        while len(self.photos) > self.maxPhotos:
+            self.photos.popitem(last=False)
+
+    def forgetPhoto(self, content: bytes) -> None:
+        self.photos.pop(self.photoKey(content=content), None)
+
+
+if __name__ == "__main__":
+    raise SystemExit
@@ -1,8 +1,23 @@
 import logging
 import json  # for debug only, can be removed when all work fine...
 import httpx
+from tracing import span
 
 logger = logging.getLogger(name=__name__)
+# Shared pool for urls outside the Shinobi API (e.g. webhooks), see shinobiClient for Shinobi
+_client: httpx.AsyncClient | None = None
+
+def getClient() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=10))
+    return _client
+
+async def closeClient() -> None:
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
 
 async def queryUrl(
     url, method="get", data=None, debug=False, timeout=1
@@ -10,14 +25,18 @@ async def queryUrl(
     methods = ["get", "post", "put", "delete"]
     if method in methods:
         try:
-            response = httpx.request(method=method, url=url, data=data, timeout=timeout)
+            with span(name=f"url {method} {httpx.URL(url).host}"):
+                response = await getClient().request(
+                    method=method, url=url, data=data, timeout=timeout
+                )
             if response.status_code != 200:
                 logger.info(
                     msg=f"Error {response.status_code} something went wrong, request error."
                 )
             else:
                 logger.debug(msg="OK, request done.")
-                if debug:
+                # dumping the body is costly, skip it when nobody reads it
+                if debug and logger.isEnabledFor(level=logging.INFO):
                     logger.info(
                         msg=f"\nRequest method: {method}\nType of data: "
                         f"{type(data)}\nData: {json.dumps(obj=data, indent=4)}\nServer response:\n{response.text}"
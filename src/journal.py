@@ -0,0 +1,166 @@
+import logging
+import asyncio
+import pickle
+import sqlite3
+from pathlib import Path
+
+logger = logging.getLogger(name=__name__)
+
+class EventJournal:
+    """
+    A class representing an append-only journal of accepted events, kept in SQLite
+    (WAL mode) so events not yet delivered survive a restart.
+    Appends and deletions are grouped and written by a single task in one transaction
+    every `flushInterval` seconds.
+    """
+    def __init__(self, path: Path, flushInterval: float = 0.05) -> None:
+        self.path = path
+        self.flushInterval = flushInterval
+        self.connection: sqlite3.Connection | None = None
+        self.nextId: int = 1
+        # events waiting to be written, with the futures of who is waiting for them
+        self.toAppend: list[tuple[int, bytes, asyncio.Future]] = []
+        self.toDelete: list[int] = []
+        self.wakeUp = asyncio.Event()
+        self.writer: asyncio.Task | None = None
+        self.closing: bool = False
+        self.appended: int = 0
+        self.deleted: int = 0
+        self.batches: int = 0
+
+    def _open(self) -> list[tuple[int, bytes]]:
+        self.connection = sqlite3.connect(database=self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS events (id INTEGER PRIMARY KEY, event BLOB NOT NULL)"
+        )
+        self.connection.commit()
+        return self.connection.execute("SELECT id, event FROM events ORDER BY id").fetchall()
+
+    async def open(self) -> list[dict]:
+        """
+        Opens the journal and starts its writer.
+        Returns:
+            list[dict]: the events journaled and never delivered, oldest first.
+        """
+        rows = await asyncio.to_thread(self._open)
+        events = []
+        for journalId, blob in rows:
+            try:
+                event = pickle.loads(blob)
+            except Exception as e:
+                logger.error(msg=f"Discarding unreadable journal entry {journalId}: {e}")
+                self.toDelete.append(journalId)
+                continue
+            event["journalId"] = journalId
+            events.append(event)
+        if rows:
+            self.nextId = rows[-1][0] + 1
+        self.writer = asyncio.create_task(coro=self._writeLoop(), name="EventJournal")
+        if events:
+            logger.info(msg=f"Found {len(events)} undelivered events in journal")
+        return events
+
+    async def close(self) -> None:
+        self.closing = True
+        self.wakeUp.set()
+        if self.writer:
+            await asyncio.gather(self.writer, return_exceptions=True)
+            self.writer = None
+        if self.connection:
+            await asyncio.to_thread(self._close)
+            self.connection = None
+
+    async def append(self, event: dict) -> None:
+        """
+        Journals `event`, returning once it has been committed to disk.
+        Raises:
+            RuntimeError: if the journal is closed or closing.
+        """
+        if self.closing or self.writer is None:
+            raise RuntimeError("events journal closed")
+        journalId = self.nextId
+        self.nextId += 1
+        event["journalId"] = journalId
+        blob = pickle.dumps({key: value for key, value in event.items() if key != "queued"})
+        future = asyncio.get_running_loop().create_future()
+        self.toAppend.append((journalId, blob, future))
+        self.wakeUp.set()
+        await future
+
+    def remove(self, event: dict) -> None:
+        """
+        Forgets a delivered (or discarded) event.
+        """
+        journalId = event.pop("journalId", None)
+        if journalId is not None:
+            self.toDelete.append(journalId)
+            self.wakeUp.set()
+
+    def _write(self, rows: list[tuple[int, bytes]], ids: list[int]) -> None:
+        assert self.connection is not None
+        with self.connection:
+            if rows:
+                self.connection.executemany("INSERT INTO events (id, event) VALUES (?, ?)", rows)
+            if ids:
+                self.connection.executemany("DELETE FROM events WHERE id = ?", [(i,) for i in ids])
+
+    def _close(self) -> None:
+        assert self.connection is not None
+        # while running the WAL is checkpointed by SQLite every 1000 pages, sparing SD
+        # cards a checkpoint per batch, it is shrunk only once at the end
+        try:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            logger.error(msg=f"Error checkpointing events journal: {e}")
+        self.connection.close()
+
+    async def _flush(self) -> None:
+        if not self.connection or not (self.toAppend or self.toDelete):
+            return
+        appending, self.toAppend = self.toAppend, []
+        deleting, self.toDelete = self.toDelete, []
+        try:
+            await asyncio.to_thread(
+                self._write,
+                [(journalId, blob) for journalId, blob, _ in appending],
+                deleting,
+            )
+        except Exception as e:
+            logger.error(msg=f"Error writing events journal: {e}")
+            # delivered events must not be replayed, their deletion is tried again
+            self.toDelete[:0] = deleting
+            for _, _, future in appending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.appended += len(appending)
+        self.deleted += len(deleting)
+        for _, _, future in appending:
+            if not future.done():
+                future.set_result(None)
+
+    async def _writeLoop(self) -> None:
+        while True:
+            await self.wakeUp.wait()
+            self.wakeUp.clear()
+            if not self.closing:
+                # gives other events the time to join this batch
+                await asyncio.sleep(delay=self.flushInterval)
+            await self._flush()
+            if self.closing:
+                return
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "appended": self.appended,
+            "deleted": self.deleted,
+            "batches": self.batches,
+            "waiting": len(self.toAppend),
+        }
+
+
+if __name__ == "__main__":
+    raise SystemExit
@@ -0,0 +1,63 @@
+import logging
+from collections import OrderedDict
+from typing import Callable
+from telegram import InlineKeyboardMarkup
+from metrics import Gauge
+
+logger = logging.getLogger(name=__name__)
+HIT_RATIO = Gauge(
+    name="shinogramma_keyboards_cache_hit_ratio",
+    help="Share of menus sent with an already built keyboard",
+)
+
+class KeyboardCache:
+    """
+    A class representing inline keyboards built once and shared by all the users with
+    the same permissions, keyed by kind of menu, permission class and version of what
+    the menu lists (see MonitorRegistry.version).
+    Markups are immutable and their callback data are plain signed strings, so the
+    same object can be sent to any chat.
+    """
+    def __init__(self, maxSize: int = 256) -> None:
+        self.maxSize = maxSize
+        # (kind, permission class, version) -> markup, None when there is nothing to list
+        self._markups: OrderedDict[tuple[str, str, str], InlineKeyboardMarkup | None] = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        HIT_RATIO.function = lambda: self.hits / max(1, self.hits + self.misses)
+
+    def get(
+        self,
+        kind: str,
+        permissions: str,
+        version: str,
+        build: Callable[[], InlineKeyboardMarkup | None],
+    ) -> InlineKeyboardMarkup | None:
+        """
+        Returns the cached keyboard, calling `build` only when it is missing.
+        """
+        key = (kind, permissions, version)
+        if key in self._markups:
+            self._markups.move_to_end(key=key)
+            self.hits += 1
+            return self._markups[key]
+        self.misses += 1
+        # keyboards of an older version are never sent again
+        for old in [old for old in self._markups if old[:2] == key[:2]]:
+            del self._markups[old]
+        markup = build()
+        self._markups[key] = markup
+        while len(self._markups) > self.maxSize:
+            self._markups.popitem(last=False)
+        return markup
+
+    def clear(self) -> None:
+        """
+        Drops all keyboards, permission classes are numbered again when rebuilt.
+        """
+        self._markups.clear()
+        logger.debug(msg="Keyboards cache cleared")
+
+
+if __name__ == "__main__":
+    raise SystemExit
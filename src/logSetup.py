@@ -0,0 +1,196 @@
+import logging
+import atexit
+import json
+import queue
+import time
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+from typing import Any
+import colorlog
+
+logger = logging.getLogger(name=__name__)
+'''
+Log records are put on a queue by the thread that logs them (usually the event loop)
+and formatted and written to console and file by a listener thread, so logging never
+waits for the disk.
+'''
+FORMAT = "[%(levelname)-8s] %(asctime)s %(name)s %(message)s"
+DATEFMT = "%Y-%m-%d %H:%M:%S"
+_listener: QueueListener | None = None
+_queueHandler: QueueHandler | None = None
+_sampler: logging.Filter | None = None
+# loggers whose lines repeat with the traffic: flood control retries, substream checks
+# and webhooks skipped while failing, only these are sampled
+SAMPLED_LOGGERS: tuple[str, ...] = ("fanout", "substreamWatcher", "webhooks")
+
+class LogSetup:
+    """
+    A class representing the settings of the log file.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "FILE": {"data": "shinogramma.log", "typeOf": str, "required": False}, # empty to disable
+        "MAX_BYTES": {"data": 10485760, "typeOf": int, "required": False}, # 0 never rotates
+        "ROTATE_WHEN": {"data": "", "typeOf": str, "required": False}, # e.g. midnight, replaces MAX_BYTES
+        "BACKUP_COUNT": {"data": 5, "typeOf": int, "required": False},
+        "JSON": {"data": False, "typeOf": bool, "required": False},
+        "SAMPLE_BURST": {"data": 0, "typeOf": int, "required": False}, # 0 disables sampling
+        "SAMPLE_INTERVAL": {"data": 60, "typeOf": float, "required": False}, # in seconds
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    A class representing log records formatted as one JSON object per line.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record=record, datefmt=DATEFMT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(ei=record.exc_info)
+        return json.dumps(obj=entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    A class representing a rate limit on repetitive lines: each line of code may log
+    `burst` records every `interval` seconds, the following ones are counted and the
+    count is added to the next record let through. Warnings and errors are never
+    sampled.
+    """
+    def __init__(self, burst: int = 10, interval: float = 60) -> None:
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # (file, line) -> [window start, records in window, suppressed]
+        self.sites: dict[tuple[str, int], list[float]] = {}
+        self.suppressed: int = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        site = self.sites.get(key)
+        if site is None or now - site[0] >= self.interval:
+            if site is not None and site[2]:
+                record.msg = f"{record.msg} ({int(site[2])} similar lines suppressed)"
+            self.sites[key] = [now, 1, 0]
+            return True
+        if site[1] < self.burst:
+            site[1] += 1
+            return True
+        site[2] += 1
+        self.suppressed += 1
+        return False
+
+
+def _consoleHandler() -> logging.Handler:
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        fmt=colorlog.ColoredFormatter(
+            fmt="%(log_color)s[%(levelname)-8s] %(blue)s %(asctime)s %(name)s %(reset)s %(message)s",
+            datefmt=DATEFMT,
+            reset=True,
+            log_colors={
+                "TRACE": "bold_cyan",
+                "DEBUG": "cyan",
+                "INFO": "green",
+                "WARNING": "yellow",
+                "ERROR": "bold_red",
+                "CRITICAL": "bold_red,bg_white",
+            },
+        )
+    )
+    return handler
+
+
+def _fileHandler(
+    file: str, maxBytes: int, rotateWhen: str, backupCount: int, jsonFormat: bool
+) -> logging.Handler:
+    handler: logging.Handler
+    if rotateWhen:
+        handler = TimedRotatingFileHandler(
+            filename=file, when=rotateWhen, backupCount=backupCount, encoding="utf-8"
+        )
+    else:
+        handler = RotatingFileHandler(
+            filename=file, maxBytes=maxBytes, backupCount=backupCount, encoding="utf-8"
+        )
+    if jsonFormat:
+        handler.setFormatter(fmt=JsonFormatter())
+    else:
+        handler.setFormatter(fmt=logging.Formatter(fmt=FORMAT, datefmt=DATEFMT))
+    return handler
+
+
+def startLogging(
+    file: str = "shinogramma.log",
+    maxBytes: int = 10485760,
+    rotateWhen: str = "",
+    backupCount: int = 5,
+    jsonFormat: bool = False,
+    sampleBurst: int = 0,
+    sampleInterval: float = 60,
+) -> None:
+    """
+    Routes the records of all loggers through a queue to console and `file`, can be
+    called again to apply new settings. Lines of SAMPLED_LOGGERS are sampled when
+    `sampleBurst` is not 0.
+    """
+    global _listener, _queueHandler, _sampler
+    handlers = [_consoleHandler()]
+    if file:
+        try:
+            handlers.append(
+                _fileHandler(
+                    file=file,
+                    maxBytes=maxBytes,
+                    rotateWhen=rotateWhen,
+                    backupCount=backupCount,
+                    jsonFormat=jsonFormat,
+                )
+            )
+        except Exception as e:
+            logger.error(msg=f"Error opening log file {file}, logging to console only: {e}")
+    root = logging.getLogger()
+    stopLogging()
+    if _queueHandler is None:
+        _queueHandler = QueueHandler(queue=queue.SimpleQueue())
+        root.handlers = [_queueHandler]
+        atexit.register(stopLogging)
+    for name in SAMPLED_LOGGERS:
+        if _sampler is not None:
+            logging.getLogger(name=name).removeFilter(filter=_sampler)
+    _sampler = None
+    if sampleBurst > 0:
+        _sampler = SamplingFilter(burst=sampleBurst, interval=sampleInterval)
+        for name in SAMPLED_LOGGERS:
+            logging.getLogger(name=name).addFilter(filter=_sampler)
+    _listener = QueueListener(_queueHandler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stopLogging() -> None:
+    """
+    Writes the records still queued and closes console and file.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+if __name__ == "__main__":
+    raise SystemExit
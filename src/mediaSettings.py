@@ -0,0 +1,52 @@
+from typing import Any
+
+class UploadSettings:
+    """
+    A class representing the settings of the videos upload, kept apart from upload so
+    they are known even when uploads are disabled and upload is never imported.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "ENABLED": {"data": True, "typeOf": bool, "required": False},
+        "UPLOADS": {"data": 2, "typeOf": int, "required": False},
+        "MAX_BYTES": {"data": 52428800, "typeOf": int, "required": False}, # Telegram limit
+        "CHUNK_SIZE": {"data": 262144, "typeOf": int, "required": False}, # in bytes
+        "TIMEOUT": {"data": 120, "typeOf": float, "required": False}, # in seconds
+    }
+
+
+class TranscodeSettings:
+    """
+    A class representing the settings of the video previews, kept apart from transcode
+    so they are known even when previews are disabled and transcode is never imported.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "ENABLED": {"data": False, "typeOf": bool, "required": False},
+        "FFMPEG": {"data": "ffmpeg", "typeOf": str, "required": False},
+        "WORKERS": {"data": 1, "typeOf": int, "required": False},
+        "DIRECTORY": {"data": ".previews", "typeOf": str, "required": False},
+        "CACHE_BYTES": {"data": 1073741824, "typeOf": int, "required": False},
+        "TARGET_BYTES": {"data": 45000000, "typeOf": int, "required": False},
+        "MAX_HEIGHT": {"data": 480, "typeOf": int, "required": False},
+        "MAX_BITRATE": {"data": 1500, "typeOf": int, "required": False}, # in kbit/s
+        "MAX_SECONDS": {"data": 120, "typeOf": int, "required": False}, # 0 keeps the whole video
+        "TIMEOUT": {"data": 600, "typeOf": float, "required": False}, # in seconds
+    }
+
+
+class FileIdsSettings:
+    """
+    A class representing the settings of the Telegram file_ids cache, kept apart from
+    fileIdCache so they are known before the cache, and SQLite with it, is imported.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "FILE": {"data": ".file_ids.db", "typeOf": str, "required": False}, # empty keeps them in memory
+        "MAX_VIDEOS": {"data": 10000, "typeOf": int, "required": False},
+        "MAX_PHOTOS": {"data": 256, "typeOf": int, "required": False},
+    }
+
+
+if __name__ == "__main__":
+    raise SystemExit
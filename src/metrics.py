@@ -0,0 +1,208 @@
+import logging
+import asyncio
+import bisect
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable
+from telegram.request import HTTPXRequest
+from tracing import span
+
+logger = logging.getLogger(name=__name__)
+'''
+Minimal Prometheus instrumentation, rendered in the text exposition format by the
+/metrics endpoint of the webhook server.
+Children of labelled metrics are created once and should be kept by the caller, so
+observing a value costs a bisect and two additions.
+'''
+_metrics: list["Metric"] = []
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape(value: str) -> str:
+    """Label values as the text format wants them: backslash, quote and newline escaped"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric(ABC):
+    """
+    A class representing a named metric, with a child for each combination of labels.
+    When `function` is given its value is read when metrics are rendered.
+    """
+    TYPE = "untyped"
+    def __init__(
+        self, name: str, help: str, labelNames: tuple[str, ...] = (),
+        function: Callable[[], float] | None = None,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.function = function
+        self.children: dict[tuple[str, ...], Any] = {}
+        if not labelNames:
+            self.child = self.labels()
+        _metrics.append(self)
+
+    @abstractmethod
+    def _newChild(self) -> Any:
+        """The value (or values) kept for a combination of labels."""
+
+    def labels(self, *values: str) -> Any:
+        child = self.children.get(values)
+        if child is None:
+            child = self._newChild()
+            self.children[values] = child
+        return child
+
+    def _labelText(self, values: tuple[str, ...], extra: str = "") -> str:
+        pairs = [
+            f'{name}="{_escape(value=str(object=value))}"'
+            for name, value in zip(self.labelNames, values)
+        ]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        if self.function is not None:
+            try:
+                lines.append(f"{self.name} {float(self.function())}")
+            except Exception as e:
+                logger.debug(msg=f"Error reading metric {self.name}: {e}")
+            return lines
+        for values, child in self.children.items():
+            lines.extend(self._renderChild(values=values, child=child))
+        return lines
+
+    def _renderChild(self, values: tuple[str, ...], child: Any) -> list[str]:
+        return [f"{self.name}{self._labelText(values=values)} {child.value}"]
+
+
+class _Value:
+    __slots__ = ("value",)
+    def __init__(self) -> None:
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    TYPE = "counter"
+    def _newChild(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1) -> None:
+        self.child.value += amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+    def _newChild(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.child.value = value
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum: float = 0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+    def __init__(
+        self, name: str, help: str, labelNames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name=name, help=help, labelNames=labelNames)
+
+    def _newChild(self) -> _Buckets:
+        return _Buckets(bounds=self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.child.observe(value)
+
+    def _renderChild(self, values: tuple[str, ...], child: _Buckets) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+            cumulative += count
+            bucket = f'le="{bound}"'
+            lines.append(
+                f"{self.name}_bucket{self._labelText(values=values, extra=bucket)} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{self._labelText(values=values)} {child.sum}")
+        lines.append(f"{self.name}_count{self._labelText(values=values)} {child.count}")
+        return lines
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+TELEGRAM_LATENCY = Histogram(
+    name="shinogramma_telegram_request_seconds",
+    help="Duration of Telegram Bot API calls by method",
+    labelNames=("method",),
+)
+TELEGRAM_ERRORS = Counter(
+    name="shinogramma_telegram_request_errors_total",
+    help="Telegram Bot API calls that raised an error by method",
+    labelNames=("method",),
+)
+LOOP_LAG = Histogram(
+    name="shinogramma_event_loop_lag_seconds",
+    help="How late the event loop wakes up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+
+class TimedRequest(HTTPXRequest):
+    """
+    A class representing the HTTP requests of the bot, timed by Bot API method.
+    """
+    async def do_request(self, url: str, method: str, *args: Any, **kwargs: Any) -> tuple[int, bytes]:
+        apiMethod = url.rpartition("/")[2]
+        started = time.monotonic()
+        try:
+            with span(name=f"telegram {apiMethod}"):
+                return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.labels(apiMethod).inc()
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels(apiMethod).observe(time.monotonic() - started)
+
+
+async def measureLoopLag(interval: float = 0.5) -> None:
+    """
+    Measures forever how late sleeps end, it is intended to be used as a task with
+    asyncio.create_task()
+    """
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(delay=interval)
+        LOOP_LAG.observe(max(0, time.monotonic() - started - interval))
+
+
+if __name__ == "__main__":
+    raise SystemExit
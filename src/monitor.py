@@ -1,7 +1,11 @@
 import logging
-from httpQueryUrl import queryUrl
+import copy
+from shinobiClient import ShinobiClient
+from monitorRegistry import MonitorRegistry
+from video import VideoCache
+from snapshot import SnapshotService
+from callbackData import pack
 import inspect
-import time
 from datetime import datetime
 import humanize
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, error
@@ -19,20 +23,24 @@ class Monitor:
         "PROXY_PAGE_TIMEOUT": {"data": 6000, "typeOf": int, "required": False}, # in milliseconds
     }
     def __init__(
-        self, update, context, chatId, baseUrl, port, apiKey, groupKey, mid,
-        name, proxyPageUrl, proxyPageTimeout) -> None:
+        self, update, context, chatId, client: ShinobiClient,
+        registry: MonitorRegistry, videos: VideoCache, snapshots: SnapshotService,
+        mid, name, proxyPageUrl, proxyPageTimeout) -> None:
         self.UPDATE = update
         self.CONTEXT = context
         self.CHAT_ID = chatId
-        self.BASEURL = baseUrl
-        self.PORT = port
-        self.API_KEY = apiKey
-        self.GROUP_KEY = groupKey
+        self.CLIENT = client
+        self.REGISTRY = registry
+        self.VIDEOS = videos
+        self.SNAPSHOTS = snapshots
+        self.BASEURL = client.BASEURL
+        self.PORT = client.PORT
+        self.API_KEY = client.API_KEY
+        self.GROUP_KEY = client.GROUP_KEY
         self.MID = mid
         self.name = name
         self.proxyPageUrl = proxyPageUrl
         self.proxyPageTimeout = proxyPageTimeout
-        self.url = f"{self.BASEURL}:{self.PORT}/{self.API_KEY}/monitor/{self.GROUP_KEY}/{self.MID}"
         self.query = update.callback_query
         self.TYPES = {
             "hls": "/s.m3u8",
@@ -44,43 +52,47 @@ class Monitor:
     async def getSnapshot(self) -> bool:
         HERE = inspect.currentframe()
         assert HERE is not None
-        data = await queryUrl(url=self.url)
-        if data:
-            dataInJson = data.json()
-            try:
-                if dataInJson[0]["details"]["snap"] == "1":
-                    await self.query.answer("Cooking your snapshot...\U0001F373")
-                    baseurl = f"{self.BASEURL}:{self.PORT}/{self.API_KEY}/jpeg/{self.GROUP_KEY}/{self.MID}/s.jpg"
-                    avoidCacheUrl = str(object=int(time.time()))
-                    snapshotUrl = baseurl + "?" + avoidCacheUrl
-                    if await self.CONTEXT.bot.send_photo(
-                        chat_id=self.CHAT_ID, photo=snapshotUrl
-                    ):
-                        logger.debug(msg="Ok, snaphot sended...")
-                        return True
-                else:
-                    logger.info(msg="Jpeg API not active on this monitor")
-                    await self.query.answer(
-                        text="Jpeg API not active on this monitor \u26A0\ufe0f",
-                        show_alert=True,
-                    )
-            except Exception as e:
-                if isinstance(e, error.TelegramError):
-                    logger.error(msg=f"PTB error in {HERE.f_code.co_name}:\n {e}")
-                else:
-                    logger.error(msg=f"Error in {HERE.f_code.co_name}:\n {e}")
-        else:
-            logger.error(msg="Error something went wrong requesting snapshot")
+        try:
+            if await self.SNAPSHOTS.isDisabled(mid=self.MID):
+                logger.info(msg="Jpeg API not active on this monitor")
+                await self.query.answer(
+                    text="Jpeg API not active on this monitor \u26A0\ufe0f",
+                    show_alert=True,
+                )
+            else:
+                await self.query.answer("Cooking your snapshot...\U0001F373")
+                snapshot = await self.SNAPSHOTS.get(mid=self.MID)
+                if snapshot and await self.sendSnapshot(snapshot=snapshot):
+                    logger.debug(msg="Ok, snaphot sended...")
+                    return True
+                logger.error(msg="Error something went wrong requesting snapshot")
+        except Exception as e:
+            if isinstance(e, error.TelegramError):
+                logger.error(msg=f"PTB error in {HERE.f_code.co_name}:\n {e}")
+            else:
+                logger.error(msg=f"Error in {HERE.f_code.co_name}:\n {e}")
         return False
 
+    async def sendSnapshot(self, snapshot: bytes) -> bool:
+        photo = self.SNAPSHOTS.photo(content=snapshot)
+        try:
+            message = await self.CONTEXT.bot.send_photo(chat_id=self.CHAT_ID, photo=photo)
+        except error.BadRequest:
+            if photo is snapshot:
+                raise
+            # the file_id is no longer valid, the bytes are sent again
+            self.SNAPSHOTS.forgetPhoto(content=snapshot)
+            message = await self.CONTEXT.bot.send_photo(chat_id=self.CHAT_ID, photo=snapshot)
+        self.SNAPSHOTS.remember(content=snapshot, sent=message)
+        return bool(message)
+
     async def getStream(self) -> bool:
         HERE = inspect.currentframe()
         assert HERE is not None
         tag = HERE.f_code.co_name  # type: ignore
-        data = await queryUrl(url=self.url, debug=False)
+        data = await self.REGISTRY.get(mid=self.MID)
         if data:
-            dataInJson = data.json()
-            streams = dataInJson[0]["streams"]
+            streams = list(data["streams"])
             if not streams:
                 logger.info(msg="No streams found for this monitor...")
                 await self.CONTEXT.bot.send_message(
@@ -88,7 +100,7 @@ class Monitor:
                     text="No streams found for this monitor...\u26A0\ufe0f"
                 )
                 return False
-            streamType = dataInJson[0]["details"]["stream_type"]
+            streamType = data["details"]["stream_type"]
             subStream = SubStream(monitor=self)
             await subStream.verifySubStream(data=data)
             if streamType == "useSubstream":
@@ -110,10 +122,7 @@ class Monitor:
                                 [
                                     InlineKeyboardButton(
                                         text=f"{len(buttons)+1} ACTIVATE {self.name} substream",
-                                        callback_data={
-                                            "tag": tag,
-                                            "subStream": subStream,
-                                        },
+                                        callback_data=pack(tag=tag, mid=self.MID),
                                     )
                                 ]
                             )
@@ -138,10 +147,7 @@ class Monitor:
                                 [
                                     InlineKeyboardButton(
                                         text=f"{len(buttons)+1} ACTIVATE {self.name} substream",
-                                        callback_data={
-                                            "tag": tag,
-                                            "subStream": subStream,
-                                        },
+                                        callback_data=pack(tag=tag, mid=self.MID),
                                     )
                                 ]
                             )
@@ -171,48 +177,44 @@ class Monitor:
             return False
         return True
 
-    async def getVideo(self, index=None) -> bool:
+    async def getVideo(self) -> bool:
         HERE = inspect.currentframe()
         assert HERE is not None
         tag = HERE.f_code.co_name  # type: ignore
-        url = f"{self.BASEURL}:{self.PORT}/{self.API_KEY}/videos/{self.GROUP_KEY}/{self.MID}"
-        videoList = await queryUrl(url=url)
-        if videoList:
-            videoListInJson = videoList.json().get("videos")
+        window = await self.VIDEOS.newest(mid=self.MID)
+        if window:
+            videoListInJson = window.videos[: self.VIDEOS.pageSize]
             if len(videoListInJson) > 0:
-                if index == None:
-                    buttons: list = []
-                    for index, video in enumerate(iterable=(videoListInJson)):
-                        start_time = datetime.fromisoformat(video.get("time"))
-                        start = humanize.naturaltime(value=start_time)
-                        if video["objects"]:
-                            objects = video["objects"]
-                            videoText = f"{start} -> {objects}"
-                        else:
-                            videoText = f"{start}"
-                        if video["status"] == 1:
-                            videoText = videoText.upper()
-                        buttons.insert(
-                            0,
-                            [
-                                InlineKeyboardButton(
-                                    text=videoText,
-                                    callback_data={
-                                        "tag": tag,
-                                        "choice": index,
-                                        "mid": self.MID,
-                                    },
-                                )
-                            ],
-                        )
-                    reply_markup = InlineKeyboardMarkup(inline_keyboard=buttons[-20:])
-                    await self.CONTEXT.bot.send_message(
-                        chat_id=self.CHAT_ID,
-                        text="Select one video from this limited (20) list <b>(in uppercase are new)</b>.",
-                        reply_markup=reply_markup,
-                        parse_mode="HTML",
+                buttons: list = []
+                for video in videoListInJson:
+                    start_time = datetime.fromisoformat(video.get("time"))
+                    start = humanize.naturaltime(value=start_time)
+                    if video["objects"]:
+                        objects = video["objects"]
+                        videoText = f"{start} -> {objects}"
+                    else:
+                        videoText = f"{start}"
+                    if video["status"] == 1:
+                        videoText = videoText.upper()
+                    buttons.insert(
+                        0,
+                        [
+                            InlineKeyboardButton(
+                                text=videoText,
+                                callback_data=pack(
+                                    tag=tag, mid=self.MID, cursor=video["filename"]
+                                ),
+                            )
+                        ],
                     )
-                    return True
+                reply_markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+                await self.CONTEXT.bot.send_message(
+                    chat_id=self.CHAT_ID,
+                    text=f"Select one video from this limited ({len(buttons)}) list <b>(in uppercase are new)</b>.",
+                    reply_markup=reply_markup,
+                    parse_mode="HTML",
+                )
+                return True
             else:
                 logger.info(msg="No videos found for this monitor...\u26A0\ufe0f")
                 await self.query.answer(
@@ -221,9 +223,9 @@ class Monitor:
         return False
 
     async def getMap(self):
-        data = await queryUrl(url=self.url)
+        data = await self.REGISTRY.get(mid=self.MID)
         if data:
-            dataInJson = (data.json()[0]["details"]).get("geolocation").split(",")
+            dataInJson = (data["details"]).get("geolocation").split(",")
             latitude = dataInJson[0]
             longitude = dataInJson[1]
             if latitude == "49.2578298" and longitude == "-123.2634732":
@@ -239,36 +241,25 @@ class Monitor:
             return False
 
     async def configure(self, key, value) -> bool:
-        data = await queryUrl(url=self.url)
-        if data:
-            dataInJson = data.json()[0]
+        dataInJson = copy.deepcopy(x=await self.REGISTRY.get(mid=self.MID))
+        if dataInJson:
             details = dataInJson["details"]
             if key in details.keys():
                 details[key] = value
                 dataInJson["details"] = details
-                endpoint = f"{self.BASEURL}:{self.PORT}/{self.API_KEY}/configureMonitor/{self.GROUP_KEY}/{self.MID}?data="
-                method = "put"
-                debug = True
-                response = await queryUrl(
-                    url=endpoint,
-                    method=method,
-                    data=dataInJson,
-                    debug=debug,
-                )
-                if response:
-                    if response.json()["ok"]:
-                        logger.debug(msg=f"{self.MID}->{key} now configured with: {value}")
-                        await self.query.answer("Video set as read.\U0001F373")
-                        return True
-                    else:
-                        logger.error(
-                            msg=f"Error something went wrong configuring {self.MID} monitor"
-                        )
-                        await self.query.answer(
-                            f"Error something went wrong configuring {self.MID} monitor... \u26A0\ufe0f"
-                        )
+                if await self.CLIENT.configureMonitor(mid=self.MID, monitorData=dataInJson):
+                    self.REGISTRY.invalidate(mid=self.MID)
+                    self.SNAPSHOTS.forget(mid=self.MID)
+                    logger.debug(msg=f"{self.MID}->{key} now configured with: {value}")
+                    await self.query.answer("Video set as read.\U0001F373")
+                    return True
                 else:
-                    logger.error(msg="Error something went wrong requesting configuration")
+                    logger.error(
+                        msg=f"Error something went wrong configuring {self.MID} monitor"
+                    )
+                    await self.query.answer(
+                        f"Error something went wrong configuring {self.MID} monitor... \u26A0\ufe0f"
+                    )
             else:
                 logger.error(msg="unknown parameter")
                 await self.CONTEXT.bot.send_message(
@@ -289,20 +280,20 @@ class SubStream:
     ) -> None:
         self.monitor: Monitor = monitor
         self.SUBSTREAM_CHANNEL = 1
-        self.toggleUrl:str = f"{self.monitor.BASEURL}:{self.monitor.PORT}/{self.monitor.API_KEY}/toggleSubstream/{self.monitor.GROUP_KEY}/{self.monitor.MID}"
         self.kindOfStream: str | None = None
         self.endOfUrl: str | None = None
         self.completeUrl: str | None = None
 
-    async def verifySubStream(self, data = None) -> bool:
+    async def verifySubStream(self, data: dict | None = None) -> bool:
         if not data:
             logger.debug(msg="Requesting monitor data...")
-            data = await queryUrl(url=self.monitor.url, debug=False)
+            # subStreamActive changes on its own, so always ask Shinobi
+            data = await self.monitor.REGISTRY.get(mid=self.monitor.MID, refresh=True)
         else:
             logger.debug(msg="Using provided data...")
         if data:
-            dataInJson = data.json()
-            self.kindOfStream = dataInJson[0]["details"]["substream"]["output"][
+            dataInJson = data
+            self.kindOfStream = dataInJson["details"]["substream"]["output"][
                 "stream_type"
             ]
             if self.kindOfStream and self.kindOfStream in self.monitor.TYPES.keys():
@@ -310,7 +301,7 @@ class SubStream:
                 self.completeUrl = f"{self.monitor.BASEURL}:{self.monitor.PORT}{self.endOfUrl}"
                 if self.completeUrl.endswith(self.monitor.TYPES["hls"]) and self.monitor.proxyPageUrl:
                     self.completeUrl = f"{self.monitor.proxyPageUrl}?timeout={self.monitor.proxyPageTimeout}&url={self.completeUrl}"
-                if dataInJson[0]["subStreamActive"]:
+                if dataInJson["subStreamActive"]:
                     logger.debug(msg=f"Substream active.")
                     return True
                 else:
@@ -322,13 +313,4 @@ class SubStream:
         return False
 
     async def activateSubStream(self) -> bool:
-        activated = await queryUrl(
-            url=self.toggleUrl,
-        )
-        if (
-            activated
-            and "ok" in activated.json().keys()
-            and activated.json()["ok"]
-        ):
-            return True
-        return False
+        return await self.monitor.CLIENT.toggleSubstream(mid=self.monitor.MID)
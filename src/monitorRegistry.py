@@ -0,0 +1,209 @@
+import logging
+import asyncio
+import time
+import hashlib
+import json
+from typing import Any, Awaitable, Callable
+from shinobiClient import ShinobiClient
+from metrics import Gauge
+
+logger = logging.getLogger(name=__name__)
+HIT_RATIO = Gauge(
+    name="shinogramma_monitors_cache_hit_ratio",
+    help="Share of monitors lookups answered without asking Shinobi",
+)
+
+def _digest(items: list) -> str:
+    return hashlib.sha1(json.dumps(obj=items, default=str).encode()).hexdigest()[:16]
+
+
+class MonitorRegistry:
+    """
+    A class representing an in-process cache of Shinobi monitors metadata and states,
+    keyed by group key and monitor id.
+    Returned dicts are shared between callers and must be treated as read only.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "MONITORS_TTL": {"data": 30, "typeOf": float, "required": False}, # in seconds
+    }
+    def __init__(self, client: ShinobiClient, ttl: float = 30) -> None:
+        self.CLIENT = client
+        self.ttl = ttl
+        # (group key, mid) -> (fetch time, monitor data)
+        self._monitors: dict[tuple[str, str], tuple[float, dict]] = {}
+        # group key -> (fetch time, ordered list of mids)
+        self._lists: dict[str, tuple[float, list[str]]] = {}
+        # group key -> (fetch time, states)
+        self._states: dict[str, tuple[float, list[dict]]] = {}
+        # (group key, "monitors" or "states") -> hash of what menus show of them
+        self._versions: dict[tuple[str, str], str] = {}
+        self._inflight: dict[tuple[str, str | None], asyncio.Task] = {}
+        # bumped by invalidate, fetches started before it do not store what they get
+        self._generation: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        HIT_RATIO.function = lambda: self.hits / max(1, self.hits + self.misses)
+
+    def _isFresh(self, fetchTime: float) -> bool:
+        return time.monotonic() - fetchTime < self.ttl
+
+    def _start(
+        self, key: tuple[str, str | None], fetch: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(coro=fetch())  # type: ignore
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._done(key=key, task=done))
+        return task
+
+    def _done(self, key: tuple[str, str | None], task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # background refreshes have no one awaiting them
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(msg=f"Error refreshing monitors cache: {task.exception()}")
+
+    async def _singleFlight(
+        self, key: tuple[str, str | None], fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Concurrent requests for the same key share a single call to Shinobi.
+        """
+        return await asyncio.shield(self._start(key=key, fetch=fetch))
+
+    def _setVersion(self, kind: str, items: list) -> None:
+        key = (self.CLIENT.GROUP_KEY, kind)
+        version = _digest(items=items)
+        if self._versions.get(key) != version:
+            logger.debug(msg=f"{kind.capitalize()} list changed, version {version}")
+            self._versions[key] = version
+
+    def version(self, kind: str) -> str | None:
+        """
+        A hash of the "monitors" (ids and names) or "states" (names) last fetched,
+        it changes only when the menus listing them must change.
+        """
+        return self._versions.get((self.CLIENT.GROUP_KEY, kind))
+
+    def _store(self, monitor: dict) -> None:
+        mid = monitor.get("mid")
+        if mid:
+            self._monitors[(self.CLIENT.GROUP_KEY, mid)] = (time.monotonic(), monitor)
+
+    async def _fetchAll(self) -> list[dict] | None:
+        generation = self._generation
+        monitors = await self.CLIENT.getMonitors()
+        if monitors is not None and generation == self._generation:
+            for monitor in monitors:
+                self._store(monitor=monitor)
+            self._lists[self.CLIENT.GROUP_KEY] = (
+                time.monotonic(),
+                [monitor["mid"] for monitor in monitors if "mid" in monitor],
+            )
+            self._setVersion(
+                kind="monitors",
+                items=[[monitor.get("mid"), monitor.get("name")] for monitor in monitors],
+            )
+        return monitors
+
+    async def _fetchStates(self) -> list[dict] | None:
+        states = await self.CLIENT.getStates()
+        if states is not None:
+            self._states[self.CLIENT.GROUP_KEY] = (time.monotonic(), states)
+            self._setVersion(kind="states", items=[state.get("name") for state in states])
+        return states
+
+    async def _fetchOne(self, mid: str) -> dict | None:
+        generation = self._generation
+        monitor = await self.CLIENT.getMonitor(mid=mid)
+        if monitor is not None and generation == self._generation:
+            self._store(monitor=monitor)
+        return monitor
+
+    async def warm(self) -> bool:
+        logger.debug(msg="Warming monitors cache...")
+        monitors = await self.getAll(refresh=True)
+        if monitors is None:
+            logger.warning(msg="Unable to warm monitors cache, continuing...")
+            return False
+        logger.debug(msg=f"Monitors cache warmed with {len(monitors)} monitors")
+        if await self.getStates(refresh=True) is None:
+            logger.warning(msg="Unable to warm states cache, continuing...")
+        return True
+
+    async def getAll(self, refresh: bool = False, stale: bool = False) -> list[dict] | None:
+        """
+        Returns all monitors of the group, from cache when fresh.
+        With `stale` an expired list is returned at once and refreshed in background.
+        """
+        group = self.CLIENT.GROUP_KEY
+        cached = self._lists.get(group)
+        if not refresh and cached and (stale or self._isFresh(fetchTime=cached[0])):
+            monitors = []
+            for mid in cached[1]:
+                entry = self._monitors.get((group, mid))
+                if entry is None:
+                    break
+                monitors.append(entry[1])
+            else:
+                self.hits += 1
+                if not self._isFresh(fetchTime=cached[0]):
+                    self._start(key=(group, None), fetch=self._fetchAll)
+                return monitors
+        self.misses += 1
+        return await self._singleFlight(key=(group, None), fetch=self._fetchAll)
+
+    async def getStates(self, refresh: bool = False, stale: bool = False) -> list[dict] | None:
+        """
+        Returns the states (presets) of the group, from cache when fresh.
+        With `stale` expired states are returned at once and refreshed in background.
+        """
+        group = self.CLIENT.GROUP_KEY
+        cached = self._states.get(group)
+        if not refresh and cached and (stale or self._isFresh(fetchTime=cached[0])):
+            self.hits += 1
+            if not self._isFresh(fetchTime=cached[0]):
+                # mids never contain "#"
+                self._start(key=(group, "#states"), fetch=self._fetchStates)
+            return cached[1]
+        self.misses += 1
+        return await self._singleFlight(key=(group, "#states"), fetch=self._fetchStates)
+
+    async def get(self, mid: str, refresh: bool = False) -> dict | None:
+        """
+        Returns a single monitor, from cache when fresh.
+        """
+        key = (self.CLIENT.GROUP_KEY, mid)
+        entry = self._monitors.get(key)
+        if not refresh and entry and self._isFresh(fetchTime=entry[0]):
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return await self._singleFlight(key=key, fetch=lambda: self._fetchOne(mid=mid))
+
+    def invalidate(self, mid: str | None = None) -> None:
+        """
+        Drops a single monitor, or the whole group when `mid` is None.
+        Fetches still running keep answering who is waiting for them but are not
+        cached, the next request asks Shinobi again.
+        """
+        group = self.CLIENT.GROUP_KEY
+        self._generation += 1
+        if mid is None:
+            for key in [key for key in self._monitors if key[0] == group]:
+                del self._monitors[key]
+            for key in [key for key in self._inflight if key[0] == group and key[1] != "#states"]:
+                del self._inflight[key]
+            logger.debug(msg=f"Monitors cache invalidated for group {group}")
+        else:
+            self._monitors.pop((group, mid), None)
+            self._inflight.pop((group, mid), None)
+            self._inflight.pop((group, None), None)
+            logger.debug(msg=f"Monitors cache invalidated for {mid}")
+        self._lists.pop(group, None)
+
+
+if __name__ == "__main__":
+    raise SystemExit
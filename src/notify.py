@@ -1,70 +1,155 @@
-from settings import Url, AddressKList
+from settings import AddressKList
+from notifySettings import NotifySettings
 from telegram.ext import Application
-from telegram import InputMediaPhoto
+from telegram import InputMediaPhoto, Message
+from telegram.error import BadRequest
 import logging
-from httpQueryUrl import queryUrl
-import hashlib
+from webhooks import WebhookDispatcher
+from shinobiClient import ShinobiClient
+from monitorRegistry import MonitorRegistry
+from rateLimit import EventLimiter
+from fanout import FanOut
+from snapshot import SnapshotService
+from eventQueue import EventQueue
+from journal import EventJournal
+from metrics import Counter, Gauge, Histogram, render
+from pathlib import Path
 import json
-from quart import Quart, request, Response, abort, render_template_string
+from quart import Quart, request, Response, abort
+from werkzeug.exceptions import HTTPException
 from urllib.parse import unquote
-from typing import Any
+from typing import Any, Awaitable, Callable
 import time
 import asyncio
 import socket
 
 logger = logging.getLogger(name=__name__)
-'''
-When jpeg api is not enabled for a specific monitor, shinobi sends an image as
-placeholder, below a constant with the value of its hash
-'''
-PLACEHOLDERMD5 = "2a7127c16b2389474c41bc112618462f"
-localTime: float | None = None
+NOTIFY_LATENCY = Histogram(
+    name="shinogramma_notification_seconds",
+    help="Time from an event received to its notification delivered",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+QUEUE_DEPTH = Gauge(name="shinogramma_events_queue_depth", help="Events waiting to be notified")
+EVENTS_REJECTED = Counter(
+    name="shinogramma_events_rejected_total", help="Events refused because the queue was full"
+)
+EVENTS_DROPPED_OLDEST = Counter(
+    name="shinogramma_events_dropped_oldest_total",
+    help="Waiting events discarded to make room for new ones",
+)
+EVENTS_RATE_LIMITED = Counter(
+    name="shinogramma_events_rate_limited_total",
+    help="Events over the rate limit discarded",
+)
+EVENTS_COALESCED = Counter(
+    name="shinogramma_events_coalesced_total",
+    help="Events over the rate limit merged in a digest",
+)
 
 class WebhookServer():
     """
     A class representing a web server.
     """
-    # Required settings for this class, you can use "INCLUDE" in settings module
-    SETTINGS: dict[str, object | dict[str, Any]] = {
-        "SERVER": {"data": False, "typeOf": bool, "required": False},
-        "PORT": {"data": 5001, "typeOf": int, "required": False},
-        "WEBHOOKS": {"data": None, "typeOf": AddressKList, "required": False},
-        "REQUESTS_RATE_LIMIT": {"data": 10, "typeOf": float, "required": False},
-    }
+    # settings live in a light module so they can be read without importing Quart
+    SETTINGS = NotifySettings.SETTINGS
+    # seconds queued events are given to be notified at shutdown, the journal keeps the others
+    DRAIN_TIMEOUT: float = 10
     def __init__(
         self,
-        baseUrl: Url,
-        shinobiPort: int,
-        shinobiApiKey: str,
-        groupKey: str,
+        client: ShinobiClient,
+        registry: MonitorRegistry,
+        snapshots: SnapshotService,
         webhooks: AddressKList | None,
         port: int,
         requestsRateLimit: float,
         toNotify: list,
-        application
+        application,
+        rateLimitBurst: int = 1,
+        rateLimitByTag: bool = False,
+        coalesceEvents: bool = True,
+        telegramGlobalRate: float = 30,
+        telegramChatInterval: float = 1,
+        sendRetries: int = 3,
+        queueSize: int = 100,
+        workers: int = 2,
+        overflowPolicy: str = "drop_oldest",
+        journal: str | None = ".journal",
+        journalFlushInterval: float = 0.05,
+        webhooksTimeout: float = 2,
+        webhooksRetries: int = 2,
+        webhooksCooldown: float = 60,
+        notifier: bool = True,
     ) -> None:
         self.app: Quart = Quart(import_name=__name__)
-        self.baseUrl = baseUrl
-        self.shinobiPort = shinobiPort
-        self.shinobiApiKey = shinobiApiKey
-        self.groupKey = groupKey
-        self.webhooks = webhooks
+        self.CLIENT = client
+        self.REGISTRY = registry
+        self.SNAPSHOTS = snapshots
+        self.webhooks = WebhookDispatcher(
+            webhooks=webhooks,
+            timeout=webhooksTimeout,
+            retries=webhooksRetries,
+            cooldown=webhooksCooldown,
+        )
         self.port = port
         self.requestsRateLimit = requestsRateLimit
+        self.limiter = EventLimiter(
+            interval=requestsRateLimit,
+            burst=rateLimitBurst,
+            byTag=rateLimitByTag,
+            coalesce=coalesceEvents,
+        )
+        self.fanout = FanOut(
+            globalRate=telegramGlobalRate,
+            chatInterval=telegramChatInterval,
+            retries=sendRetries,
+        )
+        self.events = EventQueue(
+            handler=self.processEvent,
+            size=queueSize,
+            workers=workers,
+            policy=overflowPolicy,
+            onDrop=self.discardEvent,
+        )
+        self.journal: EventJournal | None = None
+        if journal:
+            self.journal = EventJournal(path=Path(journal), flushInterval=journalFlushInterval)
         self.APPLICATION: Application = application
-        self.snapshotUrl = "".join([baseUrl.url, ":", str(object=self.shinobiPort), "/", shinobiApiKey, "/jpeg/", groupKey])
         self.toNotify = toNotify
+        # with notifier disabled the server only exposes metrics
+        self.notifierEnabled = notifier
+        self.stopping = asyncio.Event()
+        self.serverTask: asyncio.Task[None] | None = None
+        # tasks started in the background, referenced until done
+        self.background: set[asyncio.Task] = set()
+        QUEUE_DEPTH.function = self.events.queue.qsize
+        EVENTS_REJECTED.function = lambda: self.events.rejected
+        EVENTS_DROPPED_OLDEST.function = lambda: self.events.droppedOldest
+        EVENTS_RATE_LIMITED.function = lambda: self.limiter.dropped
+        EVENTS_COALESCED.function = lambda: self.limiter.coalesced
+        if notifier:
+            self.app.add_url_rule(
+                rule="/notifier/",
+                endpoint="notifier",
+                view_func=self.notifier,
+                methods=["POST", "GET"],
+            )
+            self.app.add_url_rule(
+                rule="/stats/",
+                endpoint="stats",
+                view_func=self.stats,
+                methods=["GET"],
+            )
+            self.app.add_url_rule(
+                rule="/test/",
+                endpoint="test",
+                view_func=self.test,
+                methods=["POST", "GET"],
+            )
         self.app.add_url_rule(
-            rule="/notifier/",
-            endpoint="notifier",
-            view_func=self.notifier,
-            methods=["POST", "GET"],
-        )
-        self.app.add_url_rule(
-            rule="/test/",
-            endpoint="test",
-            view_func=self.test,
-            methods=["POST", "GET"],
+            rule="/metrics",
+            endpoint="metrics",
+            view_func=self.metrics,
+            methods=["GET"],
         )
 
     async def favicon(self) -> Response:
@@ -81,24 +166,90 @@ class WebhookServer():
         Returns:
             Response: An HTTP response with a 200 status code and the string "Test".
         """
-        await self.webhookcalls(webhooks=self.webhooks, tags=["alarm", "motion"])
+        await self.webhooks.dispatch(tags=["alarm", "motion"])
         return Response(response="Test", status=200)
 
-    def calculate_md5(self, content) -> str:
-        md5Hash = hashlib.md5()
-        md5Hash.update(content)
-        return md5Hash.hexdigest()
+    async def stats(self) -> Response:
+        """
+        Handles requests for the stats endpoint.
+        Returns:
+            Response: An HTTP response with the notifier counters in JSON.
+        """
+        return Response(
+            response=json.dumps(
+                obj={
+                    "queue": self.events.stats(),
+                    "limiter": self.limiter.stats(),
+                    "fanout": self.fanout.stats(),
+                    "journal": self.journal.stats() if self.journal else None,
+                    "webhooks": self.webhooks.stats(),
+                }
+            ),
+            status=200,
+            content_type="application/json",
+        )
+
+    async def metrics(self) -> Response:
+        """
+        Handles requests for the metrics endpoint.
+        Returns:
+            Response: An HTTP response with all metrics in Prometheus text format.
+        """
+        return Response(
+            response=render(),
+            status=200,
+            content_type="text/plain; version=0.0.4",
+        )
 
     async def runServer(self) -> asyncio.Task[None] | None:
         try:
-            return asyncio.create_task(coro=self.app.run_task(host="0.0.0.0", port=self.port, debug=False), name="WebhookServer")
+            if self.journal and self.notifierEnabled:
+                undelivered = await self.journal.open()
+                if undelivered:
+                    task = asyncio.create_task(
+                        coro=self.replayEvents(events=undelivered), name="ReplayEvents"
+                    )
+                    self.background.add(task)
+                    task.add_done_callback(self.background.discard)
+            if self.notifierEnabled:
+                self.events.start()
+            self.serverTask = asyncio.create_task(
+                coro=self.app.run_task(
+                    host="0.0.0.0", port=self.port, debug=False, shutdown_trigger=self.stopping.wait
+                ),
+                name="WebhookServer",
+            )
+            return self.serverTask
         except Exception as e:
             logger.warning(msg=f"Error running HTTP Server: {e}")
             return None
 
     async def stopServer(self):
         logger.debug(msg="Shutting down HTTP Server...")
-        await self.app.shutdown()
+        # requests in flight are answered (and journaled) before the server stops
+        self.stopping.set()
+        if self.serverTask:
+            await asyncio.gather(self.serverTask, return_exceptions=True)
+            self.serverTask = None
+        else:
+            await self.app.shutdown()
+        if self.events.workers:
+            try:
+                await asyncio.wait_for(fut=self.events.queue.join(), timeout=self.DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(msg="Events still queued at shutdown, they will be notified at next start")
+        await self.events.stop()
+        if self.journal:
+            await self.journal.close()
+
+    async def replayEvents(self, events: list[dict]) -> None:
+        logger.info(msg=f"Replaying {len(events)} events not notified before last shutdown...")
+        for event in events:
+            await self.events.putWait(event=event)
+
+    def discardEvent(self, event: dict) -> None:
+        if self.journal:
+            self.journal.remove(event=event)
 
     def isRunning(self) -> bool:
         logger.debug(msg="Check for Web server is running...")
@@ -111,156 +262,278 @@ class WebhookServer():
             return False
 
     async def notifier(self) -> Response:
-        global localTime
-        if self.requestsRateLimit and localTime:
-            if time.time() - localTime < self.requestsRateLimit:
-                logger.warning(msg="Rate limit exceeded, returning 429 error code...")
-                abort(code=429, description="Rate limit exceeded")
         try:
             message = unquote(string=request.query_string).lstrip("message=")
             if not message:
                 logger.error(msg=f"Missing message query parameter...")
                 abort(code=400, description="Missing message query parameter")
-            localTime = time.time()  # anti flooding filter
             messageDict = json.loads(s=message)
             logger.debug(msg=f"Received message: {message}")
             files = await request.files
-            mid = messageDict["info"].get("mid", None)
-            description = messageDict["info"].get("description", None)
-            title = messageDict["info"].get("title", None)
-            if "eventDetails" in messageDict["info"].keys():
-                reason = messageDict["info"]["eventDetails"].get("reason", None)
-                matrices = messageDict["info"]["eventDetails"].get("matrices", None)
-            if mid:
-                url = f"{self.baseUrl}:{self.shinobiPort}/{self.shinobiApiKey}/monitor/{self.groupKey}/{mid}"
-                data = await queryUrl(url=url)
-                if not data:
-                    logger.warning(
-                        msg=f"Error querying/getting data from {url} about monitor {mid}..."
-                    )
-                else:
-                    dataInJson = data.json()
-                    name = dataInJson[0].get("name")
-                    tags: list = dataInJson[0].get("tags", "").split(",")
+            event = self.parseEvent(
+                messageDict=messageDict, images=self.readFiles(files=files)
+            )
         except json.JSONDecodeError:
             logger.error(
                 msg=f"{message}\n is not a valid JSON object, returning 400 error code..."
             )
             abort(code=400, description="Message does not contain a valid JSON object")
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(msg=f"Error executing notifier func: {e}")
             abort(code=204)
+        if self.journal:
+            try:
+                await self.journal.append(event=event)
+            except Exception as e:
+                logger.error(msg=f"Event not journaled, it will be lost on restart: {e}")
+        if not self.events.put(event=event):
+            self.discardEvent(event=event)
+            logger.warning(msg="Events queue full, returning 503 error code...")
+            abort(code=503, description="Events queue full")
+        return Response(response="Accepted", status=202)
+
+    async def processEvent(self, event: dict) -> None:
+        """
+        Run by the event workers for every queued event: enriches it, applies the
+        rate limit then notifies it.
+        """
+        started = time.monotonic()
+        await self.enrichEvent(event=event)
+        self.events.timings.record(stage="enrich", seconds=time.monotonic() - started)
+        if not self.limiter.allow(mid=event["mid"], tags=event["tags"]):
+            held = self.limiter.hold(event=event)
+            if not held:
+                logger.warning(msg=f"Rate limit exceeded for {event['mid']}, event dropped...")
+                self.discardEvent(event=event)
+                return
+            if held == 1:
+                task = asyncio.create_task(
+                    coro=self.sendDigest(
+                        mid=event["mid"],
+                        delay=self.limiter.waitTime(mid=event["mid"], tags=event["tags"]),
+                    ),
+                    name=f"Digest {event['mid']}",
+                )
+                self.background.add(task)
+                task.add_done_callback(self.background.discard)
+            logger.info(msg=f"Rate limit exceeded for {event['mid']}, event held for digest...")
+            return
+        if await self.deliver(event=event):
+            NOTIFY_LATENCY.observe(time.time() - event["received"])
+            self.discardEvent(event=event)
+
+    def readFiles(self, files: dict) -> list[bytes]:
+        images = []
+        for file in files.values():
+            try:
+                images.append(file.read())
+            except Exception as e:
+                logger.debug(msg=f"Impossible to read file {file}: {e}")
+        return images
+
+    def parseEvent(self, messageDict: dict, images: list[bytes]) -> dict:
+        """
+        Extracts from a Shinobi event what is needed to notify it, name and tags of
+        its monitor are added later by `enrichEvent`.
+        """
+        info = messageDict["info"]
+        event: dict[str, Any] = {
+            "mid": info.get("mid", None),
+            "title": info.get("title", None),
+            "description": info.get("description", None),
+            "reason": None,
+            "matrices": None,
+            "name": None,
+            "tags": [],
+            "images": images,
+            "received": time.time(),
+        }
+        if "eventDetails" in info.keys():
+            event["reason"] = info["eventDetails"].get("reason", None)
+            event["matrices"] = info["eventDetails"].get("matrices", None)
+        return event
+
+    async def enrichEvent(self, event: dict) -> None:
+        if event["mid"]:
+            dataInJson = await self.REGISTRY.get(mid=event["mid"])
+            if not dataInJson:
+                logger.warning(
+                    msg=f"Error querying/getting data about monitor {event['mid']}..."
+                )
+            else:
+                event["name"] = dataInJson.get("name")
+                event["tags"] = [
+                    tag.strip() for tag in dataInJson.get("tags", "").split(",") if tag.strip()
+                ]
+
+    def formatMessage(self, event: dict) -> str:
         messageToSend = (
             "<b>WARNING:</b>\n"
-            + (f"Title: <b>{title}</b>\n" if 'title' in locals() else "")
-            + (f"Description: <b>{description}</b>\n" if 'description' in locals() else "")
-            + (f"Name: <b>{name}</b>\n" if 'name' in locals() else "")
-            + (f"Reason: <b>{reason}</b>\n" if 'reason' in locals() else "")  # TODO add emoticons
+            + (f"Title: <b>{event['title']}</b>\n" if event["title"] is not None else "")
+            + (f"Description: <b>{event['description']}</b>\n" if event["description"] is not None else "")
+            + (f"Name: <b>{event['name']}</b>\n" if event["name"] is not None else "")
+            + (f"Reason: <b>{event['reason']}</b>\n" if event["reason"] is not None else "")  # TODO add emoticons
         )
-        if matrices:
-            for matrice in matrices:
+        if event["matrices"]:
+            for matrice in event["matrices"]:
                 messageToSend += (
                     (f"Matrice: <b>{matrice['id']}</b>\n" if 'id' in matrice.keys() else "")
                     + (f"Tag: <b>{matrice['tag']}</b>\n" if 'tag' in matrice.keys() else "")
                     + (f"Confidence: <b>{matrice['confidence']}</b>\n" if 'confidence' in matrice.keys() else "")
                     + (f"Is zombie: <b>{matrice['isZombie']}</b>\n" if 'isZombie' in matrice.keys() else "")
                 )
-        if files:
+        return messageToSend
+
+    def formatDigest(self, events: list[dict]) -> str:
+        last = events[-1]
+        seconds = int(last["received"] - events[0]["received"])
+        reasons = {str(object=event["reason"]) for event in events if event["reason"]}
+        objects = {
+            str(object=matrice["tag"])
+            for event in events
+            for matrice in (event["matrices"] or [])
+            if "tag" in matrice.keys()
+        }
+        return (
+            f"<b>WARNING:</b> {len(events)} events in {seconds} seconds\n"
+            + (f"Name: <b>{last['name']}</b>\n" if last["name"] is not None else "")
+            + (f"Reasons: <b>{', '.join(sorted(reasons))}</b>\n" if reasons else "")
+            + (f"Detected: <b>{', '.join(sorted(objects))}</b>\n" if objects else "")
+        )
+
+    async def sendDigest(self, mid: str | None, delay: float) -> None:
+        """
+        Waits for the rate limit of `mid` to expire then notifies all the events
+        held meanwhile as a single message.
+        """
+        await asyncio.sleep(delay=delay)
+        events = self.limiter.release(mid=mid)
+        if not events:
+            return
+        logger.debug(msg=f"Sending digest of {len(events)} events for {mid}")
+        try:
+            delivered = await self.deliver(
+                event=events[-1], messageToSend=self.formatDigest(events=events)
+            )
+        except Exception as e:
+            logger.error(msg=f"Error sending digest for {mid}: {e}")
+            return
+        if delivered:
+            for event in events:
+                self.discardEvent(event=event)
+
+    async def deliver(self, event: dict, messageToSend: str | None = None) -> bool:
+        """
+        Returns:
+            bool: False if no chat could be notified.
+        """
+        started = time.monotonic()
+        if messageToSend is None:
+            messageToSend = self.formatMessage(event=event)
+        if event["images"]:
             mediaGroup = self.mediaGroupFormatter(
-                files=files, messageToSend=messageToSend
+                images=event["images"], messageToSend=messageToSend
             )
-            for user in self.toNotify:
-                await self.APPLICATION.bot.send_media_group(
+            results = await self.fanout.sendUploading(
+                recipients=self.toNotify,
+                upload=lambda user: self.APPLICATION.bot.send_media_group(
                     chat_id=user, media=mediaGroup
-                )
+                ),
+                reuse=lambda messages: self.reuseMediaGroup(
+                    messages=messages, messageToSend=messageToSend
+                ),
+                cost=len(mediaGroup),
+            )
         else:
-            if mid:
-                snapshotUrl = await self.getSnapshot(mid=mid)
-            for user in self.toNotify:
-                if "snapshotUrl" in locals().keys() and snapshotUrl is not None:
-                    await self.APPLICATION.bot.send_photo(
-                        chat_id=user,
-                        photo=snapshotUrl,
-                        caption=messageToSend,
-                        parse_mode="HTML",
-                    )
-                else:
-                    await self.APPLICATION.bot.send_message(
+            snapshot = None
+            if event["mid"]:
+                snapshot = await self.SNAPSHOTS.get(mid=event["mid"])
+            if snapshot is not None:
+                results = await self.fanout.sendUploading(
+                    recipients=self.toNotify,
+                    upload=lambda user: self.uploadPhoto(
+                        user=user, snapshot=snapshot, messageToSend=messageToSend
+                    ),
+                    reuse=lambda message: self.reusePhoto(
+                        message=message, messageToSend=messageToSend
+                    ),
+                )
+            else:
+                results = await self.fanout.send(
+                    recipients=self.toNotify,
+                    send=lambda user: self.APPLICATION.bot.send_message(
                         chat_id=user, text=messageToSend, parse_mode="HTML"
-                    )
+                    ),
+                )
+        self.events.timings.record(stage="deliver", seconds=time.monotonic() - started)
         if self.webhooks:
-            await self.webhookcalls(webhooks=self.webhooks, tags=tags)
-            # TODO implementare logica di ritorno bool presente in webhookcalls
-        return Response(response="Success", status=200)
+            started = time.monotonic()
+            await self.webhooks.dispatch(tags=event["tags"])
+            self.events.timings.record(stage="webhooks", seconds=time.monotonic() - started)
+        return not results or any(result is not None for result in results.values())
 
-    async def webhookcalls(self, webhooks: AddressKList | None, tags: list | None = None):
-        if webhooks:
-            if tags:
-                for tag, webhook in webhooks.items():
-                    calls: int = 0
-                    if tag in tags:
-                        logger.debug(msg=f"OK found TAG: {tag} with WEBHOOK: {webhook}")
-                        try:
-                            reponse = await queryUrl(
-                                url=f"{webhook}",
-                                # timeout=2,
-                            )
-                            if reponse:
-                                logger.debug(msg=f"Webhook {webhook} called successfully")
-                                calls += 1
-                            else:
-                                logger.error(msg=f"Connection error, no response from {webhook}")
-                                return False
-                        except Exception as e:
-                            logger.error(msg=f"Error calling webhook {webhook}: {e}")
-                            return False
-                    else:
-                        logger.debug(msg=f"Tag {tag} not in webhook tags keys")
-            else:
-                logger.debug(msg="No tag list to check")
-                return False
-        else:
-            logger.debug(msg="No webhooks directive found in settings")
-            return False
-        if not calls:
-            logger.debug(msg="No calls made")
-            return False
-        return True
+    def sendPhoto(self, user: int | str, photo: Any, messageToSend: str) -> Awaitable[Message]:
+        return self.APPLICATION.bot.send_photo(
+            chat_id=user,
+            photo=photo,
+            caption=messageToSend,
+            parse_mode="HTML",
+        )
 
-        # for tag, webhook in self.webhooks.items():
-        #     asyncio.create_task(
-        #         coro=queryUrl(
-        #             url=f"{self.webhooks[webhook]}/alarm",
-        #             debug=True,
-        #             timeout=20,
-        #         )
-        #     )
+    async def uploadPhoto(self, user: int | str, snapshot: bytes, messageToSend: str) -> Message:
+        """
+        Sends `snapshot` by file_id when the same image was sent before.
+        """
+        photo = self.SNAPSHOTS.photo(content=snapshot)
+        try:
+            message = await self.sendPhoto(user=user, photo=photo, messageToSend=messageToSend)
+        except BadRequest:
+            if photo is snapshot:
+                raise
+            # the file_id is no longer valid, the bytes are sent again
+            self.SNAPSHOTS.forgetPhoto(content=snapshot)
+            message = await self.sendPhoto(user=user, photo=snapshot, messageToSend=messageToSend)
+        self.SNAPSHOTS.remember(content=snapshot, sent=message)
+        return message
 
-    def mediaGroupFormatter(self, files: dict, messageToSend: str) -> list[InputMediaPhoto]:
+    def reusePhoto(
+        self, message: Message, messageToSend: str
+    ) -> Callable[[int | str], Awaitable[Message]] | None:
+        """
+        Builds a sender that resends the photo of `message` by its file_id.
+        """
+        if not message.photo:
+            return None
+        fileId = message.photo[-1].file_id
+        return lambda user: self.sendPhoto(user=user, photo=fileId, messageToSend=messageToSend)
+
+    def reuseMediaGroup(
+        self, messages: tuple[Message, ...], messageToSend: str
+    ) -> Callable[[int | str], Awaitable[Any]] | None:
+        """
+        Builds a sender that resends the photos of an uploaded media group by their
+        file_id.
+        """
+        fileIds = [message.photo[-1].file_id for message in messages if message.photo]
+        if not fileIds or len(fileIds) != len(messages):
+            return None
+        mediaGroup = self.mediaGroupFormatter(images=fileIds, messageToSend=messageToSend)
+        return lambda user: self.APPLICATION.bot.send_media_group(chat_id=user, media=mediaGroup)
+
+    def mediaGroupFormatter(self, images: list[bytes] | list[str], messageToSend: str) -> list[InputMediaPhoto]:
         mediaGroup = []
-        for file in files.values():
-            try:
-                mediaGroup.append(
-                    InputMediaPhoto(
-                        media=file.read(),
-                        caption=messageToSend,
-                        parse_mode="HTML"
-                    )
+        for image in images:
+            mediaGroup.append(
+                InputMediaPhoto(
+                    media=image,
+                    caption=messageToSend,
+                    parse_mode="HTML"
                 )
-            except Exception as e:
-                logger.debug(msg=f"Impossible to read file {file}: {e}")
+            )
         return mediaGroup
 
-    async def getSnapshot(self, mid: str) -> str | None:
-        imagePath = "".join([self.snapshotUrl, "/", mid, "/s.jpg"])
-        response = await queryUrl(url=imagePath)
-        if response is not None:
-            md5 = self.calculate_md5(content=response.content)
-            if md5 != PLACEHOLDERMD5:
-                avoidCacheUrl = str(object=int(time.time()))
-                snapshotUrl = imagePath + "?" + avoidCacheUrl
-                return snapshotUrl
-        return None
-    
+
 if __name__ == "__main__":
     raise SystemExit
@@ -0,0 +1,34 @@
+from typing import Any
+from settings import AddressKList
+
+class NotifySettings:
+    """
+    A class representing the settings of the webhook server, kept apart from notify so
+    they are known even when the server, and Quart with it, is never imported.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "SERVER": {"data": False, "typeOf": bool, "required": False},
+        "METRICS": {"data": False, "typeOf": bool, "required": False},
+        "PORT": {"data": 5001, "typeOf": int, "required": False},
+        "WEBHOOKS": {"data": None, "typeOf": AddressKList, "required": False},
+        "REQUESTS_RATE_LIMIT": {"data": 10, "typeOf": float, "required": False},
+        "RATE_LIMIT_BURST": {"data": 1, "typeOf": int, "required": False},
+        "RATE_LIMIT_BY_TAG": {"data": False, "typeOf": bool, "required": False},
+        "COALESCE_EVENTS": {"data": True, "typeOf": bool, "required": False},
+        "TELEGRAM_GLOBAL_RATE": {"data": 30, "typeOf": float, "required": False}, # messages per second
+        "TELEGRAM_CHAT_INTERVAL": {"data": 1, "typeOf": float, "required": False}, # in seconds
+        "SEND_RETRIES": {"data": 3, "typeOf": int, "required": False},
+        "QUEUE_SIZE": {"data": 100, "typeOf": int, "required": False},
+        "WORKERS": {"data": 2, "typeOf": int, "required": False},
+        "OVERFLOW_POLICY": {"data": "drop_oldest", "typeOf": str, "required": False}, # drop_oldest or reject
+        "JOURNAL": {"data": ".journal", "typeOf": str, "required": False}, # empty to disable
+        "JOURNAL_FLUSH_INTERVAL": {"data": 0.05, "typeOf": float, "required": False}, # in seconds
+        "WEBHOOKS_TIMEOUT": {"data": 2, "typeOf": float, "required": False}, # in seconds
+        "WEBHOOKS_RETRIES": {"data": 2, "typeOf": int, "required": False},
+        "WEBHOOKS_COOLDOWN": {"data": 60, "typeOf": float, "required": False}, # in seconds
+    }
+
+
+if __name__ == "__main__":
+    raise SystemExit
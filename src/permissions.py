@@ -0,0 +1,139 @@
+import logging
+from types import MappingProxyType
+from typing import Any, Iterable
+
+logger = logging.getLogger(name=__name__)
+
+def _idList(value: Any) -> list:
+    """
+    A ban holds nobody (null), one user id or a list of them.
+    """
+    if value is None:
+        return []
+    if not isinstance(value, (list, tuple, set, frozenset)):
+        value = [value]
+    ids = []
+    for item in value:
+        try:
+            ids.append(int(item))
+        except (TypeError, ValueError):
+            ids.append(item)
+    return ids
+
+
+def _ids(value: Any) -> frozenset:
+    return frozenset(_idList(value=value))
+
+
+class Permissions:
+    """
+    A class representing what a user can see and do; users banned from the same
+    things share the same instance, `key` tells the instances apart.
+    """
+    __slots__ = ("key", "bannedMonitors", "bannedStates", "actions", "settings", "notify")
+    def __init__(
+        self,
+        key: str,
+        bannedMonitors: frozenset[str],
+        bannedStates: frozenset[str],
+        actions: tuple[str, ...],
+        settings: bool,
+        notify: bool,
+    ) -> None:
+        self.key = key
+        self.bannedMonitors = bannedMonitors
+        self.bannedStates = bannedStates
+        self.actions = actions
+        self.settings = settings
+        self.notify = notify
+
+    def canMonitor(self, mid: str | None) -> bool:
+        return mid not in self.bannedMonitors
+
+    def canState(self, name: str | None) -> bool:
+        return name not in self.bannedStates
+
+    def canAction(self, action: str | None) -> bool:
+        return action in self.actions
+
+    def visibleMonitors(self, monitors: Iterable[dict]) -> list[dict]:
+        if not self.bannedMonitors:
+            return list(monitors)
+        return [monitor for monitor in monitors if monitor.get("mid") not in self.bannedMonitors]
+
+    def visibleStates(self, names: Iterable[str]) -> list[str]:
+        if not self.bannedStates:
+            return list(names)
+        return [name for name in names if name not in self.bannedStates]
+
+
+class PermissionIndex:
+    """
+    A class representing CHAT_ID and BANS compiled once into the permissions of each
+    user, so checks are dictionary and set lookups.
+    It never changes once built: a new index replaces it when settings change.
+    """
+    ACTIONS: tuple[str, ...] = ("snapshot", "stream", "videos", "map", "configure")
+    def __init__(self, chatIds: list | None, bans: dict | None) -> None:
+        chatIds = list(chatIds or [])
+        bans = bans or {}
+        # None lets anyone in
+        self.allowed: frozenset | None = _ids(value=chatIds) if chatIds else None
+        monitors: dict[str, frozenset] = {}
+        states: dict[str, frozenset] = {}
+        actions: dict[str, frozenset] = {}
+        settings: frozenset = frozenset()
+        notify: frozenset = frozenset()
+        for key, value in bans.items():
+            banned = _ids(value=value)
+            if not banned:
+                continue
+            if key.startswith("mid_"):
+                monitors[key[len("mid_"):]] = banned
+            elif key.startswith("state_"):
+                states[key[len("state_"):]] = banned
+            elif key.startswith("do_"):
+                actions[key[len("do_"):]] = banned
+            elif key == "settings":
+                settings = banned
+            elif key == "to_notify":
+                notify = banned
+            else:
+                logger.warning(msg=f"Unknown ban {key}, ignoring it...")
+        # users not named in any ban share the unrestricted permissions
+        classes: dict[tuple, Permissions] = {}
+        def permissionsOf(user: Any) -> Permissions:
+            signature = (
+                frozenset(mid for mid, users in monitors.items() if user in users),
+                frozenset(name for name, users in states.items() if user in users),
+                tuple(action for action in self.ACTIONS if user not in actions.get(action, ())),
+                user not in settings,
+                user not in notify,
+            )
+            permissions = classes.get(signature)
+            if permissions is None:
+                permissions = Permissions(f"p{len(classes)}", *signature)
+                classes[signature] = permissions
+            return permissions
+        self.default = permissionsOf(user=None)
+        named = set(_ids(value=chatIds)).union(
+            settings, notify, *monitors.values(), *states.values(), *actions.values()
+        )
+        self.users: MappingProxyType[Any, Permissions] = MappingProxyType(
+            {user: permissionsOf(user=user) for user in named}
+        )
+        self.classes: int = len(classes)
+        self.toNotify: tuple = tuple(
+            dict.fromkeys(user for user in _idList(value=chatIds) if user not in notify)
+        )
+        logger.debug(msg=f"{len(self.users)} users in {self.classes} permission classes")
+
+    def isAllowed(self, chatId: Any) -> bool:
+        return self.allowed is None or chatId in self.allowed
+
+    def get(self, chatId: Any) -> Permissions:
+        return self.users.get(chatId, self.default)
+
+
+if __name__ == "__main__":
+    raise SystemExit
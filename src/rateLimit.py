@@ -0,0 +1,158 @@
+import logging
+import time
+
+logger = logging.getLogger(name=__name__)
+
+class TokenBucket:
+    """
+    A class representing a token bucket, it holds up to `burst` tokens and gains one
+    every `interval` seconds.
+    """
+    def __init__(self, interval: float, burst: int) -> None:
+        self.interval = interval
+        self.burst = max(1, burst)
+        self.tokens: float = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if self.interval > 0:
+            elapsed = max(0, now - self.updated)
+            self.tokens = min(self.burst, self.tokens + elapsed / self.interval)
+        else:
+            self.tokens = self.burst
+        self.updated = max(self.updated, now)
+
+    def available(self, now: float) -> bool:
+        self._refill(now=now)
+        return self.tokens >= 1
+
+    def take(self, now: float) -> None:
+        self._refill(now=now)
+        self.tokens -= 1
+
+    def waitTime(self, now: float) -> float:
+        """
+        Seconds until the next token is available.
+        """
+        self._refill(now=now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * self.interval
+
+
+class EventLimiter:
+    """
+    A class representing per monitor (and optionally per tag) rate limiting of
+    events; events over the limit are held to be sent later as a single digest.
+    """
+    def __init__(
+        self, interval: float, burst: int = 1, byTag: bool = False,
+        coalesce: bool = True, maxDigest: int = 50,
+    ) -> None:
+        self.interval = interval
+        self.burst = burst
+        self.byTag = byTag
+        self.coalesce = coalesce
+        self.maxDigest = maxDigest
+        self.buckets: dict[str, TokenBucket] = {}
+        # mid -> events waiting to be sent as digest
+        self.pending: dict[str, list[dict]] = {}
+        self.accepted: int = 0
+        self.coalesced: int = 0
+        self.dropped: int = 0
+        self.digests: int = 0
+
+    def configure(self, interval: float, burst: int, byTag: bool, coalesce: bool) -> None:
+        """
+        Applies new limits, tokens already spent stay spent.
+        """
+        self.interval = interval
+        self.burst = burst
+        self.byTag = byTag
+        self.coalesce = coalesce
+        for bucket in self.buckets.values():
+            bucket.interval = interval
+            bucket.burst = max(1, burst)
+            bucket.tokens = min(bucket.tokens, bucket.burst)
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(interval=self.interval, burst=self.burst)
+            self.buckets[key] = bucket
+        return bucket
+
+    def _keys(self, mid: str | None, tags: list[str] | None) -> list[str]:
+        keys = [f"mid:{mid}"]
+        if self.byTag and tags:
+            keys.extend(f"tag:{tag}" for tag in tags if tag)
+        return keys
+
+    def allow(self, mid: str | None, tags: list[str] | None = None) -> bool:
+        """
+        Takes a token from every bucket the event belongs to, only if all have one.
+        """
+        if not self.interval:
+            self.accepted += 1
+            return True
+        now = time.monotonic()
+        buckets = [self._bucket(key=key) for key in self._keys(mid=mid, tags=tags)]
+        if all(bucket.available(now=now) for bucket in buckets):
+            for bucket in buckets:
+                bucket.take(now=now)
+            self.accepted += 1
+            return True
+        return False
+
+    def waitTime(self, mid: str | None, tags: list[str] | None = None) -> float:
+        now = time.monotonic()
+        return max(
+            self._bucket(key=key).waitTime(now=now) for key in self._keys(mid=mid, tags=tags)
+        )
+
+    def hold(self, event: dict) -> int:
+        """
+        Adds a limited event to the digest of its monitor.
+        Returns:
+            int: the number of events now in the digest, 1 means a new digest whose
+            delivery the caller must schedule, 0 means the event was dropped.
+        """
+        if not self.coalesce:
+            self.dropped += 1
+            return 0
+        key = str(object=event.get("mid"))
+        events = self.pending.setdefault(key, [])
+        if len(events) >= self.maxDigest:
+            self.dropped += 1
+            return 0
+        if events:
+            # only the images of the last event are sent with the digest
+            events[-1]["images"] = []
+        events.append(event)
+        self.coalesced += 1
+        return len(events)
+
+    def release(self, mid: str | None) -> list[dict]:
+        """
+        Returns and forgets the events waiting for `mid`, taking a token for the digest.
+        """
+        events = self.pending.pop(str(object=mid), [])
+        if events:
+            self.digests += 1
+            now = time.monotonic()
+            for key in self._keys(mid=mid, tags=events[-1].get("tags")):
+                self._bucket(key=key).take(now=now)
+        return events
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "accepted": self.accepted,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "digests": self.digests,
+            "pending": sum(len(events) for events in self.pending.values()),
+        }
+
+
+if __name__ == "__main__":
+    raise SystemExit
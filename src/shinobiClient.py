@@ -0,0 +1,226 @@
+import logging
+import json
+import importlib.util
+import time
+import httpx
+from typing import Any, AsyncContextManager
+from metrics import Counter, Histogram
+from tracing import span
+
+logger = logging.getLogger(name=__name__)
+LATENCY = Histogram(
+    name="shinogramma_shinobi_request_seconds",
+    help="Duration of Shinobi API requests by endpoint",
+    labelNames=("endpoint",),
+)
+ERRORS = Counter(
+    name="shinogramma_shinobi_request_errors_total",
+    help="Shinobi API requests failed or answered with an error by endpoint",
+    labelNames=("endpoint",),
+)
+
+class ShinobiClient:
+    """
+    A class representing a pooled, non blocking connection to the Shinobi API.
+    One instance is shared by the whole bot so TCP/TLS connections are kept alive
+    and reused between requests.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "HTTP2": {"data": False, "typeOf": bool, "required": False},
+        "MAX_CONNECTIONS": {"data": 20, "typeOf": int, "required": False},
+        "KEEPALIVE_EXPIRY": {"data": 30, "typeOf": float, "required": False}, # in seconds
+        "TIMEOUT": {"data": 5, "typeOf": float, "required": False}, # in seconds
+    }
+    # Read timeouts (in seconds) for each endpoint, others use TIMEOUT setting
+    TIMEOUTS: dict[str, float] = {
+        "monitor": 3,
+        "monitorStates": 5,
+        "configureMonitor": 5,
+        "toggleSubstream": 5,
+        "jpeg": 5,
+        "videos": 10,
+    }
+    def __init__(
+        self,
+        baseUrl,
+        port: int,
+        apiKey: str,
+        groupKey: str,
+        http2: bool = False,
+        maxConnections: int = 20,
+        keepaliveExpiry: float = 30,
+        timeout: float = 5,
+    ) -> None:
+        self.BASEURL = baseUrl
+        self.PORT = port
+        self.API_KEY = apiKey
+        self.GROUP_KEY = groupKey
+        self.apiUrl = f"{self.BASEURL}:{self.PORT}/{self.API_KEY}"
+        if http2 and importlib.util.find_spec(name="h2") is None:
+            logger.warning(msg="HTTP2 requested but h2 module not found, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self.limits = httpx.Limits(
+            max_connections=maxConnections,
+            max_keepalive_connections=maxConnections,
+            keepalive_expiry=keepaliveExpiry,
+        )
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        # metrics children of known endpoints, so requests do not look them up
+        self.latency = {endpoint: LATENCY.labels(endpoint) for endpoint in self.TIMEOUTS}
+        self.errors = {endpoint: ERRORS.labels(endpoint) for endpoint in self.TIMEOUTS}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The underlying httpx.AsyncClient, created on first use so it is bound to the
+        running event loop.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=httpx.Timeout(timeout=self.timeout),
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            logger.debug(msg="Closing Shinobi connection pool...")
+            await self._client.aclose()
+        self._client = None
+
+    def endpointUrl(self, endpoint: str, *path: str) -> str:
+        return "/".join([self.apiUrl, endpoint, self.GROUP_KEY, *path])
+
+    async def request(
+        self,
+        endpoint: str,
+        *path: str,
+        method: str = "get",
+        params: dict | None = None,
+        data: dict | None = None,
+        timeout: float | None = None,
+    ) -> None | httpx.Response:
+        """
+        Makes a request to `endpoint` for the configured group, extra `path` segments
+        are appended to the url.
+        Returns:
+            httpx.Response | None: the response if status code is 200, None otherwise.
+        """
+        url = self.endpointUrl(endpoint, *path)
+        if timeout is None:
+            timeout = self.TIMEOUTS.get(endpoint, self.timeout)
+        started = time.monotonic()
+        try:
+            with span(name=f"shinobi {endpoint}"):
+                response = await self.client.request(
+                    method=method,
+                    url=url,
+                    params=params,
+                    data=data,
+                    timeout=httpx.Timeout(timeout=self.timeout, read=timeout),
+                )
+        except httpx.RequestError as e:
+            (self.errors.get(endpoint) or ERRORS.labels(endpoint)).inc()
+            logger.critical(
+                msg=f"Error something went wrong, request to {endpoint}-->connection error: \n{e}"
+            )
+            return None
+        finally:
+            (self.latency.get(endpoint) or LATENCY.labels(endpoint)).observe(
+                time.monotonic() - started
+            )
+        if response.status_code != 200:
+            (self.errors.get(endpoint) or ERRORS.labels(endpoint)).inc()
+            logger.info(
+                msg=f"Error {response.status_code} something went wrong, request to {endpoint} error."
+            )
+            return None
+        logger.debug(msg=f"OK, request to {endpoint} done.")
+        return response
+
+    async def requestJson(self, endpoint: str, *path: str, **kwargs) -> Any:
+        response = await self.request(endpoint, *path, **kwargs)
+        if response is None:
+            return None
+        try:
+            return response.json()
+        except ValueError as e:
+            logger.error(msg=f"Invalid JSON from {endpoint}: {e}")
+            return None
+
+    async def requestOk(self, endpoint: str, *path: str, **kwargs) -> bool:
+        dataInJson = await self.requestJson(endpoint, *path, **kwargs)
+        return isinstance(dataInJson, dict) and bool(dataInJson.get("ok"))
+
+    async def getMonitors(self) -> list[dict] | None:
+        monitors = await self.requestJson("monitor")
+        if isinstance(monitors, dict):
+            # Shinobi returns a single object when the group has only one monitor
+            monitors = [monitors]
+        return monitors
+
+    async def getMonitor(self, mid: str) -> dict | None:
+        monitor = await self.requestJson("monitor", mid)
+        if isinstance(monitor, list):
+            monitor = monitor[0] if monitor else None
+        return monitor
+
+    async def getVideos(self, mid: str, params: dict | None = None) -> dict | None:
+        return await self.requestJson("videos", mid, params=params)
+
+    def videoUrl(self, mid: str, fileName: str) -> str:
+        return self.endpointUrl("videos", mid, fileName)
+
+    def streamVideo(self, mid: str, fileName: str) -> AsyncContextManager[httpx.Response]:
+        """
+        The recording as a streamed response, its body is read while it is used and
+        the response must be used as an async context manager.
+        """
+        return self.client.stream(
+            method="GET",
+            url=self.videoUrl(mid=mid, fileName=fileName),
+            timeout=httpx.Timeout(timeout=self.timeout, read=self.TIMEOUTS["videos"]),
+        )
+
+    async def setVideoStatus(self, mid: str, fileName: str, status: int) -> bool:
+        return await self.requestOk("videos", mid, fileName, "status", str(object=status))
+
+    async def deleteVideo(self, mid: str, fileName: str) -> bool:
+        return await self.requestOk("videos", mid, fileName, "delete")
+
+    def snapshotUrl(self, mid: str) -> str:
+        return self.endpointUrl("jpeg", mid, "s.jpg")
+
+    async def getSnapshot(self, mid: str) -> bytes | None:
+        response = await self.request("jpeg", mid, "s.jpg")
+        if response is None:
+            return None
+        return response.content
+
+    async def getStates(self) -> list[dict] | None:
+        states = await self.requestJson("monitorStates")
+        if isinstance(states, dict):
+            return states.get("presets", [])
+        return None
+
+    async def activateState(self, name: str) -> bool:
+        return await self.request("monitorStates", name) is not None
+
+    async def configureMonitor(self, mid: str, monitorData: dict) -> bool:
+        return await self.requestOk(
+            "configureMonitor",
+            mid,
+            method="put",
+            data={"data": json.dumps(obj=monitorData)},
+        )
+
+    async def toggleSubstream(self, mid: str) -> bool:
+        return await self.requestOk("toggleSubstream", mid)
+
+
+if __name__ == "__main__":
+    raise SystemExit
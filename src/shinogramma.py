@@ -1,8 +1,12 @@
 # This software (aka bot) is intended as a client to conveniently control Shinobi CCTV (more info at https://shinobi.video) through Telegram.
 # I am Nikoh (nikoh@nikoh.it), if you think this bot is useful please consider helping me improving it on github
 # or donate me a coffee
+import time
+# measured before anything else is imported, see reportBoot()
+BOOT_STARTED: float = time.perf_counter()
 import asyncio
 import signal
+import copy
 from telegram.ext import (
     Application,
     ApplicationBuilder,
@@ -12,7 +16,6 @@ from telegram.ext import (
     CallbackContext,
     CallbackQueryHandler,
     filters,
-    PicklePersistence,
     PersistenceInput,
 )
 from telegram import (
@@ -28,13 +31,32 @@ from functools import wraps
 import colorlog
 import logging
 import inspect
-from typing import Callable, Any
-from httpQueryUrl import queryUrl
-from notify import WebhookServer
+from typing import Callable, Any, TYPE_CHECKING
+from httpQueryUrl import closeClient
+from shinobiClient import ShinobiClient
+from monitorRegistry import MonitorRegistry
+from snapshot import SnapshotService
+from notifySettings import NotifySettings
 from settings import IniSettings, Url, IP, LogLevel
 from monitor import Monitor, SubStream
+from callbackData import pack, unpack, shortKey, isShortKey, setKey
+from metrics import TimedRequest, measureLoopLag
+from permissions import PermissionIndex
+from keyboards import KeyboardCache
+from tracing import traced, setSlowThreshold
+from logSetup import LogSetup, startLogging, stopLogging
 from pathlib import Path
-from video import Video
+from video import Video, VideoCache
+from mediaSettings import UploadSettings, TranscodeSettings, FileIdsSettings
+if TYPE_CHECKING:
+    # imported only when the server is enabled, it brings in Quart
+    from notify import WebhookServer
+    # imported only when built, as their settings ask
+    from substreamWatcher import SubstreamWatcher
+    from tracing import Profiler
+    from upload import VideoUploader
+    from transcode import Transcoder
+    from fileIdCache import FileIdCache
 
 """
 Below constant is required to set the log level only for some modules directly involved by
@@ -45,13 +67,45 @@ the log level add the module to the list below
 MODULES_LOGGERS: list[str] = [
     "__main__",
     "httpQueryUrl",
+    "shinobiClient",
+    "monitorRegistry",
+    "video",
+    "snapshot",
     "settings",
     "monitor",
     "notify",
+    "rateLimit",
+    "fanout",
+    "eventQueue",
+    "journal",
+    "webhooks",
+    "substreamWatcher",
+    "sqlitePersistence",
+    "metrics",
+    "tracing",
+    "logSetup",
+    "permissions",
+    "keyboards",
+    "upload",
+    "transcode",
+    "fileIdCache",
 ]
 CONFIG_FILE: Path = Path("config.ini")
+PERSISTENCE_FILE: Path = Path(".persistence.db")
 APPLICATION: Application | None = None  # The Bot
-SERVERAPI: WebhookServer | None = None  # The Webhook Server
+SERVERAPI: "WebhookServer | None" = None  # The Webhook Server
+SHINOBI: ShinobiClient | None = None  # The shared Shinobi API client
+REGISTRY: MonitorRegistry | None = None  # The shared monitors cache
+VIDEOS: VideoCache | None = None  # The shared video windows cache
+SNAPSHOTS: SnapshotService | None = None  # The shared snapshots fetcher
+UPLOADER: "VideoUploader | None" = None  # The videos upload lanes
+TRANSCODER: "Transcoder | None" = None  # The previews of videos too big to upload
+FILE_IDS: "FileIdCache | None" = None  # Telegram file_ids of videos and snapshots sent
+WATCHER: "SubstreamWatcher | None" = None  # The active substream links remover
+PROFILER: "Profiler | None" = None  # Sampling profiler, built when first started from BOTsettings
+PERMISSIONS: PermissionIndex | None = None  # CHAT_ID and BANS compiled per user
+KEYBOARDS = KeyboardCache()  # Menus shared by users with the same permissions
+BACKGROUND: set[asyncio.Task] = set()  # Tasks started by handlers, referenced until done
 """
 Below required and optional data for running this software defined as a global scope
 constant.
@@ -79,44 +133,74 @@ SETTINGS: dict[str, dict[str, object | dict[str, Any]]] = {
             "typeOf": int,
             "required": False,
         },  # in seconds
+        "VERIFY_ACTIVE_LINKS_MIN_TIMEOUT": {
+            "data": 5,
+            "typeOf": int,
+            "required": False,
+        },  # in seconds
+        "SLOW_UPDATE": {"data": 2, "typeOf": float, "required": False},  # in seconds
+        "PROFILE_SECONDS": {"data": 30, "typeOf": int, "required": False},
+        "STARTUP_BUDGET": {"data": 5, "typeOf": float, "required": False},  # in seconds
     },
-    "WEBHOOK": {"INCLUDE": WebhookServer},
+    "HTTP": {"INCLUDE": ShinobiClient},
+    "CACHE": {"INCLUDE": MonitorRegistry},
+    "WEBHOOK": {"INCLUDE": NotifySettings},
     "MONITOR": {"INCLUDE": Monitor},
+    "VIDEO": {"INCLUDE": VideoCache},
+    "LOGGING": {"INCLUDE": LogSetup},
+    "UPLOAD": {"INCLUDE": UploadSettings},
+    "TRANSCODE": {"INCLUDE": TranscodeSettings},
+    "FILE_IDS": {"INCLUDE": FileIdsSettings},
+}
+"""
+SETTINGS as declared, before the config file is read, with the included classes
+expanded: reloadSettings() reads the config file again into a copy of it.
+"""
+SETTINGS_TEMPLATE: dict[str, dict[str, object | dict[str, Any]]] = {
+    section: copy.deepcopy(
+        content["INCLUDE"].SETTINGS if "INCLUDE" in content else content  # type: ignore
+    )
+    for section, content in SETTINGS.items()
+}
+"""
+Settings applied by reloadSettings() while the bot runs, grouped by what they rebuild;
+a change to any other setting is reported and waits for a restart.
+"""
+HOT_SETTINGS: dict[str, tuple[tuple[str, str], ...]] = {
+    "permissions": (("TELEGRAM", "CHAT_ID"), ("SHINOGRAMMA", "BANS")),
+    "logLevel": (("SHINOGRAMMA", "LOGLEVEL"),),
+    # PROFILE_SECONDS and STARTUP_BUDGET are read when used, nothing to rebuild
+    "tracing": (
+        ("SHINOGRAMMA", "SLOW_UPDATE"),
+        ("SHINOGRAMMA", "PROFILE_SECONDS"),
+        ("SHINOGRAMMA", "STARTUP_BUDGET"),
+    ),
+    "logFile": tuple(("LOGGING", key) for key in LogSetup.SETTINGS),
+    "webhooks": (
+        ("WEBHOOK", "WEBHOOKS"),
+        ("WEBHOOK", "WEBHOOKS_TIMEOUT"),
+        ("WEBHOOK", "WEBHOOKS_RETRIES"),
+        ("WEBHOOK", "WEBHOOKS_COOLDOWN"),
+    ),
+    "limiter": (
+        ("WEBHOOK", "REQUESTS_RATE_LIMIT"),
+        ("WEBHOOK", "RATE_LIMIT_BURST"),
+        ("WEBHOOK", "RATE_LIMIT_BY_TAG"),
+        ("WEBHOOK", "COALESCE_EVENTS"),
+    ),
 }
 # Defining root variables
 commands: list = []
+# startup phase -> seconds spent in it
+bootTimings: dict[str, float] = {}
+bootLastMark: float = BOOT_STARTED
 confParam, confParamVal = range(2)
 shutdownEvent = asyncio.Event()
-# activeSubstreams: list[dict[str, Any]] = []
-activeSubstreams: dict[str, dict[str, Any]] = {}
+reloadLock = asyncio.Lock()
 
 # Start logging
 logger = colorlog.getLogger(name=__name__)
-file_handler = logging.FileHandler(filename="shinogramma.log")
-console_handler = logging.StreamHandler()
-
-logging.basicConfig(
-    format="[%(levelname)-8s] %(asctime)s %(name)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    style="%",
-    handlers=[file_handler, console_handler],
-)
-
-formatter = colorlog.ColoredFormatter(
-    fmt="%(log_color)s[%(levelname)-8s] %(blue)s %(asctime)s %(name)s %(reset)s %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    reset=True,
-    log_colors={
-        "TRACE": "bold_cyan",
-        "DEBUG": "cyan",
-        "INFO": "green",
-        "WARNING": "yellow",
-        "ERROR": "bold_red",
-        "CRITICAL": "bold_red,bg_white",
-    },
-)
-
-console_handler.setFormatter(fmt=formatter)
+startLogging()
 
 
 def setLogLevel() -> None:
@@ -141,24 +225,67 @@ def setLogLevel() -> None:
                 for module in MODULES_LOGGERS:
                     logging.getLogger(name=module).setLevel(level=setLevel)
 
+def applyLogSettings() -> None:
+    """Reopens the log file as configured in the LOGGING section"""
+    assert isinstance(SETTINGS["LOGGING"]["FILE"], dict)
+    assert isinstance(SETTINGS["LOGGING"]["MAX_BYTES"], dict)
+    assert isinstance(SETTINGS["LOGGING"]["ROTATE_WHEN"], dict)
+    assert isinstance(SETTINGS["LOGGING"]["BACKUP_COUNT"], dict)
+    assert isinstance(SETTINGS["LOGGING"]["JSON"], dict)
+    assert isinstance(SETTINGS["LOGGING"]["SAMPLE_BURST"], dict)
+    assert isinstance(SETTINGS["LOGGING"]["SAMPLE_INTERVAL"], dict)
+    startLogging(
+        file=SETTINGS["LOGGING"]["FILE"]["data"] or "",
+        maxBytes=SETTINGS["LOGGING"]["MAX_BYTES"]["data"],
+        rotateWhen=SETTINGS["LOGGING"]["ROTATE_WHEN"]["data"] or "",
+        backupCount=SETTINGS["LOGGING"]["BACKUP_COUNT"]["data"],
+        jsonFormat=SETTINGS["LOGGING"]["JSON"]["data"],
+        sampleBurst=SETTINGS["LOGGING"]["SAMPLE_BURST"]["data"],
+        sampleInterval=SETTINGS["LOGGING"]["SAMPLE_INTERVAL"]["data"],
+    )
+
+def bootMark(phase: str) -> None:
+    """Records the time spent in `phase`, since the previous mark"""
+    global bootLastMark
+    now = time.perf_counter()
+    bootTimings[phase] = now - bootLastMark
+    bootLastMark = now
+
+def reportBoot() -> None:
+    total = time.perf_counter() - BOOT_STARTED
+    phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in bootTimings.items())
+    assert isinstance(SETTINGS["SHINOGRAMMA"]["STARTUP_BUDGET"], dict)
+    budget = SETTINGS["SHINOGRAMMA"]["STARTUP_BUDGET"]["data"]
+    if budget and total > budget:
+        logger.warning(msg=f"Startup took {total:.2f}s, over the budget of {budget}s ({phases})")
+    else:
+        logger.info(msg=f"Startup took {total:.2f}s ({phases})")
+
 setLogLevel()
 # Start decorators section
 def restricted(func):
     """Restrict chat only with id(es) defined in config.ini"""
     @wraps(wrapped=func)
     async def wrapped(update, context, *args, **kwargs):
-        if update is not None and context is not None:
-            chat_id = update.effective_user.id
-            assert isinstance(SETTINGS["TELEGRAM"]["CHAT_ID"], dict)
-            if len(SETTINGS["TELEGRAM"]["CHAT_ID"]["data"]) > 0:
-                if chat_id not in SETTINGS["TELEGRAM"]["CHAT_ID"]["data"]:
-                    logger.warning(msg=f"Unauthorized, access denied for {chat_id}.")
-                    return
-        else:
-            chat_id = 11111
+        chat_id = update.effective_user.id
+        assert PERMISSIONS is not None
+        if not PERMISSIONS.isAllowed(chatId=chat_id):
+            logger.warning(msg=f"Unauthorized, access denied for {chat_id}.")
+            return
         return await func(update, context, chat_id, *args, **kwargs)
     return wrapped
 
+def command(desc: str):
+    """Registers the decorated function as the bot command named as its prefix."""
+    def decorator(func):
+        name = func.__name__
+        command = name.split(sep="_")[0]
+        commands.append(
+            {"func": func, "name": name, "command": command, "desc": f"/{command} - {desc}"}
+        )
+        return func
+    return decorator
+
 def send_action(action):
     """Sends `action` while processing func command."""
     def decorator(func):
@@ -173,245 +300,169 @@ def send_action(action):
 
 
 # Start Telegram/Bot commands definition (ALL must be decorated with restricted for security reasons):
+@command(desc="Start this bot")
+@traced
 @restricted
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None | str:
-    if update is None and context is None and chat_id == 11111:
-        desc = "Start this bot"
-        return desc
-    else:
-        if update.effective_chat:
-            tag = "start"
-            keyboard: list[list[InlineKeyboardButton]] = []
-            for command in commands:
-                keyboard.append(
-                    [
-                        InlineKeyboardButton(
-                            text="/" + command["command"], callback_data=None
-                        )
-                    ]
-                )
-            reply_markup = ReplyKeyboardMarkup(
-                    keyboard=keyboard,  # type: ignore
-                    resize_keyboard=True,
-                    one_time_keyboard=True,
-                    input_field_placeholder="choose the command",
-                )
-            await context.bot.send_message(
-                    chat_id=chat_id,
-                    text="I'm Shinogramma Bot, and I am ready!\nGlad to serve you \u263A",
-                    reply_markup=reply_markup,
-                )
-        return None
-
-
-@restricted
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None | str:
-    if update is None and context is None and chat_id == 11111:
-        desc = "Where you are"
-        return desc
-    else:
-        if update.effective_chat:
-            tag = "help"
-            help_text = "Available commands are:\n"
-            keyboard = []
-            for command in commands:
-                help_text += f'{command["desc"]}\n'
-                keyboard.append(
-                    [
-                        InlineKeyboardButton(
-                            text="/" + command["command"], callback_data=None
-                        )
-                    ]
-                )
-            reply_markup = ReplyKeyboardMarkup(
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    if update.effective_chat:
+        tag = "start"
+        keyboard: list[list[InlineKeyboardButton]] = []
+        for command in commands:
+            keyboard.append(
+                [
+                    InlineKeyboardButton(
+                        text="/" + command["command"], callback_data=None
+                    )
+                ]
+            )
+        reply_markup = ReplyKeyboardMarkup(
                 keyboard=keyboard,  # type: ignore
                 resize_keyboard=True,
                 one_time_keyboard=True,
                 input_field_placeholder="choose the command",
             )
-            await context.bot.send_message(
-                chat_id=chat_id, text=help_text, reply_markup=reply_markup
+        await context.bot.send_message(
+                chat_id=chat_id,
+                text="I'm Shinogramma Bot, and I am ready!\nGlad to serve you \u263A",
+                reply_markup=reply_markup,
             )
-        return None
+    return None
 
 
+@command(desc="Where you are")
+@traced
 @restricted
-async def states_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None | str:
-    if update is None and context is None and chat_id == 11111:
-        desc = "List all states"
-        return desc
-    else:
-        if update.effective_chat:
-            tag = inspect.currentframe().f_code.co_name  # type: ignore
-            if isinstance(SETTINGS["SHINOBI"]["BASE_URL"], dict):
-                base_url = SETTINGS["SHINOBI"]["BASE_URL"]["data"]
-            if isinstance(SETTINGS["SHINOBI"]["PORT"], dict):
-                port = SETTINGS["SHINOBI"]["PORT"]["data"]
-            if isinstance(SETTINGS["SHINOBI"]["API_KEY"], dict):
-                api_key = SETTINGS["SHINOBI"]["API_KEY"]["data"]
-            if isinstance(SETTINGS["SHINOBI"]["GROUP_KEY"], dict):
-                group_key = SETTINGS["SHINOBI"]["GROUP_KEY"]["data"]
-            if isinstance(SETTINGS["SHINOGRAMMA"]["BANS"], dict):
-                bans = SETTINGS["SHINOGRAMMA"]["BANS"]["data"]
-            url = f"{base_url}:{port}/{api_key}/monitorStates/{group_key}"
-            data = await queryUrl(url=url)
-            if data:
-                dataInJson = data.json()
-                states = []
-                for i in dataInJson["presets"]:
-                    var = f"state_{i['name']}"
-                    if bans:
-                        if var in bans.keys() and bans[var]:
-                            try:
-                                if chat_id in bans[var]:
-                                    continue
-                            except TypeError:
-                                if chat_id == bans[var]:
-                                    continue
-                            except Exception as e:
-                                logger.error(msg=f"Error verifyng BANS for states: {e}")
-                    states.append(i["name"])
-                if len(states) > 0:
-                    buttons = []
-                    for state in states:
-                        buttons.append(
-                            [
-                                InlineKeyboardButton(
-                                    text=state,
-                                    callback_data={
-                                        "tag": tag,
-                                        "choice": state,
-                                    },
-                                )
-                            ]
-                        )
-                    reply_markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text="Select one state to activate:",
-                        reply_markup=reply_markup,
-                    )
-                else:
-                    logger.debug(msg="No states found \u26A0\ufe0f")
-                    await context.bot.send_message(
-                        chat_id=chat_id, text="No states found \u26A0\ufe0f"
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    if update.effective_chat:
+        tag = "help"
+        help_text = "Available commands are:\n"
+        keyboard = []
+        for command in commands:
+            help_text += f'{command["desc"]}\n'
+            keyboard.append(
+                [
+                    InlineKeyboardButton(
+                        text="/" + command["command"], callback_data=None
                     )
-        return None
+                ]
+            )
+        reply_markup = ReplyKeyboardMarkup(
+            keyboard=keyboard,  # type: ignore
+            resize_keyboard=True,
+            one_time_keyboard=True,
+            input_field_placeholder="choose the command",
+        )
+        await context.bot.send_message(
+            chat_id=chat_id, text=help_text, reply_markup=reply_markup
+        )
+    return None
+
+
+@command(desc="List all states")
+@traced
+@restricted
+async def states_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
+    if update.effective_chat:
+        tag = inspect.currentframe().f_code.co_name  # type: ignore
+        assert REGISTRY is not None
+        assert PERMISSIONS is not None
+        data = await REGISTRY.getStates(stale=True)
+        if data is not None:
+            permissions = PERMISSIONS.get(chatId=chat_id)
+            reply_markup = KEYBOARDS.get(
+                kind="states",
+                permissions=permissions.key,
+                version=REGISTRY.version(kind="states") or "",
+                build=lambda: statesKeyboard(
+                    tag=tag, states=permissions.visibleStates(names=(i["name"] for i in data))
+                ),
+            )
+            if reply_markup is not None:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text="Select one state to activate:",
+                    reply_markup=reply_markup,
+                )
+            else:
+                logger.debug(msg="No states found \u26A0\ufe0f")
+                await context.bot.send_message(
+                    chat_id=chat_id, text="No states found \u26A0\ufe0f"
+                )
+    return None
 
 
+@command(desc="List all monitors")
+@traced
 @restricted
 async def monitors_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int
-) -> None | str:
-    if update is None and context is None and chat_id == 11111:
-        desc = "List all monitors"
-        return desc
-    else:
-        if update.effective_chat:
-            tag = inspect.currentframe().f_code.co_name  # type: ignore
-            if isinstance(SETTINGS["SHINOBI"]["BASE_URL"], dict):
-                base_url = SETTINGS["SHINOBI"]["BASE_URL"]["data"]
-            if isinstance(SETTINGS["SHINOBI"]["PORT"], dict):
-                port = SETTINGS["SHINOBI"]["PORT"]["data"]
-            if isinstance(SETTINGS["SHINOBI"]["API_KEY"], dict):
-                api_key = SETTINGS["SHINOBI"]["API_KEY"]["data"]
-            if isinstance(SETTINGS["SHINOBI"]["GROUP_KEY"], dict):
-                group_key = SETTINGS["SHINOBI"]["GROUP_KEY"]["data"]
-            if isinstance(SETTINGS["SHINOGRAMMA"]["BANS"], dict):
-                bans = SETTINGS["SHINOGRAMMA"]["BANS"]["data"]
-            url = f"{base_url}:{port}/{api_key}/monitor/{group_key}"
-            data = await queryUrl(url=url)
-            if data:
-                dataInJson = data.json()
-                monitors = []
-                for i in dataInJson:
-                    var = f"mid_{i['mid']}"
-                    if bans:
-                        if var in bans.keys() and bans[var]:
-                            try:
-                                if chat_id in bans[var]:
-                                    continue
-                            except TypeError:
-                                if chat_id == bans[var]:
-                                    continue
-                            except Exception as e:
-                                logger.error(msg=f"Error verifyng BANS for monitors: {e}")
-                    monitors.append({"name": i["name"], "id": i["mid"]})
-                if len(monitors) > 0:
-                    buttons = []
-                    for monitor in monitors:
-                        buttons.append(
-                            [
-                                InlineKeyboardButton(
-                                    text=monitor["name"],
-                                    callback_data={
-                                        "tag": tag,
-                                        "mid": monitor["id"],
-                                        "choice": monitor["name"],
-                                    },
-                                )
-                            ]
-                        )
-                    reply_markup = InlineKeyboardMarkup(inline_keyboard=buttons)
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text="Select one monitor:",
-                        reply_markup=reply_markup,
-                    )
-                else:
-                    logger.debug(msg="No monitors found \u26A0\ufe0f")
-                    await context.bot.send_message(
-                        chat_id=chat_id, text="No monitors found \u26A0\ufe0f"
-                    )
-        return None
+) -> None:
+    if update.effective_chat:
+        tag = inspect.currentframe().f_code.co_name  # type: ignore
+        assert REGISTRY is not None
+        assert PERMISSIONS is not None
+        dataInJson = await REGISTRY.getAll(stale=True)
+        if dataInJson is not None:
+            permissions = PERMISSIONS.get(chatId=chat_id)
+            reply_markup = KEYBOARDS.get(
+                kind="monitors",
+                permissions=permissions.key,
+                version=REGISTRY.version(kind="monitors") or "",
+                build=lambda: monitorsKeyboard(
+                    tag=tag, monitors=permissions.visibleMonitors(monitors=dataInJson)
+                ),
+            )
+            if reply_markup is not None:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text="Select one monitor:",
+                    reply_markup=reply_markup,
+                )
+            else:
+                logger.debug(msg="No monitors found \u26A0\ufe0f")
+                await context.bot.send_message(
+                    chat_id=chat_id, text="No monitors found \u26A0\ufe0f"
+                )
+    return None
 
 
+@command(desc="Edit shinogramma settings")
+@traced
 @restricted
 async def BOTsettings_command(
     update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int
-) -> None | str:
-    if update is None and context is None and chat_id == 11111:
-        desc = "Edit shinogramma settings"
-        return desc
-    else:
-        if isinstance(SETTINGS["SHINOGRAMMA"]["BANS"], dict):
-            bans = SETTINGS["SHINOGRAMMA"]["BANS"]["data"]
-            authorized = True
-            if bans and "settings" in bans.keys():
-                try:
-                    if chat_id in bans["settings"]:
-                        authorized = False
-                except TypeError:
-                    if chat_id == bans["settings"]:
-                        authorized = False
-                except Exception as e:
-                    logger.error(msg=f"Error verifyng BANS for settings: {e}")
-            if authorized:
-                if update.effective_chat:
-                    tag = inspect.currentframe().f_code.co_name  # type: ignore
-                    keyboard = [
-                        [
-                            InlineKeyboardButton(
-                                text="Terminate",
-                                callback_data={
-                                    "tag": tag,
-                                    "choice": "terminate",
-                                },
-                            ),
-                            InlineKeyboardButton(
-                                text="Reboot",
-                                callback_data={
-                                    "tag": tag,
-                                    "choice": "reboot",
-                                },
-                            ),
-                        ]
-                    ]
-                    reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
-                    await context.bot.send_message(
-                        chat_id=chat_id, text="kjjhfoksj", reply_markup=reply_markup
-                    )
-        return None
+) -> None:
+    assert PERMISSIONS is not None
+    if PERMISSIONS.get(chatId=chat_id).settings:
+        if update.effective_chat:
+            tag = inspect.currentframe().f_code.co_name  # type: ignore
+            keyboard = [
+                [
+                    InlineKeyboardButton(
+                        text="Terminate",
+                        callback_data=pack(tag=tag, choice="terminate"),
+                    ),
+                    InlineKeyboardButton(
+                        text="Reboot",
+                        callback_data=pack(tag=tag, choice="reboot"),
+                    ),
+                ],
+                [
+                    InlineKeyboardButton(
+                        text="Stop profiler" if PROFILER and PROFILER.running else "Profile",
+                        callback_data=pack(tag=tag, choice="profile"),
+                    ),
+                    InlineKeyboardButton(
+                        text="Reload settings",
+                        callback_data=pack(tag=tag, choice="reload"),
+                    ),
+                ],
+            ]
+            reply_markup = InlineKeyboardMarkup(inline_keyboard=keyboard)
+            await context.bot.send_message(
+                chat_id=chat_id, text="kjjhfoksj", reply_markup=reply_markup
+            )
+    return None
 
 # End Telegram/Bot commands definition:
 
@@ -422,37 +473,15 @@ async def monitors_subcommand(
     if update.effective_chat:
         chat_id = update.effective_chat.id
         tag = inspect.currentframe().f_code.co_name  # type: ignore
-        choices = ["snapshot", "stream", "videos", "map", "configure"]
-        buttons = []
-        if isinstance(SETTINGS["SHINOGRAMMA"]["BANS"], dict):
-            bans = SETTINGS["SHINOGRAMMA"]["BANS"]["data"]
-            for choice in choices:
-                var = f"do_{choice}"
-                if bans:
-                    if var in bans.keys() and bans[var]:
-                        try:
-                            if chat_id in bans[var]:
-                                continue
-                        except TypeError as e:
-                            if chat_id == bans[var]:
-                                continue
-                        except Exception as e:
-                            logger.error(msg=f"Error verifyng BANS for monitors subcommand: {e}")
-                buttons.append(
-                    [
-                        InlineKeyboardButton(
-                            text=choice,
-                            callback_data={
-                                "tag": tag,
-                                "choice": choice,
-                                "mid": mid,
-                                "name": name
-                            },
-                        )
-                    ]
-                )
-    if len(buttons) > 0:
-        reply_markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+        assert PERMISSIONS is not None
+        permissions = PERMISSIONS.get(chatId=chat_id)
+        reply_markup = KEYBOARDS.get(
+            kind=f"monitor {mid}",
+            permissions=permissions.key,
+            version="",
+            build=lambda: actionsKeyboard(tag=tag, mid=mid, actions=permissions.actions),
+        )
+    if reply_markup is not None:
         await context.bot.send_message(
             chat_id=chat_id,
             text=f"<b>{name}</b>\nWhat do you want from this monitor?",
@@ -461,58 +490,52 @@ async def monitors_subcommand(
         )
 
 
+@traced
 @send_action(action=constants.ChatAction.TYPING)
 async def callback_handler(update: Update, context: CallbackContext) -> None:
     if update.effective_chat:
         chat_id = update.effective_chat.id
         query = update.callback_query
         if query is not None and query.data is not None:
-            if isinstance(query.data, dict):
-                if isinstance(SETTINGS["SHINOBI"]["BASE_URL"], dict):
-                    base_url = SETTINGS["SHINOBI"]["BASE_URL"]["data"]
-                if isinstance(SETTINGS["SHINOBI"]["PORT"], dict):
-                    port = SETTINGS["SHINOBI"]["PORT"]["data"]
-                if isinstance(SETTINGS["SHINOBI"]["API_KEY"], dict):
-                    api_key = SETTINGS["SHINOBI"]["API_KEY"]["data"]
-                if isinstance(SETTINGS["SHINOBI"]["GROUP_KEY"], dict):
-                    group_key = SETTINGS["SHINOBI"]["GROUP_KEY"]["data"]
-                callbackFullData: dict = query.data
+            callbackFullData = unpack(data=query.data) if isinstance(query.data, str) else None
+            if callbackFullData is not None:
+                callbackFullData = await findShortKeys(data=callbackFullData)
+            if callbackFullData is None:
+                await query.answer(
+                    text="This button is no longer valid, please repeat the command \u26A0\ufe0f",
+                    show_alert=True,
+                )
+            elif not allowedCallback(chatId=chat_id, data=callbackFullData):
+                logger.warning(msg=f"Unauthorized button, access denied for {chat_id}.")
+                await query.answer(text="Not allowed \u26D4", show_alert=True)
+            else:
+                assert SHINOBI is not None
                 logger.debug(msg=f"Callback received: {callbackFullData}")
                 tag = callbackFullData.get("tag")
                 mid = callbackFullData.get("mid", None)
                 choice = callbackFullData.get("choice", None)
-                name = callbackFullData.get("name", None)
                 operation = callbackFullData.get("operation", None)
                 if tag == "states_command":
-                    url = f"{base_url}:{port}/{api_key}/monitorStates/{group_key}/{choice}"
-                    data = await queryUrl(url=url)
-                    if data:
+                    assert PERMISSIONS is not None
+                    if not PERMISSIONS.get(chatId=chat_id).canState(name=choice):
+                        await query.answer(text="Not allowed \u26D4", show_alert=True)
+                    elif choice and await SHINOBI.activateState(name=choice):
                         await query.answer(text="OK, done \U0001F44D")
                 elif tag == "monitors_command":
                     await monitors_subcommand(
                         update=update,
                         context=context,
                         mid=mid,
-                        name=choice,
+                        name=await monitorName(mid=mid),
                     )
                 elif tag == "monitors_subcommand":
-                    if isinstance(SETTINGS["MONITOR"]["PROXY_PAGE_URL"], dict):
-                        proxyPageUrl = SETTINGS["MONITOR"]["PROXY_PAGE_URL"]["data"]
-                    if isinstance(SETTINGS["MONITOR"]["PROXY_PAGE_TIMEOUT"], dict):
-                        timeout = SETTINGS["MONITOR"]["PROXY_PAGE_TIMEOUT"]["data"]
-                        thisMonitor = Monitor(
-                            update=update,
-                            context=context,
-                            chatId=chat_id,
-                            baseUrl=base_url,
-                            port=port,
-                            apiKey=api_key,
-                            groupKey=group_key,
-                            mid=mid,
-                            name=name,
-                            proxyPageUrl=proxyPageUrl,
-                            proxyPageTimeout=timeout,
-                        )
+                    thisMonitor = buildMonitor(
+                        update=update,
+                        context=context,
+                        chatId=chat_id,
+                        mid=mid,
+                        name=await monitorName(mid=mid),
+                    )
                     if choice == "snapshot":
                         if not await thisMonitor.getSnapshot():
                             await context.bot.send_message(
@@ -532,7 +555,7 @@ async def callback_handler(update: Update, context: CallbackContext) -> None:
                     elif choice == "configure":
                         if context.user_data is not None:
                             context.user_data["from"] = choice
-                            context.user_data["monitor"] = thisMonitor
+                            context.user_data["monitor"] = mid
                             if update.effective_message is not None:
                                 await update.effective_message.reply_text(
                                     text="Which parameter do you want to change?"
@@ -547,7 +570,15 @@ async def callback_handler(update: Update, context: CallbackContext) -> None:
                                 text="Error something went wrong, requesting videos \u26A0\ufe0f",
                             )
                 elif tag == "getStream":
-                    subStream: SubStream = callbackFullData.get("subStream", None)
+                    subStream = SubStream(
+                        monitor=buildMonitor(
+                            update=update,
+                            context=context,
+                            chatId=chat_id,
+                            mid=mid,
+                            name=await monitorName(mid=mid),
+                        )
+                    )
                     try:
                         if not await subStream.verifySubStream():
                             if not await subStream.activateSubStream():
@@ -577,30 +608,10 @@ async def callback_handler(update: Update, context: CallbackContext) -> None:
                             ),
                             parse_mode=ParseMode.HTML,
                         )
-                        if not activeSubstreams:
-                            logger.debug(msg="No active substreams, adding new one")
-                            activeSubstreams[
-                                str(object=subStream.completeUrl)
-                            ] = {
-                                "identifier": {chat_id: [message.message_id]},
-                                "sub_stream": subStream,
-                            }
-                        else:
-                            activeSubstreamsCopy = activeSubstreams.copy()
-                            if subStream.completeUrl in activeSubstreamsCopy.keys():
-                                for key, value in activeSubstreamsCopy.items():
-                                    if subStream.completeUrl == key:
-                                        if not chat_id in value["identifier"].keys():
-                                            value["identifier"][chat_id] = [message.message_id]
-                                        else:
-                                            value["identifier"][chat_id].append(message.message_id)
-                            else:
-                                activeSubstreams[
-                                    str(object=subStream.completeUrl)
-                                ] = {
-                                    "identifier": {chat_id: [message.message_id]},
-                                    "sub_stream": subStream,
-                                }
+                        if WATCHER:
+                            WATCHER.track(
+                                subStream=subStream, chatId=chat_id, messageId=message.message_id
+                            )
                     except Exception as e:
                         logger.error(msg=f"Error activating substream: {e}")
 
@@ -609,16 +620,17 @@ async def callback_handler(update: Update, context: CallbackContext) -> None:
                         update=update,
                         context=context,
                         chatId=chat_id,
-                        baseUrl=base_url,
-                        port=port,
-                        apiKey=api_key,
-                        groupKey=group_key,
+                        client=SHINOBI,
+                        videos=VIDEOS,
                         mid=mid,
+                        uploader=UPLOADER,
+                        transcoder=TRANSCODER,
+                        fileIds=FILE_IDS,
                     )
-                    if choice is not None:
-                        index = int(choice)
-                        operation = callbackFullData.get("operation", None)
-                        await thisVideo.getVideo(index=index, operation=operation)
+                    cursor = callbackFullData.get("cursor", None)
+                    if cursor is not None:
+                        step = callbackFullData.get("step") or 0
+                        await thisVideo.getVideo(cursor=cursor, step=step, operation=operation)
                 elif tag == "BOTsettings_command":
                     if choice == "terminate":
                         await context.bot.send_message(
@@ -628,8 +640,154 @@ async def callback_handler(update: Update, context: CallbackContext) -> None:
                         # raise SystemExit
                         # await appShutdown()
                         # os.kill(os.getpid(), signal.SIGINT)
+                    elif choice == "profile":
+                        if PROFILER and PROFILER.running:
+                            PROFILER.stop()
+                            await query.answer(text="Stopping profiler...")
+                        else:
+                            assert isinstance(SETTINGS["SHINOGRAMMA"]["PROFILE_SECONDS"], dict)
+                            seconds = SETTINGS["SHINOGRAMMA"]["PROFILE_SECONDS"]["data"]
+                            await query.answer(text=f"Profiling for {seconds} seconds...")
+                            task = asyncio.create_task(
+                                coro=sendProfile(context=context, chatId=chat_id, seconds=seconds),
+                                name="Profiler",
+                            )
+                            BACKGROUND.add(task)
+                            task.add_done_callback(BACKGROUND.discard)
+                    elif choice == "reload":
+                        await query.answer(text="Reloading settings...")
+                        result = await reloadSettings()
+                        await context.bot.send_message(
+                            chat_id=chat_id, text=reloadReport(result=result)
+                        )
+
+
+async def sendProfile(context: CallbackContext, chatId: int, seconds: float) -> None:
+    global PROFILER
+    if PROFILER is None:
+        from tracing import Profiler
+        PROFILER = Profiler()
+    path = await PROFILER.run(seconds=seconds)
+    if path is not None:
+        await context.bot.send_message(
+            chat_id=chatId, text=f"Profile written to {path.resolve()} \U0001F4C8"
+        )
+
+
+def statesKeyboard(tag: str, states: list[str]) -> InlineKeyboardMarkup | None:
+    buttons = []
+    for state in states:
+        buttons.append([InlineKeyboardButton(text=state, callback_data=pack(tag=tag, choice=state))])
+    return InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
+
+
+def monitorsKeyboard(tag: str, monitors: list[dict]) -> InlineKeyboardMarkup | None:
+    buttons = [
+        [
+            InlineKeyboardButton(
+                text=monitor["name"],
+                callback_data=pack(tag=tag, mid=monitor["mid"]),
+            )
+        ]
+        for monitor in monitors
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
+
+
+def actionsKeyboard(tag: str, mid: str, actions: tuple[str, ...]) -> InlineKeyboardMarkup | None:
+    buttons = [
+        [
+            InlineKeyboardButton(
+                text=choice,
+                callback_data=pack(tag=tag, mid=mid, choice=choice),
+            )
+        ]
+        for choice in actions
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=buttons) if buttons else None
+
+
+def buildMonitor(
+    update: Update, context: CallbackContext, chatId: int, mid: str, name: str
+) -> Monitor:
+    assert isinstance(SETTINGS["MONITOR"]["PROXY_PAGE_URL"], dict)
+    assert isinstance(SETTINGS["MONITOR"]["PROXY_PAGE_TIMEOUT"], dict)
+    return Monitor(
+        update=update,
+        context=context,
+        chatId=chatId,
+        client=SHINOBI,
+        registry=REGISTRY,
+        videos=VIDEOS,
+        snapshots=SNAPSHOTS,
+        mid=mid,
+        name=name,
+        proxyPageUrl=SETTINGS["MONITOR"]["PROXY_PAGE_URL"]["data"],
+        proxyPageTimeout=SETTINGS["MONITOR"]["PROXY_PAGE_TIMEOUT"]["data"],
+    )
+
+
+async def monitorName(mid: str) -> str:
+    """
+    Buttons carry only the mid, the name comes from the monitors cache.
+    """
+    assert REGISTRY is not None
+    data = await REGISTRY.get(mid=mid)
+    if data and data.get("name"):
+        return data["name"]
+    return mid
+
+
+# action needed by the buttons sent by monitor and video
+BUTTON_ACTIONS: dict[str, str] = {"getStream": "stream", "getVideo": "videos"}
+
+def allowedCallback(chatId: int, data: dict) -> bool:
+    """Buttons may have been sent before bans changed, so they are checked when pressed"""
+    assert PERMISSIONS is not None
+    if not PERMISSIONS.isAllowed(chatId=chatId):
+        return False
+    permissions = PERMISSIONS.get(chatId=chatId)
+    tag = data.get("tag")
+    if data.get("mid") is not None and not permissions.canMonitor(mid=data["mid"]):
+        return False
+    if tag == "monitors_subcommand":
+        return permissions.canAction(action=data.get("choice"))
+    if tag in BUTTON_ACTIONS:
+        return permissions.canAction(action=BUTTON_ACTIONS[tag])
+    if tag == "BOTsettings_command":
+        return permissions.settings
+    return True
 
 
+async def findShortKeys(data: dict) -> dict | None:
+    """
+    Puts back the state names and mids that did not fit in their button in place of
+    their `shortKey`, filenames are found by the video cache.
+
+    Returns:
+        dict | None: `data`, None if a name can not be found anymore.
+    """
+    assert REGISTRY is not None
+    if isShortKey(value=data.get("mid")):
+        for monitor in await REGISTRY.getAll() or []:
+            if shortKey(value=monitor["mid"]) == data["mid"]:
+                data["mid"] = monitor["mid"]
+                break
+        else:
+            logger.error(msg="Monitor not found, maybe it has been deleted")
+            return None
+    if data["tag"] == "states_command" and isShortKey(value=data.get("choice")):
+        for state in await REGISTRY.getStates() or []:
+            if shortKey(value=state["name"]) == data["choice"]:
+                data["choice"] = state["name"]
+                break
+        else:
+            logger.error(msg="State not found, maybe it has been renamed or deleted")
+            return None
+    return data
+
+
+@traced
 @restricted
 async def handleTextConfigure(
     update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id = None
@@ -647,8 +805,15 @@ async def handleTextConfigure(
                     )
                 elif context.user_data["from"] == "handle":
                     context.user_data.pop("from")
-                    thisMonitor = context.user_data["monitor"]
+                    mid = context.user_data["monitor"]
                     context.user_data.pop("monitor")
+                    thisMonitor = buildMonitor(
+                        update=update,
+                        context=context,
+                        chatId=update.effective_message.chat_id,
+                        mid=mid,
+                        name=await monitorName(mid=mid),
+                    )
                     key = context.user_data["key"]
                     context.user_data.pop("key")
                     value = user_text
@@ -656,38 +821,17 @@ async def handleTextConfigure(
 
 
 def parseForCommands():
-    frame = inspect.currentframe()
-    assert frame is not None
-    command_functions = [
-        obj
-        for name, obj in frame.f_globals.items()
-        if inspect.isfunction(object=obj) and name.endswith("_command")
-    ]
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop=loop)
-    for function in command_functions:
-        desc = loop.run_until_complete(future=function(update=None, context=None))
-        command = function.__name__.split(sep="_")[0]
-        name = function.__name__
-        if not desc:
-            logger.warning(msg=f"{function.__name__} function has no description...")
-            fullDesc = "/" + command
-        else:
-            fullDesc = "/" + command + " - " + desc
-        data = {"func": function, "name": name, "command": command, "desc": fullDesc}
-        commands.append(data)
-    commandJustForLog = ", ".join(c["command"] for i, c in enumerate(iterable=commands))
+    registered = {command["name"] for command in commands}
+    for name, obj in globals().items():
+        if inspect.isfunction(object=obj) and name.endswith("_command") and name not in registered:
+            logger.warning(msg=f"{name} function is not registered with @command, ignoring it...")
+    commandJustForLog = ", ".join(c["command"] for c in commands)
     logger.debug(msg=f"List of active commands: {commandJustForLog}")
 
 def buildApp() -> bool:
     global APPLICATION
-    try:
-        # Required by pipreqs in the place of python-telegram-bot[callback-data]
-        import cachetools  # type: ignore
-
-    except ImportError:
-        logger.critical(msg="Cachetools module not found")
-        return False
+    assert isinstance(SETTINGS["TELEGRAM"]["API_KEY"], dict)
+    setKey(secret=SETTINGS["TELEGRAM"]["API_KEY"]["data"])
     assert isinstance(SETTINGS["SHINOGRAMMA"]["PERSISTENCE"], dict)
     if SETTINGS['SHINOGRAMMA']['PERSISTENCE']["data"]:
         APPLICATION = startWithPersistence()
@@ -712,19 +856,21 @@ def buildApp() -> bool:
 
 
 def startWithPersistence() -> Application:
+    from sqlitePersistence import SqlitePersistence
     assert isinstance(SETTINGS["TELEGRAM"]["API_KEY"], dict)
     myPersistenceInput = PersistenceInput(
-        bot_data=False, chat_data=False, user_data=False, callback_data=True
+        bot_data=False, chat_data=False, user_data=True, callback_data=False
     )
-    myPersistence = PicklePersistence(
-        filepath=".persistence", store_data=myPersistenceInput
+    myPersistence = SqlitePersistence(
+        path=PERSISTENCE_FILE, store_data=myPersistenceInput
     )
     logger.info(msg="Starting with persistence")
     application = (
         ApplicationBuilder()
         .token(token=SETTINGS['TELEGRAM']['API_KEY']["data"])
+        .request(request=TimedRequest(connection_pool_size=256))
+        .get_updates_request(get_updates_request=TimedRequest())
         .persistence(persistence=myPersistence)
-        .arbitrary_callback_data(arbitrary_callback_data=True)
         .build()
     )
     return application
@@ -736,63 +882,293 @@ def startWithoutPersistence() -> Application:
     application = (
         ApplicationBuilder()
         .token(token=SETTINGS['TELEGRAM']['API_KEY']["data"])
-        .arbitrary_callback_data(arbitrary_callback_data=True)
+        .request(request=TimedRequest(connection_pool_size=256))
+        .get_updates_request(get_updates_request=TimedRequest())
         .build()
     )
     return application
 
 
+def buildPermissions() -> None:
+    global PERMISSIONS
+    assert isinstance(SETTINGS["TELEGRAM"]["CHAT_ID"], dict)
+    assert isinstance(SETTINGS["SHINOGRAMMA"]["BANS"], dict)
+    # a whole new index is assigned, handlers never see a half built one
+    PERMISSIONS = PermissionIndex(
+        chatIds=SETTINGS["TELEGRAM"]["CHAT_ID"]["data"],
+        bans=SETTINGS["SHINOGRAMMA"]["BANS"]["data"],
+    )
+    KEYBOARDS.clear()
+
+
+def buildShinobiClient() -> None:
+    global SHINOBI, REGISTRY, VIDEOS, SNAPSHOTS, WATCHER, UPLOADER, TRANSCODER, FILE_IDS
+    from fileIdCache import FileIdCache
+    from substreamWatcher import SubstreamWatcher
+    assert isinstance(SETTINGS["SHINOBI"]["BASE_URL"], dict)
+    assert isinstance(SETTINGS["SHINOBI"]["PORT"], dict)
+    assert isinstance(SETTINGS["SHINOBI"]["API_KEY"], dict)
+    assert isinstance(SETTINGS["SHINOBI"]["GROUP_KEY"], dict)
+    assert isinstance(SETTINGS["HTTP"]["HTTP2"], dict)
+    assert isinstance(SETTINGS["HTTP"]["MAX_CONNECTIONS"], dict)
+    assert isinstance(SETTINGS["HTTP"]["KEEPALIVE_EXPIRY"], dict)
+    assert isinstance(SETTINGS["HTTP"]["TIMEOUT"], dict)
+    SHINOBI = ShinobiClient(
+        baseUrl=SETTINGS["SHINOBI"]["BASE_URL"]["data"],
+        port=SETTINGS["SHINOBI"]["PORT"]["data"],
+        apiKey=SETTINGS["SHINOBI"]["API_KEY"]["data"],
+        groupKey=SETTINGS["SHINOBI"]["GROUP_KEY"]["data"],
+        http2=SETTINGS["HTTP"]["HTTP2"]["data"],
+        maxConnections=SETTINGS["HTTP"]["MAX_CONNECTIONS"]["data"],
+        keepaliveExpiry=SETTINGS["HTTP"]["KEEPALIVE_EXPIRY"]["data"],
+        timeout=SETTINGS["HTTP"]["TIMEOUT"]["data"],
+    )
+    assert isinstance(SETTINGS["CACHE"]["MONITORS_TTL"], dict)
+    REGISTRY = MonitorRegistry(
+        client=SHINOBI, ttl=SETTINGS["CACHE"]["MONITORS_TTL"]["data"]
+    )
+    assert isinstance(SETTINGS["VIDEO"]["PAGE_SIZE"], dict)
+    assert isinstance(SETTINGS["VIDEO"]["MAX_PAGES"], dict)
+    assert isinstance(SETTINGS["VIDEO"]["TTL"], dict)
+    VIDEOS = VideoCache(
+        client=SHINOBI,
+        pageSize=SETTINGS["VIDEO"]["PAGE_SIZE"]["data"],
+        maxPages=SETTINGS["VIDEO"]["MAX_PAGES"]["data"],
+        ttl=SETTINGS["VIDEO"]["TTL"]["data"],
+    )
+    assert isinstance(SETTINGS["FILE_IDS"]["FILE"], dict)
+    assert isinstance(SETTINGS["FILE_IDS"]["MAX_VIDEOS"], dict)
+    assert isinstance(SETTINGS["FILE_IDS"]["MAX_PHOTOS"], dict)
+    FILE_IDS = FileIdCache(
+        path=Path(SETTINGS["FILE_IDS"]["FILE"]["data"]) if SETTINGS["FILE_IDS"]["FILE"]["data"] else None,
+        maxVideos=SETTINGS["FILE_IDS"]["MAX_VIDEOS"]["data"],
+        maxPhotos=SETTINGS["FILE_IDS"]["MAX_PHOTOS"]["data"],
+    )
+    SNAPSHOTS = SnapshotService(
+        client=SHINOBI, registry=REGISTRY, ttl=REGISTRY.ttl, fileIds=FILE_IDS
+    )
+    assert isinstance(SETTINGS["UPLOAD"]["ENABLED"], dict)
+    assert isinstance(SETTINGS["UPLOAD"]["UPLOADS"], dict)
+    assert isinstance(SETTINGS["UPLOAD"]["MAX_BYTES"], dict)
+    assert isinstance(SETTINGS["UPLOAD"]["CHUNK_SIZE"], dict)
+    assert isinstance(SETTINGS["UPLOAD"]["TIMEOUT"], dict)
+    if SETTINGS["UPLOAD"]["ENABLED"]["data"]:
+        from upload import VideoUploader
+        UPLOADER = VideoUploader(
+            client=SHINOBI,
+            uploads=SETTINGS["UPLOAD"]["UPLOADS"]["data"],
+            maxBytes=SETTINGS["UPLOAD"]["MAX_BYTES"]["data"],
+            chunkSize=SETTINGS["UPLOAD"]["CHUNK_SIZE"]["data"],
+            timeout=SETTINGS["UPLOAD"]["TIMEOUT"]["data"],
+        )
+    assert isinstance(SETTINGS["TRANSCODE"]["ENABLED"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["FFMPEG"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["WORKERS"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["DIRECTORY"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["CACHE_BYTES"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["TARGET_BYTES"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["MAX_HEIGHT"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["MAX_BITRATE"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["MAX_SECONDS"], dict)
+    assert isinstance(SETTINGS["TRANSCODE"]["TIMEOUT"], dict)
+    if UPLOADER and SETTINGS["TRANSCODE"]["ENABLED"]["data"]:
+        from transcode import Transcoder
+        TRANSCODER = Transcoder(
+            ffmpeg=SETTINGS["TRANSCODE"]["FFMPEG"]["data"],
+            workers=SETTINGS["TRANSCODE"]["WORKERS"]["data"],
+            directory=SETTINGS["TRANSCODE"]["DIRECTORY"]["data"],
+            cacheBytes=SETTINGS["TRANSCODE"]["CACHE_BYTES"]["data"],
+            # previews must fit the upload
+            targetBytes=min(
+                SETTINGS["TRANSCODE"]["TARGET_BYTES"]["data"], UPLOADER.maxBytes
+            ),
+            maxHeight=SETTINGS["TRANSCODE"]["MAX_HEIGHT"]["data"],
+            maxBitrate=SETTINGS["TRANSCODE"]["MAX_BITRATE"]["data"],
+            maxSeconds=SETTINGS["TRANSCODE"]["MAX_SECONDS"]["data"],
+            timeout=SETTINGS["TRANSCODE"]["TIMEOUT"]["data"],
+        )
+        if not TRANSCODER:
+            TRANSCODER = None
+    assert isinstance(SETTINGS["SHINOGRAMMA"]["VERIFY_ACTIVE_LINKS_TIMEOUT"], dict)
+    assert isinstance(SETTINGS["SHINOGRAMMA"]["VERIFY_ACTIVE_LINKS_MIN_TIMEOUT"], dict)
+    WATCHER = SubstreamWatcher(
+        registry=REGISTRY,
+        maxInterval=SETTINGS["SHINOGRAMMA"]["VERIFY_ACTIVE_LINKS_TIMEOUT"]["data"],
+        minInterval=SETTINGS["SHINOGRAMMA"]["VERIFY_ACTIVE_LINKS_MIN_TIMEOUT"]["data"],
+    )
+
+
 def notifyServerStart() -> None:
-    if isinstance(SETTINGS["TELEGRAM"]["CHAT_ID"], dict):
-        chat_id = SETTINGS["TELEGRAM"]["CHAT_ID"]["data"]
-    if isinstance(SETTINGS["SHINOGRAMMA"]["BANS"], dict):
-        bans = SETTINGS["SHINOGRAMMA"]["BANS"]["data"]
-    if isinstance(SETTINGS["SHINOBI"]["BASE_URL"], dict):
-        base_url = SETTINGS["SHINOBI"]["BASE_URL"]["data"]
-    if isinstance(SETTINGS["SHINOBI"]["PORT"], dict):
-        shinobiPort = SETTINGS["SHINOBI"]["PORT"]["data"]
-    if isinstance(SETTINGS["SHINOBI"]["API_KEY"], dict):
-        api_key = SETTINGS["SHINOBI"]["API_KEY"]["data"]
-    if isinstance(SETTINGS["SHINOBI"]["GROUP_KEY"], dict):
-        group_key = SETTINGS["SHINOBI"]["GROUP_KEY"]["data"]
+    from notify import WebhookServer
     if isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS"], dict):
         webhooks = SETTINGS["WEBHOOK"]["WEBHOOKS"]["data"]
     if isinstance(SETTINGS["WEBHOOK"]["REQUESTS_RATE_LIMIT"], dict):
         requestsRateLimit = SETTINGS["WEBHOOK"]["REQUESTS_RATE_LIMIT"]["data"]
     if isinstance(SETTINGS["WEBHOOK"]["PORT"], dict):
         port = SETTINGS["WEBHOOK"]["PORT"]["data"]
-    list1: list = chat_id
-    if "to_notify" in bans.keys():
-        if isinstance(bans["to_notify"], list):
-            list2 = bans["to_notify"]
-        else:
-            list2 = [bans["to_notify"]]
-        toNotify = [item for item in list1 if item not in list2]
-    else:
-        toNotify = list1
+    if isinstance(SETTINGS["WEBHOOK"]["RATE_LIMIT_BURST"], dict):
+        rateLimitBurst = SETTINGS["WEBHOOK"]["RATE_LIMIT_BURST"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["RATE_LIMIT_BY_TAG"], dict):
+        rateLimitByTag = SETTINGS["WEBHOOK"]["RATE_LIMIT_BY_TAG"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["COALESCE_EVENTS"], dict):
+        coalesceEvents = SETTINGS["WEBHOOK"]["COALESCE_EVENTS"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["TELEGRAM_GLOBAL_RATE"], dict):
+        telegramGlobalRate = SETTINGS["WEBHOOK"]["TELEGRAM_GLOBAL_RATE"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["TELEGRAM_CHAT_INTERVAL"], dict):
+        telegramChatInterval = SETTINGS["WEBHOOK"]["TELEGRAM_CHAT_INTERVAL"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["SEND_RETRIES"], dict):
+        sendRetries = SETTINGS["WEBHOOK"]["SEND_RETRIES"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["QUEUE_SIZE"], dict):
+        queueSize = SETTINGS["WEBHOOK"]["QUEUE_SIZE"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["WORKERS"], dict):
+        workers = SETTINGS["WEBHOOK"]["WORKERS"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["OVERFLOW_POLICY"], dict):
+        overflowPolicy = SETTINGS["WEBHOOK"]["OVERFLOW_POLICY"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["JOURNAL"], dict):
+        journal = SETTINGS["WEBHOOK"]["JOURNAL"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["JOURNAL_FLUSH_INTERVAL"], dict):
+        journalFlushInterval = SETTINGS["WEBHOOK"]["JOURNAL_FLUSH_INTERVAL"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS_TIMEOUT"], dict):
+        webhooksTimeout = SETTINGS["WEBHOOK"]["WEBHOOKS_TIMEOUT"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS_RETRIES"], dict):
+        webhooksRetries = SETTINGS["WEBHOOK"]["WEBHOOKS_RETRIES"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["SERVER"], dict):
+        notifier = SETTINGS["WEBHOOK"]["SERVER"]["data"]
+    if isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS_COOLDOWN"], dict):
+        webhooksCooldown = SETTINGS["WEBHOOK"]["WEBHOOKS_COOLDOWN"]["data"]
+    assert PERMISSIONS is not None
+    toNotify = list(PERMISSIONS.toNotify)
     global SERVERAPI
     SERVERAPI = WebhookServer(
-        baseUrl=base_url,
-        shinobiPort=shinobiPort,
-        shinobiApiKey=api_key,
-        groupKey=group_key,
+        client=SHINOBI,
+        registry=REGISTRY,
+        snapshots=SNAPSHOTS,
         webhooks=webhooks,
         port=port,
         requestsRateLimit=requestsRateLimit,
         toNotify=toNotify,
         application=APPLICATION,
+        rateLimitBurst=rateLimitBurst,
+        rateLimitByTag=rateLimitByTag,
+        coalesceEvents=coalesceEvents,
+        telegramGlobalRate=telegramGlobalRate,
+        telegramChatInterval=telegramChatInterval,
+        sendRetries=sendRetries,
+        queueSize=queueSize,
+        workers=workers,
+        overflowPolicy=overflowPolicy,
+        journal=journal,
+        journalFlushInterval=journalFlushInterval,
+        webhooksTimeout=webhooksTimeout,
+        webhooksRetries=webhooksRetries,
+        webhooksCooldown=webhooksCooldown,
+        notifier=notifier,
     )
 
+def applySettings(groups: set[str]) -> None:
+    """Rebuilds what depends on the HOT_SETTINGS `groups` that changed"""
+    if "permissions" in groups:
+        buildPermissions()
+        if SERVERAPI:
+            assert PERMISSIONS is not None
+            SERVERAPI.toNotify = list(PERMISSIONS.toNotify)
+    if "logFile" in groups:
+        applyLogSettings()
+    if "logLevel" in groups:
+        setLogLevel()
+    if "tracing" in groups:
+        assert isinstance(SETTINGS["SHINOGRAMMA"]["SLOW_UPDATE"], dict)
+        setSlowThreshold(seconds=SETTINGS["SHINOGRAMMA"]["SLOW_UPDATE"]["data"])
+    if SERVERAPI and "webhooks" in groups:
+        assert isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS"], dict)
+        assert isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS_TIMEOUT"], dict)
+        assert isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS_RETRIES"], dict)
+        assert isinstance(SETTINGS["WEBHOOK"]["WEBHOOKS_COOLDOWN"], dict)
+        SERVERAPI.webhooks.configure(
+            webhooks=SETTINGS["WEBHOOK"]["WEBHOOKS"]["data"],
+            timeout=SETTINGS["WEBHOOK"]["WEBHOOKS_TIMEOUT"]["data"],
+            retries=SETTINGS["WEBHOOK"]["WEBHOOKS_RETRIES"]["data"],
+            cooldown=SETTINGS["WEBHOOK"]["WEBHOOKS_COOLDOWN"]["data"],
+        )
+    if SERVERAPI and "limiter" in groups:
+        assert isinstance(SETTINGS["WEBHOOK"]["REQUESTS_RATE_LIMIT"], dict)
+        assert isinstance(SETTINGS["WEBHOOK"]["RATE_LIMIT_BURST"], dict)
+        assert isinstance(SETTINGS["WEBHOOK"]["RATE_LIMIT_BY_TAG"], dict)
+        assert isinstance(SETTINGS["WEBHOOK"]["COALESCE_EVENTS"], dict)
+        SERVERAPI.requestsRateLimit = SETTINGS["WEBHOOK"]["REQUESTS_RATE_LIMIT"]["data"]
+        SERVERAPI.limiter.configure(
+            interval=SETTINGS["WEBHOOK"]["REQUESTS_RATE_LIMIT"]["data"],
+            burst=SETTINGS["WEBHOOK"]["RATE_LIMIT_BURST"]["data"],
+            byTag=SETTINGS["WEBHOOK"]["RATE_LIMIT_BY_TAG"]["data"],
+            coalesce=SETTINGS["WEBHOOK"]["COALESCE_EVENTS"]["data"],
+        )
+
+async def reloadSettings() -> tuple[list[str], list[str]] | None:
+    """
+    Reads the config file again and applies the HOT_SETTINGS that changed, the others
+    keep their value until the next restart.
+    Returns:
+        tuple | None: the settings applied and those needing a restart, None if the
+        config file could not be read.
+    """
+    async with reloadLock:
+        fresh = copy.deepcopy(SETTINGS_TEMPLATE)
+        mySettings = IniSettings(neededSettings=fresh, configFile=CONFIG_FILE)
+        # a bad config file leaves the running settings untouched
+        if not await asyncio.to_thread(mySettings.iniRead):
+            logger.error(msg="Error reading settings from config file, keeping the current ones")
+            return None
+        hot = {key: group for group, keys in HOT_SETTINGS.items() for key in keys}
+        applied: list[str] = []
+        restartNeeded: list[str] = []
+        groups: set[str] = set()
+        for section, keys in fresh.items():
+            for key, value in keys.items():
+                current = SETTINGS.get(section, {}).get(key)
+                if not isinstance(value, dict) or not isinstance(current, dict):
+                    continue
+                if value["data"] == current["data"]:
+                    continue
+                group = hot.get((section, key))
+                if group is None:
+                    restartNeeded.append(f"{section}.{key}")
+                    continue
+                current["data"] = value["data"]
+                applied.append(f"{section}.{key}")
+                groups.add(group)
+        applySettings(groups=groups)
+        if applied:
+            logger.info(msg=f"Settings reloaded: {', '.join(applied)}")
+        else:
+            logger.info(msg="Settings reloaded, nothing to apply")
+        if restartNeeded:
+            logger.warning(msg=f"Restart needed to apply {', '.join(restartNeeded)}")
+        return applied, restartNeeded
+
+def reloadReport(result: tuple[list[str], list[str]] | None) -> str:
+    if result is None:
+        return "Config file not valid, settings unchanged \u26A0\ufe0f"
+    applied, restartNeeded = result
+    text = "Settings reloaded \U0001F44D\n"
+    text += f"Applied: {', '.join(applied) or 'nothing changed'}"
+    if restartNeeded:
+        text += f"\nRestart needed for: {', '.join(restartNeeded)}"
+    return text
+
 async def starter(app: Application) -> None:
     loop = asyncio.get_event_loop()
     taskList: list[asyncio.tasks.Task] = []
     await app.initialize()
     await app.start()
-    taskList.append(
-        asyncio.create_task(
-            coro=removeInactiveSubstreamLinks(), name="removeInactiveSubstreamLinks"
+    if FILE_IDS:
+        await FILE_IDS.open()
+    if REGISTRY:
+        await REGISTRY.warm()
+    taskList.append(asyncio.create_task(coro=measureLoopLag(), name="LoopLag"))
+    if WATCHER:
+        taskList.append(
+            asyncio.create_task(coro=WATCHER.run(bot=app.bot), name="SubstreamWatcher")
         )
-    )
     if app.updater:
         taskList.append(asyncio.create_task(coro=app.updater.start_polling(drop_pending_updates=True), name="Polling"))
     if SERVERAPI:
@@ -806,11 +1182,18 @@ async def starter(app: Application) -> None:
                     logger.error(msg="Webhook server not ready, start Shinogramma whitout it")
                     break
                 await asyncio.sleep(delay=1)
+    bootMark(phase="start")
+    reportBoot()
     for signame in ("SIGINT", "SIGTERM"):
         loop.add_signal_handler(
             sig=getattr(signal, signame),
             callback=lambda: asyncio.create_task(coro=appShutdown(), name="Shutdown"),
         )
+    if hasattr(signal, "SIGHUP"):
+        loop.add_signal_handler(
+            sig=signal.SIGHUP,
+            callback=lambda: asyncio.create_task(coro=reloadSettings(), name="Reload"),
+        )
     if await shutdownEvent.wait():
         await appShutdown()
 
@@ -825,66 +1208,51 @@ async def appShutdown() -> None:
                 await APPLICATION.updater.stop()
                 await APPLICATION.stop()
                 await APPLICATION.shutdown()
+        if SHINOBI:
+            await SHINOBI.close()
+        if UPLOADER:
+            await UPLOADER.close()
+        if FILE_IDS:
+            await FILE_IDS.close()
+        await closeClient()
     else:
         shutdownEvent.set()
 
-async def removeInactiveSubstreamLinks() -> None:
-    """
-    Periodically checks for inactive substreams and removes them, deleting the associated Telegram message.
-
-    This function runs indefinitely and is intended to be used as a task with asyncio.create_task()
-    """
-    while True:
-        try:
-            if activeSubstreams:
-                activeSubstreamsCopy = activeSubstreams.copy()
-                # logger.debug(msg = f"There are {len(activeSubstreamsCopy)} active substreams:\n")
-                for key, value in activeSubstreamsCopy.items():
-                    # logger.debug(msg=f"{key} active in {len(value['identifier'].keys())} chat")
-                    # for chat_id in value["identifier"].keys():
-                    #     logger.debug(msg=f"chat_id: {chat_id}")
-                    #     for message_id in value["identifier"][chat_id]:
-                    #         logger.debug(msg=f"message_id: {message_id}")
-                    subStream: SubStream = value["sub_stream"]
-                    # logger.debug(msg=activeSubstreamsCopy)
-                    if not await subStream.verifySubStream():
-                        for chatID, messageList in value["identifier"].items():
-                            logger.debug(msg=f"chat id: {chatID} has {len(messageList)} messages")
-                            if isinstance(APPLICATION, Application):
-                                for message in messageList:
-                                    await APPLICATION.bot.delete_message(chat_id=chatID, message_id=message)
-                        del activeSubstreams[key]
-                        logger.debug(msg=f"Substream {subStream.completeUrl} now inactive, link removed")
-            if isinstance(SETTINGS["SHINOGRAMMA"]["VERIFY_ACTIVE_LINKS_TIMEOUT"], dict):
-                await asyncio.sleep(delay=SETTINGS["SHINOGRAMMA"]["VERIFY_ACTIVE_LINKS_TIMEOUT"]["data"])
-        except Exception as e:
-            logger.error(msg=f"Error in loop removing inactive substreams: {e}")
-
 
 if __name__ == "__main__":
+    bootMark(phase="imports")
     mySettings = IniSettings(neededSettings=SETTINGS, configFile=CONFIG_FILE)
     if not mySettings.iniRead():
         logger.critical(
             msg="Error building and/or retrieving settings from config file, exiting..."
         )
         raise SystemExit
+    applyLogSettings()
     setLogLevel()
+    bootMark(phase="settings")
+    assert isinstance(SETTINGS["SHINOGRAMMA"]["SLOW_UPDATE"], dict)
+    setSlowThreshold(seconds=SETTINGS["SHINOGRAMMA"]["SLOW_UPDATE"]["data"])
     assert isinstance(SETTINGS["TELEGRAM"]["CHAT_ID"], dict)
     if not len(SETTINGS['TELEGRAM']['CHAT_ID']["data"]) > 0:
         logger.warning(
             msg="Chat_id not defined, this could be very dangerous, continuing..."
         )
     parseForCommands()
+    buildPermissions()
+    buildShinobiClient()
     if not buildApp():
         logger.critical(
             msg="Error building BOT app, exiting..."
         )
         raise SystemExit
+    bootMark(phase="app")
     logger.info(msg="ShinogrammaBot Up and running")
     if APPLICATION:
         assert isinstance(SETTINGS["WEBHOOK"]["SERVER"], dict)
-        if SETTINGS["WEBHOOK"]["SERVER"]["data"]:
-            from notify import WebhookServer
+        assert isinstance(SETTINGS["WEBHOOK"]["METRICS"], dict)
+        if SETTINGS["WEBHOOK"]["SERVER"]["data"] or SETTINGS["WEBHOOK"]["METRICS"]["data"]:
             notifyServerStart()
+            bootMark(phase="server")
         asyncio.run(main=starter(app=APPLICATION))
     logger.info(msg="ShinogrammaBot terminated")
+    stopLogging()
@@ -0,0 +1,110 @@
+import logging
+import hashlib
+import time
+from shinobiClient import ShinobiClient
+from monitorRegistry import MonitorRegistry
+from typing import Any, TYPE_CHECKING
+if TYPE_CHECKING:
+    from fileIdCache import FileIdCache
+
+logger = logging.getLogger(name=__name__)
+'''
+When jpeg api is not enabled for a specific monitor, shinobi sends an image as
+placeholder, below constants with the value of its hash and its size in bytes.
+Only images of that size are hashed; while the size is unknown (None) every snapshot
+is hashed until the placeholder is first seen.
+'''
+PLACEHOLDERMD5 = "2a7127c16b2389474c41bc112618462f"
+PLACEHOLDER_SIZE: int | None = None
+
+class SnapshotService:
+    """
+    A class representing the single place where monitor snapshots are fetched, shared
+    by snapshot requests and notifications.
+    Bytes are downloaded once and handed to Telegram directly, monitors whose JPEG API
+    is disabled are remembered so they are not asked again until `ttl` expires.
+    Snapshots identical to one already sent are sent by file_id.
+    """
+    def __init__(
+        self, client: ShinobiClient, registry: MonitorRegistry, ttl: float = 30,
+        fileIds: "FileIdCache | None" = None,
+    ) -> None:
+        self.CLIENT = client
+        self.REGISTRY = registry
+        self.FILE_IDS = fileIds
+        self.ttl = ttl
+        # size of the placeholder, learned the first time it is seen if not known
+        self.placeholderSize: int | None = PLACEHOLDER_SIZE
+        # mid -> time the JPEG API was found disabled
+        self.disabled: dict[str, float] = {}
+
+    def isPlaceholder(self, content: bytes) -> bool:
+        """
+        Images of a size other than the placeholder's are never hashed, once the size is
+        known (see PLACEHOLDER_SIZE); until then every image is hashed.
+        """
+        if self.placeholderSize is not None and len(content) != self.placeholderSize:
+            return False
+        if hashlib.md5(content).hexdigest() == PLACEHOLDERMD5:
+            self.placeholderSize = len(content)
+            return True
+        return False
+
+    def forget(self, mid: str) -> None:
+        self.disabled.pop(mid, None)
+
+    def _setDisabled(self, mid: str) -> None:
+        logger.info(msg=f"Jpeg API not active on monitor {mid}")
+        self.disabled[mid] = time.monotonic()
+
+    async def isDisabled(self, mid: str) -> bool:
+        disabledTime = self.disabled.get(mid)
+        if disabledTime is not None:
+            if time.monotonic() - disabledTime < self.ttl:
+                return True
+            self.forget(mid=mid)
+        monitor = await self.REGISTRY.get(mid=mid)
+        if monitor and monitor.get("details", {}).get("snap") != "1":
+            self._setDisabled(mid=mid)
+            return True
+        return False
+
+    async def get(self, mid: str) -> bytes | None:
+        """
+        Returns:
+            bytes | None: the JPEG snapshot of `mid`, None if not available.
+        """
+        if await self.isDisabled(mid=mid):
+            return None
+        content = await self.CLIENT.getSnapshot(mid=mid)
+        if not content:
+            logger.error(msg=f"Error something went wrong requesting snapshot of {mid}")
+            return None
+        if self.isPlaceholder(content=content):
+            self._setDisabled(mid=mid)
+            return None
+        return content
+
+    def photo(self, content: bytes) -> str | bytes:
+        """
+        What to send for snapshot `content`: its file_id if Telegram has it already.
+        """
+        if self.FILE_IDS is None:
+            return content
+        return self.FILE_IDS.getPhoto(content=content) or content
+
+    def remember(self, content: bytes, sent: Any) -> None:
+        if self.FILE_IDS is None:
+            return
+        from fileIdCache import fileIdOf
+        fileId = fileIdOf(sent=sent)
+        if fileId:
+            self.FILE_IDS.putPhoto(content=content, fileId=fileId)
+
+    def forgetPhoto(self, content: bytes) -> None:
+        if self.FILE_IDS is not None:
+            self.FILE_IDS.forgetPhoto(content=content)
+
+
+if __name__ == "__main__":
+    raise SystemExit
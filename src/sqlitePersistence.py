@@ -0,0 +1,203 @@
+import logging
+import asyncio
+import hashlib
+import json
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(name=__name__)
+
+class SqlitePersistence(BasePersistence):
+    """
+    A class representing bot persistence stored in SQLite, one row per user, chat,
+    conversation key...
+    Only rows whose content changed since they were last read or written are saved,
+    changes are grouped for `debounce` seconds and written in a single transaction.
+    Every kind of data is read only when the application asks for it.
+    """
+    def __init__(
+        self,
+        path: Path,
+        store_data: PersistenceInput | None = None,
+        update_interval: float = 60,
+        debounce: float = 1,
+        callbackTtl: float = 7 * 24 * 3600,
+    ) -> None:
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.path = path
+        self.debounce = debounce
+        self.callbackTtl = callbackTtl
+        self.connection: sqlite3.Connection | None = None
+        # (kind, key) -> hash of the content on disk
+        self.hashes: dict[tuple[str, str], bytes] = {}
+        # (kind, key) -> pickled content to write, None to delete
+        self.pending: dict[tuple[str, str], bytes | None] = {}
+        self.writer: asyncio.Task | None = None
+        self.writeLock = asyncio.Lock()
+        self.writes: int = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(database=self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS data ("
+                "kind TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, "
+                "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+            )
+            self.connection.commit()
+        return self.connection
+
+    def _read(self, kind: str) -> list[tuple[str, bytes]]:
+        return self._connect().execute(
+            "SELECT key, value FROM data WHERE kind = ?", (kind,)
+        ).fetchall()
+
+    async def _load(self, kind: str) -> dict[str, Any]:
+        rows = await asyncio.to_thread(self._read, kind)
+        result = {}
+        for key, blob in rows:
+            try:
+                result[key] = pickle.loads(blob)
+            except Exception as e:
+                logger.error(msg=f"Discarding unreadable {kind} data {key}: {e}")
+                continue
+            self.hashes[(kind, key)] = hashlib.blake2b(blob, digest_size=16).digest()
+        logger.debug(msg=f"Loaded {len(result)} {kind} entries")
+        return result
+
+    def _set(self, kind: str, key: str, value: Any) -> None:
+        blob = pickle.dumps(value)
+        digest = hashlib.blake2b(blob, digest_size=16).digest()
+        if self.hashes.get((kind, key)) == digest:
+            return
+        self.hashes[(kind, key)] = digest
+        self.pending[(kind, key)] = blob
+        self._schedule()
+
+    def _drop(self, kind: str, key: str) -> None:
+        self.hashes.pop((kind, key), None)
+        self.pending[(kind, key)] = None
+        self._schedule()
+
+    def _schedule(self) -> None:
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.create_task(coro=self._debounced(), name="SqlitePersistence")
+
+    async def _debounced(self) -> None:
+        # changes made while writing find this task running, they are written next
+        while True:
+            await asyncio.sleep(delay=self.debounce)
+            # a flush cancelling this task must not interrupt a write in progress
+            if not await asyncio.shield(self._write()) or not self.pending:
+                return
+
+    def _commit(self, changes: dict[tuple[str, str], bytes | None]) -> None:
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO data (kind, key, value) VALUES (?, ?, ?)",
+                [(kind, key, blob) for (kind, key), blob in changes.items() if blob is not None],
+            )
+            connection.executemany(
+                "DELETE FROM data WHERE kind = ? AND key = ?",
+                [(kind, key) for (kind, key), blob in changes.items() if blob is None],
+            )
+
+    async def _write(self) -> bool:
+        """
+        Returns:
+            bool: False if the changes could not be written.
+        """
+        async with self.writeLock:
+            if not self.pending:
+                return True
+            changes, self.pending = self.pending, {}
+            try:
+                await asyncio.to_thread(self._commit, changes)
+                self.writes += 1
+                logger.debug(msg=f"Persisted {len(changes)} changed entries")
+                return True
+            except Exception as e:
+                logger.error(msg=f"Error writing persistence, retrying on next change: {e}")
+                for change, blob in changes.items():
+                    self.pending.setdefault(change, blob)
+                    self.hashes.pop(change, None)
+                return False
+
+    async def get_user_data(self) -> dict[int, dict[Any, Any]]:
+        return {int(key): value for key, value in (await self._load(kind="user")).items()}
+
+    async def get_chat_data(self) -> dict[int, dict[Any, Any]]:
+        return {int(key): value for key, value in (await self._load(kind="chat")).items()}
+
+    async def get_bot_data(self) -> dict[Any, Any]:
+        return (await self._load(kind="bot")).get("", {})
+
+    async def get_callback_data(self) -> tuple[list[tuple[str, float, dict[str, Any]]], dict[str, str]] | None:
+        return (await self._load(kind="callback")).get("")
+
+    async def get_conversations(self, name: str) -> dict[tuple[int | str, ...], object]:
+        return {
+            tuple(json.loads(s=key)): value
+            for key, value in (await self._load(kind=f"conversation:{name}")).items()
+        }
+
+    async def update_user_data(self, user_id: int, data: dict[Any, Any]) -> None:
+        self._set(kind="user", key=str(object=user_id), value=data)
+
+    async def update_chat_data(self, chat_id: int, data: dict[Any, Any]) -> None:
+        self._set(kind="chat", key=str(object=chat_id), value=data)
+
+    async def update_bot_data(self, data: dict[Any, Any]) -> None:
+        self._set(kind="bot", key="", value=data)
+
+    async def update_callback_data(self, data: tuple[list[tuple[str, float, dict[str, Any]]], dict[str, str]]) -> None:
+        buttons, queries = data
+        # entries of keyboards older than callbackTtl are not worth keeping
+        oldest = time.time() - self.callbackTtl
+        fresh = [entry for entry in buttons if entry[1] >= oldest]
+        if len(fresh) != len(buttons):
+            keyboards = {entry[0] for entry in fresh}
+            queries = {query: keyboard for query, keyboard in queries.items() if keyboard in keyboards}
+        self._set(kind="callback", key="", value=(fresh, queries))
+
+    async def update_conversation(self, name: str, key: tuple[int | str, ...], new_state: object | None) -> None:
+        jsonKey = json.dumps(obj=list(key))
+        if new_state is None:
+            self._drop(kind=f"conversation:{name}", key=jsonKey)
+        else:
+            self._set(kind=f"conversation:{name}", key=jsonKey, value=new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._drop(kind="user", key=str(object=user_id))
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._drop(kind="chat", key=str(object=chat_id))
+
+    async def refresh_user_data(self, user_id: int, user_data: dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict[Any, Any]) -> None:
+        pass
+
+    async def flush(self) -> None:
+        if self.writer and not self.writer.done():
+            self.writer.cancel()
+            await asyncio.gather(self.writer, return_exceptions=True)
+        await self._write()
+        if self.connection:
+            await asyncio.to_thread(self.connection.close)
+            self.connection = None
+
+
+if __name__ == "__main__":
+    raise SystemExit
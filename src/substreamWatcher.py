@@ -0,0 +1,120 @@
+import logging
+import asyncio
+import time
+from typing import Any
+from telegram import Bot, error
+from monitorRegistry import MonitorRegistry
+from monitor import SubStream
+from metrics import Gauge
+
+logger = logging.getLogger(name=__name__)
+ACTIVE = Gauge(
+    name="shinogramma_active_substreams", help="Substreams whose links are in the chats"
+)
+
+class SubstreamWatcher:
+    """
+    A class representing the links to active substreams sent to the chats, removed
+    as soon as their substream becomes inactive.
+    Every check asks Shinobi once for all the monitors of the group; recently
+    activated substreams are checked every `minInterval` seconds, then less and less
+    often up to `maxInterval`.
+    """
+    # Telegram limit of messages deleted with a single request
+    DELETE_CHUNK = 100
+    def __init__(
+        self, registry: MonitorRegistry, maxInterval: float = 60, minInterval: float = 5
+    ) -> None:
+        self.REGISTRY = registry
+        self.maxInterval = maxInterval
+        self.minInterval = min(minInterval, maxInterval)
+        # substream url -> {"sub_stream", "identifier": {chat id: [message ids]}, "since"}
+        self.active: dict[str, dict[str, Any]] = {}
+        self.wakeUp = asyncio.Event()
+        ACTIVE.function = lambda: len(self.active)
+
+    def track(self, subStream: SubStream, chatId: int | str, messageId: int) -> None:
+        url = str(object=subStream.completeUrl)
+        entry = self.active.get(url)
+        if entry is None:
+            logger.debug(msg="New active substream, tracking it")
+            self.active[url] = {
+                "identifier": {chatId: [messageId]},
+                "sub_stream": subStream,
+                "since": time.monotonic(),
+            }
+        else:
+            entry["identifier"].setdefault(chatId, []).append(messageId)
+        # the new link may need an earlier check than the one scheduled
+        self.wakeUp.set()
+
+    def nextInterval(self) -> float:
+        """
+        The youngest substream decides: checks are as frequent as half its age, within
+        `minInterval` and `maxInterval`.
+        """
+        if not self.active:
+            return self.maxInterval
+        youngest = time.monotonic() - max(entry["since"] for entry in self.active.values())
+        return min(self.maxInterval, max(self.minInterval, youngest / 2))
+
+    async def check(self, bot: Bot) -> None:
+        if not self.active:
+            return
+        monitors = await self.REGISTRY.getAll(refresh=True)
+        if monitors is None:
+            logger.error(msg="Error something went wrong requesting monitors data.")
+            return
+        byMid = {monitor.get("mid"): monitor for monitor in monitors}
+        toDelete: dict[int | str, list[int]] = {}
+        for url, entry in list(self.active.items()):
+            subStream: SubStream = entry["sub_stream"]
+            data = byMid.get(subStream.monitor.MID)
+            if data and await subStream.verifySubStream(data=data):
+                continue
+            for chatId, messageList in entry["identifier"].items():
+                toDelete.setdefault(chatId, []).extend(messageList)
+            del self.active[url]
+            logger.debug(msg=f"Substream {url} now inactive, removing link")
+        if toDelete:
+            await asyncio.gather(
+                *(
+                    self.deleteMessages(bot=bot, chatId=chatId, messageIds=messageIds)
+                    for chatId, messageIds in toDelete.items()
+                )
+            )
+
+    async def deleteMessages(self, bot: Bot, chatId: int | str, messageIds: list[int]) -> None:
+        logger.debug(msg=f"chat id: {chatId} has {len(messageIds)} messages")
+        for start in range(0, len(messageIds), self.DELETE_CHUNK):
+            try:
+                await bot.delete_messages(
+                    chat_id=chatId, message_ids=messageIds[start:start + self.DELETE_CHUNK]
+                )
+            except error.TelegramError as e:
+                logger.error(msg=f"Error deleting substream links in chat {chatId}: {e}")
+
+    async def run(self, bot: Bot) -> None:
+        """
+        Checks the substreams forever, it is intended to be used as a task with
+        asyncio.create_task()
+        """
+        while True:
+            try:
+                await self.check(bot=bot)
+            except Exception as e:
+                logger.error(msg=f"Error in loop removing inactive substreams: {e}")
+            checked = time.monotonic()
+            while True:
+                self.wakeUp.clear()
+                remaining = self.nextInterval() - (time.monotonic() - checked)
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(fut=self.wakeUp.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+
+if __name__ == "__main__":
+    raise SystemExit
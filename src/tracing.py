@@ -0,0 +1,147 @@
+import logging
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(name=__name__)
+'''
+Spans are recorded only while an update is being handled, outside of a trace
+`span` costs a context variable lookup.
+'''
+_trace: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+# updates slower than this (in seconds) are logged with their spans
+slowThreshold: float = 2
+
+def setSlowThreshold(seconds: float) -> None:
+    global slowThreshold
+    slowThreshold = seconds
+
+
+class Trace:
+    """
+    A class representing the time spent handling one update, with the spans of the
+    calls made meanwhile to Shinobi, Telegram and other urls.
+    """
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.started = time.monotonic()
+        self.duration: float = 0
+        # (name, start offset, duration)
+        self.spans: list[tuple[str, float, float]] = []
+
+    def finish(self) -> None:
+        self.duration = time.monotonic() - self.started
+
+    def breakdown(self) -> str:
+        lines = [f"{self.name} took {self.duration * 1000:.0f}ms"]
+        for name, offset, duration in self.spans:
+            lines.append(f"  +{offset * 1000:.0f}ms {name} {duration * 1000:.0f}ms")
+        spent = sum(duration for _, _, duration in self.spans)
+        lines.append(f"  {spent * 1000:.0f}ms waiting for calls (may overlap)")
+        return "\n".join(lines)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, started - trace.started, time.monotonic() - started))
+
+
+def traced(func):
+    """Traces the handling of an update by `func`, logging it when slow."""
+    @wraps(wrapped=func)
+    async def wrapped(update, context, *args, **kwargs):
+        trace = Trace(name=func.__name__)
+        token = _trace.set(trace)
+        try:
+            return await func(update, context, *args, **kwargs)
+        finally:
+            _trace.reset(token)
+            trace.finish()
+            if trace.duration >= slowThreshold:
+                logger.warning(msg=f"Slow update: {trace.breakdown()}")
+            else:
+                logger.debug(msg=trace.breakdown())
+    return wrapped
+
+
+class Profiler:
+    """
+    A class representing a sampling profiler of the thread running the event loop,
+    writing a folded stacks file that flamegraph.pl or speedscope can read.
+    """
+    def __init__(self, directory: Path = Path("."), interval: float = 0.005) -> None:
+        self.directory = directory
+        self.interval = interval
+        self.stopEvent = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.samples: Counter[str] = Counter()
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def _sample(self, threadId: int, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while not self.stopEvent.is_set() and time.monotonic() < deadline:
+            frame = sys._current_frames().get(threadId)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def _write(self) -> Path:
+        path = self.directory / f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+        with open(file=path, mode="w") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+        return path
+
+    async def run(self, seconds: float) -> Path | None:
+        """
+        Samples the calling thread for `seconds` (or until `stop`).
+        Returns:
+            Path | None: the profile written, None if a profile was already running.
+        """
+        if self.running:
+            return None
+        self.stopEvent.clear()
+        self.samples = Counter()
+        self.thread = threading.Thread(
+            target=self._sample,
+            args=(threading.get_ident(), seconds),
+            name="Profiler",
+            daemon=True,
+        )
+        self.thread.start()
+        logger.info(msg=f"Profiling for {seconds} seconds...")
+        await asyncio.to_thread(self.thread.join)
+        path = await asyncio.to_thread(self._write)
+        logger.info(msg=f"Profile of {sum(self.samples.values())} samples written to {path}")
+        return path
+
+    def stop(self) -> None:
+        self.stopEvent.set()
+
+
+if __name__ == "__main__":
+    raise SystemExit
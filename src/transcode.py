@@ -0,0 +1,226 @@
+import logging
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from mediaSettings import TranscodeSettings
+from metrics import Gauge, Histogram
+
+logger = logging.getLogger(name=__name__)
+'''
+Recordings too big for Telegram are turned into previews by ffmpeg: downscaled,
+bitrate capped so they fit the target size, and cut to their first MAX_SECONDS.
+ffmpeg reads the recording from Shinobi and runs as a separate process, at most
+WORKERS at a time, so the event loop only waits for the process to end.
+'''
+TRANSCODE_SECONDS = Histogram(
+    name="shinogramma_transcode_seconds",
+    help="Duration of video previews made by ffmpeg",
+    buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+PREVIEWS_BYTES = Gauge(
+    name="shinogramma_previews_cache_bytes",
+    help="Bytes of video previews kept on disk",
+)
+
+class PreviewCache:
+    """
+    A class representing previews kept on disk, keyed by (mid, filename, profile),
+    the least recently used are deleted when they take more than `maxBytes`.
+    Use times are the files modification times, so the order survives restarts.
+    """
+    SUFFIX = ".mp4"
+    def __init__(self, directory: Path, maxBytes: int) -> None:
+        self.directory = directory
+        self.maxBytes = maxBytes
+        # file name -> size, least recently used first
+        self.files: OrderedDict[str, int] = OrderedDict()
+        self.size: int = 0
+        PREVIEWS_BYTES.function = lambda: self.size
+
+    def load(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.directory.iterdir():
+            if path.suffix != self.SUFFIX:
+                # previews left half written by a stop
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            found.append((stat.st_mtime, path.name, stat.st_size))
+        self.files.clear()
+        for _, name, size in sorted(found):
+            self.files[name] = size
+        self.size = sum(self.files.values())
+        logger.debug(msg=f"{len(self.files)} previews found, {self.size} bytes")
+        self.evict()
+
+    def path(self, key: tuple[str, str, str]) -> Path:
+        name = hashlib.sha1("/".join(key).encode()).hexdigest()
+        return self.directory / f"{name}{self.SUFFIX}"
+
+    def temporary(self, key: tuple[str, str, str]) -> Path:
+        return self.path(key=key).with_suffix(".part")
+
+    def get(self, key: tuple[str, str, str]) -> Path | None:
+        path = self.path(key=key)
+        if path.name not in self.files:
+            return None
+        if not path.exists():
+            self.size -= self.files.pop(path.name)
+            return None
+        self.files.move_to_end(key=path.name)
+        os.utime(path=path)
+        return path
+
+    def put(self, key: tuple[str, str, str], temporary: Path) -> Path:
+        """
+        Moves the finished `temporary` file in the cache.
+        """
+        path = self.path(key=key)
+        temporary.replace(target=path)
+        self.size -= self.files.pop(path.name, 0)
+        self.files[path.name] = path.stat().st_size
+        self.size += self.files[path.name]
+        self.evict(keep=path.name)
+        return path
+
+    def evict(self, keep: str | None = None) -> None:
+        for name in list(self.files):
+            if self.size <= self.maxBytes:
+                break
+            if name == keep:
+                continue
+            (self.directory / name).unlink(missing_ok=True)
+            self.size -= self.files.pop(name)
+            logger.debug(msg=f"Preview {name} evicted")
+
+
+class Transcoder:
+    """
+    A class representing the ffmpeg processes making previews of the recordings too
+    big for Telegram, each preview is made once even if asked by many users.
+    """
+    # settings live in a light module so they can be read without importing transcode
+    SETTINGS = TranscodeSettings.SETTINGS
+    def __init__(
+        self,
+        ffmpeg: str = "ffmpeg",
+        workers: int = 1,
+        directory: str = ".previews",
+        cacheBytes: int = 1073741824,
+        targetBytes: int = 45000000,
+        maxHeight: int = 480,
+        maxBitrate: int = 1500,
+        maxSeconds: int = 120,
+        timeout: float = 600,
+    ) -> None:
+        self.ffmpeg = shutil.which(cmd=ffmpeg)
+        if self.ffmpeg is None:
+            logger.warning(msg=f"{ffmpeg} not found, videos too big are sent as links")
+        self.workers = asyncio.Semaphore(value=max(1, workers))
+        self.cache = PreviewCache(directory=Path(directory), maxBytes=cacheBytes)
+        self.targetBytes = targetBytes
+        self.maxHeight = maxHeight
+        self.maxBitrate = maxBitrate
+        self.maxSeconds = maxSeconds
+        self.timeout = timeout
+        self.profile = f"{maxHeight}p-{maxBitrate}k-{maxSeconds}s-{targetBytes}"
+        self._inflight: dict[tuple[str, str, str], asyncio.Task] = {}
+        if self.ffmpeg is not None:
+            try:
+                self.cache.load()
+            except OSError as e:
+                logger.error(msg=f"Error opening previews directory {directory}: {e}")
+                self.ffmpeg = None
+
+    def __bool__(self) -> bool:
+        return self.ffmpeg is not None
+
+    def bitrate(self, seconds: float | None) -> int:
+        """
+        The video bitrate (in kbit/s) filling the target size in `seconds`, capped.
+        """
+        if self.maxSeconds and (not seconds or seconds > self.maxSeconds):
+            seconds = self.maxSeconds
+        if not seconds:
+            return self.maxBitrate
+        # 5% left to the container
+        fitting = int(self.targetBytes * 8 * 0.95 / seconds / 1000)
+        return max(100, min(self.maxBitrate, fitting))
+
+    async def preview(self, mid: str, fileName: str, url: str, seconds: float | None = None) -> Path | None:
+        """
+        Returns:
+            Path | None: the preview of recording `fileName` of `mid`, read from `url`
+            and lasting `seconds`, None if it could not be made.
+        """
+        if self.ffmpeg is None:
+            return None
+        key = (mid, fileName, self.profile)
+        path = self.cache.get(key=key)
+        if path is not None:
+            return path
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(
+                coro=self._transcode(key=key, url=url, seconds=seconds), name="Transcode"
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _transcode(self, key: tuple[str, str, str], url: str, seconds: float | None) -> Path | None:
+        assert self.ffmpeg is not None
+        temporary = self.cache.temporary(key=key)
+        bitrate = self.bitrate(seconds=seconds)
+        command = [self.ffmpeg, "-nostdin", "-loglevel", "error", "-y"]
+        if self.maxSeconds:
+            command += ["-t", str(object=self.maxSeconds)]
+        command += [
+            "-i", url,
+            "-vf", f"scale=-2:'min({self.maxHeight},ih)'",
+            "-c:v", "libx264", "-preset", "veryfast",
+            "-b:v", f"{bitrate}k", "-maxrate", f"{bitrate}k", "-bufsize", f"{bitrate * 2}k",
+            "-an", "-movflags", "+faststart",
+            "-fs", str(object=self.targetBytes),
+            "-f", "mp4", str(object=temporary),
+        ]
+        async with self.workers:
+            started = time.monotonic()
+            logger.debug(msg=f"Making preview of {key[0]}->{key[1]} at {bitrate}k")
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                _, stderr = await asyncio.wait_for(fut=process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                logger.error(msg=f"Preview of {key[0]}->{key[1]} took longer than {self.timeout}s")
+                temporary.unlink(missing_ok=True)
+                return None
+            except asyncio.CancelledError:
+                process.kill()
+                temporary.unlink(missing_ok=True)
+                raise
+            finally:
+                TRANSCODE_SECONDS.observe(time.monotonic() - started)
+        if process.returncode != 0 or not temporary.exists():
+            logger.error(
+                msg=f"Error making preview of {key[0]}->{key[1]}: {stderr.decode(errors='replace').strip()}"
+            )
+            temporary.unlink(missing_ok=True)
+            return None
+        path = self.cache.put(key=key, temporary=temporary)
+        logger.debug(msg=f"Preview of {key[0]}->{key[1]} ready, {path.stat().st_size} bytes")
+        return path
+
+
+if __name__ == "__main__":
+    raise SystemExit
@@ -0,0 +1,228 @@
+import logging
+import asyncio
+import json
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable
+import httpx
+from shinobiClient import ShinobiClient
+from mediaSettings import UploadSettings
+from metrics import Gauge, Histogram, TELEGRAM_LATENCY, TELEGRAM_ERRORS
+from tracing import span
+
+logger = logging.getLogger(name=__name__)
+'''
+Recordings are streamed from Shinobi straight into a multipart sendVideo request, a
+chunk at a time, so Telegram never has to reach Shinobi and the bot never holds a
+whole file in memory. Telegram accepts uploads up to 50 MB (20 MB when given a url).
+'''
+UPLOAD_SECONDS = Histogram(
+    name="shinogramma_video_upload_seconds",
+    help="Duration of video uploads to Telegram, waiting in the lane included",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+UPLOADS_WAITING = Gauge(
+    name="shinogramma_video_uploads_waiting",
+    help="Video uploads waiting for a free upload lane",
+)
+
+class VideoUploader:
+    """
+    A class representing the upload lanes of recorded videos to Telegram: at most
+    `uploads` at a time, over their own connections so big files never hold up the
+    bot replies.
+    """
+    # settings live in a light module so they can be read without importing upload
+    SETTINGS = UploadSettings.SETTINGS
+    def __init__(
+        self,
+        client: ShinobiClient,
+        uploads: int = 2,
+        maxBytes: int = 52428800,
+        chunkSize: int = 262144,
+        timeout: float = 120,
+    ) -> None:
+        self.CLIENT = client
+        self.maxBytes = maxBytes
+        self.chunkSize = chunkSize
+        self.timeout = timeout
+        self.lane = asyncio.Semaphore(value=max(1, uploads))
+        self.waiting: int = 0
+        self._client: httpx.AsyncClient | None = None
+        UPLOADS_WAITING.function = lambda: self.waiting
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(timeout=self.timeout, connect=10)
+            )
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    def fits(self, size: Any) -> bool:
+        """
+        Unknown sizes are tried, the upload stops if they turn out too big.
+        """
+        return not isinstance(size, (int, float)) or size <= self.maxBytes
+
+    async def _body(
+        self, chunks: AsyncIterator[bytes], head: bytes, tail: bytes
+    ) -> AsyncIterator[bytes]:
+        yield head
+        sent = 0
+        async for chunk in chunks:
+            sent += len(chunk)
+            if sent > self.maxBytes:
+                raise ValueError(f"video bigger than {self.maxBytes} bytes")
+            yield chunk
+        yield tail
+
+    async def _readFile(self, path: Path) -> AsyncIterator[bytes]:
+        with path.open(mode="rb") as file:
+            while chunk := await asyncio.to_thread(file.read, self.chunkSize):
+                yield chunk
+
+    async def sendVideo(
+        self, baseUrl: str, chatId: int, mid: str, fileName: str, **fields: Any
+    ) -> dict | None:
+        """
+        Uploads recording `fileName` of `mid` to `chatId` with sendVideo, `fields` are
+        its other parameters (caption, parse_mode, reply_markup...).
+        `baseUrl` is the bot api url with the token, as Bot.base_url.
+        Returns:
+            dict | None: the message sent, as returned by Telegram, None on failure.
+        """
+        return await self._inLane(
+            upload=lambda: self._upload(
+                baseUrl=baseUrl, chatId=chatId, mid=mid, fileName=fileName, fields=fields
+            )
+        )
+
+    async def sendFile(self, baseUrl: str, chatId: int, path: Path, **fields: Any) -> dict | None:
+        """
+        Uploads the local video at `path` to `chatId`, as sendVideo.
+        """
+        return await self._inLane(
+            upload=lambda: self._uploadFile(baseUrl=baseUrl, chatId=chatId, path=path, fields=fields)
+        )
+
+    async def _inLane(self, upload: Callable[[], Awaitable[dict | None]]) -> dict | None:
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.lane.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            return await upload()
+        finally:
+            self.lane.release()
+            UPLOAD_SECONDS.observe(time.monotonic() - started)
+
+    def _multipart(self, chatId: int, fileName: str, fields: dict[str, Any]) -> tuple[str, bytes, bytes]:
+        boundary = uuid.uuid4().hex
+        head = b""
+        for name, value in {"chat_id": chatId, **fields}.items():
+            if value is None:
+                continue
+            if hasattr(value, "to_json"):
+                value = value.to_json()
+            elif isinstance(value, bool):
+                value = json.dumps(obj=value)
+            head += (
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n"
+            ).encode()
+        head += (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="video"; '
+            f'filename="{fileName}"\r\nContent-Type: video/mp4\r\n\r\n'
+        ).encode()
+        tail = f"\r\n--{boundary}--\r\n".encode()
+        return boundary, head, tail
+
+    async def _post(
+        self, baseUrl: str, name: str, body: AsyncIterator[bytes], boundary: str, length: int | None
+    ) -> dict | None:
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        if length is not None:
+            headers["Content-Length"] = str(object=length)
+        started = time.monotonic()
+        try:
+            with span(name="telegram sendVideo"):
+                response = await self.client.post(
+                    url=f"{baseUrl}/sendVideo", content=body, headers=headers
+                )
+        except Exception:
+            TELEGRAM_ERRORS.labels("sendVideo").inc()
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels("sendVideo").observe(time.monotonic() - started)
+        try:
+            answer = response.json()
+        except ValueError:
+            answer = {}
+        if response.status_code != 200 or not answer.get("ok"):
+            TELEGRAM_ERRORS.labels("sendVideo").inc()
+            logger.error(
+                msg=f"Error {response.status_code} uploading video {name}: {answer.get('description')}"
+            )
+            return None
+        logger.debug(msg=f"Video {name} uploaded")
+        return answer.get("result")
+
+    async def _uploadFile(self, baseUrl: str, chatId: int, path: Path, fields: dict[str, Any]) -> dict | None:
+        boundary, head, tail = self._multipart(chatId=chatId, fileName=path.name, fields=fields)
+        try:
+            size = path.stat().st_size
+            if size > self.maxBytes:
+                logger.info(msg=f"Video {path} too big to upload ({size} bytes)")
+                return None
+            return await self._post(
+                baseUrl=baseUrl,
+                name=str(object=path),
+                body=self._body(chunks=self._readFile(path=path), head=head, tail=tail),
+                boundary=boundary,
+                length=len(head) + size + len(tail),
+            )
+        except (httpx.HTTPError, OSError, ValueError) as e:
+            logger.error(msg=f"Error uploading video {path}: {e}")
+            return None
+
+    async def _upload(
+        self, baseUrl: str, chatId: int, mid: str, fileName: str, fields: dict[str, Any]
+    ) -> dict | None:
+        boundary, head, tail = self._multipart(chatId=chatId, fileName=fileName, fields=fields)
+        try:
+            async with self.CLIENT.streamVideo(mid=mid, fileName=fileName) as source:
+                if source.status_code != 200:
+                    logger.error(msg=f"Error {source.status_code} downloading video {mid}->{fileName}")
+                    return None
+                length = source.headers.get("content-length", "")
+                if source.headers.get("content-encoding", "identity") != "identity":
+                    # the length is the one of the encoded body, the video is sent decoded
+                    length = ""
+                if length.isdigit() and int(length) > self.maxBytes:
+                    logger.info(msg=f"Video {mid}->{fileName} too big to upload ({length} bytes)")
+                    return None
+                return await self._post(
+                    baseUrl=baseUrl,
+                    name=f"{mid}->{fileName}",
+                    body=self._body(
+                        chunks=source.aiter_bytes(chunk_size=self.chunkSize), head=head, tail=tail
+                    ),
+                    boundary=boundary,
+                    length=len(head) + int(length) + len(tail) if length.isdigit() else None,
+                )
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(msg=f"Error uploading video {mid}->{fileName}: {e}")
+            return None
+
+
+if __name__ == "__main__":
+    raise SystemExit
@@ -1,57 +1,337 @@
 import logging
 import inspect
-from httpQueryUrl import queryUrl
+import time
+import asyncio
+from shinobiClient import ShinobiClient
+from callbackData import pack, shortKey, isShortKey
+from metrics import Gauge
 from telegram import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
+    constants,
     error,
 )
 from datetime import datetime
+from typing import Any, TYPE_CHECKING
 import humanize
+if TYPE_CHECKING:
+    # built, and imported, only when enabled in settings
+    from upload import VideoUploader
+    from transcode import Transcoder
+    from fileIdCache import FileIdCache
 
 logger = logger = logging.getLogger(name=__name__)
+# previews being made and sent, referenced until done
+_previews: set[asyncio.Task] = set()
+HIT_RATIO = Gauge(
+    name="shinogramma_videos_cache_hit_ratio",
+    help="Share of video lookups answered without asking Shinobi",
+)
+
+def cursorTime(fileName: str) -> str | None:
+    """
+    Shinobi names recordings after their start time, e.g. 2024-01-31T12-30-00.mp4,
+    this returns the same time in ISO format (2024-01-31T12:30:00).
+    """
+    stem = fileName.rsplit(".", 1)[0]
+    day, sep, clock = stem.partition("T")
+    if not sep:
+        return None
+    isoTime = f"{day}T{clock.replace('-', ':')}"
+    try:
+        datetime.fromisoformat(isoTime)
+    except ValueError:
+        return None
+    return isoTime
+
+
+class VideoWindow:
+    """
+    A class representing a cached, contiguous slice of the videos of one monitor,
+    newest first as Shinobi returns them.
+    Pages are fetched with Shinobi time range parameters so the window can grow
+    in both directions without downloading the whole list.
+    """
+    def __init__(self, client: ShinobiClient, mid: str, pageSize: int, maxPages: int) -> None:
+        self.CLIENT = client
+        self.MID = mid
+        self.pageSize = pageSize
+        self.maxSize = pageSize * maxPages
+        self.videos: list[dict] = []
+        self.fetchTime: float = 0
+        self.anchored: bool = False  # videos[0] is the newest video on Shinobi
+        self.complete: bool = False  # videos[-1] is the oldest video on Shinobi
+        self.total: int | None = None
+        # times of the newest videos dropped from the top, to fetch them back exactly
+        self.trimmed: list[str] = []
+        # windows are shared by all users, a load must not change the videos another
+        # load is computing its page from
+        self.loading = asyncio.Lock()
+
+    async def _query(self, **params) -> list[dict] | None:
+        params["limit"] = str(object=self.pageSize)
+        data = await self.CLIENT.getVideos(mid=self.MID, params=params)
+        if data is None:
+            logger.error(msg=f"Error something went wrong requesting videos of {self.MID}")
+            return None
+        if isinstance(data.get("total"), int):
+            self.total = data["total"]
+        self.fetchTime = time.monotonic()
+        return data.get("videos") or []
+
+    def indexOf(self, cursor: str) -> int | None:
+        for index, video in enumerate(iterable=self.videos):
+            if video.get("filename") == cursor:
+                return index
+        return None
+
+    def remove(self, cursor: str) -> None:
+        index = self.indexOf(cursor=cursor)
+        if index is not None:
+            del self.videos[index]
+            if self.total:
+                self.total -= 1
+
+    async def loadNewest(self) -> bool:
+        async with self.loading:
+            return await self._loadNewest()
+
+    async def loadAround(self, cursor: str) -> bool:
+        """
+        Rebuilds the window starting from `cursor` and going back in time.
+        """
+        async with self.loading:
+            return await self._loadAround(cursor=cursor)
+
+    async def loadOlder(self) -> bool:
+        async with self.loading:
+            return await self._loadOlder()
+
+    async def loadNewer(self) -> bool:
+        async with self.loading:
+            return await self._loadNewer()
+
+    async def _loadNewest(self) -> bool:
+        videos = await self._query()
+        if videos is None:
+            return False
+        self.videos = videos
+        self.trimmed = []
+        self.anchored = True
+        self.complete = len(videos) < self.pageSize
+        return True
+
+    async def _loadAround(self, cursor: str) -> bool:
+        cursorIsoTime = cursorTime(fileName=cursor)
+        if cursorIsoTime is None:
+            return await self._loadNewest()
+        videos = await self._query(end=cursorIsoTime, endOperator="<=", endIsStartTo="1")
+        if videos is None:
+            return False
+        self.videos = videos
+        self.trimmed = []
+        self.anchored = False
+        self.complete = len(videos) < self.pageSize
+        return True
+
+    async def _loadOlder(self) -> bool:
+        if self.complete or not self.videos:
+            return False
+        videos = await self._query(
+            end=self.videos[-1]["time"], endOperator="<", endIsStartTo="1"
+        )
+        if videos is None:
+            return False
+        self.complete = len(videos) < self.pageSize
+        self.videos.extend(videos)
+        if len(self.videos) > self.maxSize:
+            dropped = len(self.videos) - self.maxSize
+            self.trimmed.append(self.videos[0]["time"])
+            del self.videos[:dropped]
+            self.anchored = False
+        return bool(videos)
+
+    async def _loadNewer(self) -> bool:
+        if not self.videos:
+            return await self._loadNewest()
+        newest = self.videos[0]["time"]
+        if self.trimmed:
+            # a trimmed block is never bigger than a page, so it comes back whole
+            videos = await self._query(
+                start=newest, startOperator=">", end=self.trimmed.pop(), endIsStartTo="1"
+            )
+            anchored = False
+        else:
+            videos = await self._query(start=newest, startOperator=">")
+            anchored = videos is not None and len(videos) < self.pageSize
+            attempts = self.maxSize // self.pageSize
+            # Shinobi pages newest first, a full page may not touch our window so
+            # the range is narrowed until the page adjacent to it is found
+            while videos and len(videos) >= self.pageSize:
+                if attempts == 0:
+                    logger.debug(msg=f"Video window of {self.MID} restarted from newest videos")
+                    return await self._loadNewest()
+                attempts -= 1
+                older = await self._query(
+                    start=newest, startOperator=">",
+                    end=videos[-1]["time"], endOperator="<", endIsStartTo="1",
+                )
+                if older is None:
+                    return False
+                if not older:
+                    break
+                videos = older
+        if videos is None:
+            return False
+        self.videos[:0] = videos
+        if len(self.videos) > self.maxSize:
+            del self.videos[self.maxSize :]
+            self.complete = False
+        self.anchored = anchored
+        return bool(videos)
+
+
+class VideoCache:
+    """
+    A class representing the video windows of all monitors.
+    """
+    # Required settings for this class, you can use "INCLUDE" in settings module
+    SETTINGS: dict[str, object | dict[str, Any]] = {
+        "PAGE_SIZE": {"data": 20, "typeOf": int, "required": False},
+        "MAX_PAGES": {"data": 10, "typeOf": int, "required": False},
+        "TTL": {"data": 60, "typeOf": float, "required": False}, # in seconds
+    }
+    def __init__(
+        self, client: ShinobiClient, pageSize: int = 20, maxPages: int = 10, ttl: float = 60
+    ) -> None:
+        self.CLIENT = client
+        self.pageSize = pageSize
+        self.maxPages = maxPages
+        self.ttl = ttl
+        self.windows: dict[str, VideoWindow] = {}
+        self.hits: int = 0
+        self.misses: int = 0
+        HIT_RATIO.function = lambda: self.hits / max(1, self.hits + self.misses)
+
+    def window(self, mid: str) -> VideoWindow:
+        window = self.windows.get(mid)
+        if window is None:
+            window = VideoWindow(
+                client=self.CLIENT, mid=mid, pageSize=self.pageSize, maxPages=self.maxPages
+            )
+            self.windows[mid] = window
+        return window
+
+    def isFresh(self, window: VideoWindow) -> bool:
+        return bool(window.videos) and time.monotonic() - window.fetchTime < self.ttl
+
+    async def newest(self, mid: str) -> VideoWindow | None:
+        """
+        Returns the window of `mid` holding its newest videos.
+        """
+        window = self.window(mid=mid)
+        if window.anchored and self.isFresh(window=window):
+            self.hits += 1
+            return window
+        self.misses += 1
+        if not await window.loadNewest():
+            return None
+        return window
+
+    async def findCursor(self, window: VideoWindow, key: str) -> str | None:
+        """
+        Finds the filename that did not fit in its button from its `shortKey`, among
+        the cached videos or else the newest ones.
+        """
+        for attempt in range(2):
+            for video in window.videos:
+                if shortKey(value=video["filename"]) == key:
+                    return video["filename"]
+            if attempt == 0 and not await window.loadNewest():
+                break
+        logger.info(msg=f"Video {window.MID}->{key} not found")
+        return None
+
+    async def locate(self, mid: str, cursor: str, step: int = 0) -> tuple[VideoWindow, int] | None:
+        """
+        Finds the video `step` positions away from `cursor` (negative is newer),
+        fetching adjacent pages only when it falls outside the cached window.
+        """
+        window = self.window(mid=mid)
+        if isShortKey(value=cursor):
+            found = await self.findCursor(window=window, key=cursor)
+            if found is None:
+                return None
+            cursor = found
+        if not self.isFresh(window=window) or window.indexOf(cursor=cursor) is None:
+            self.misses += 1
+            if not await window.loadAround(cursor=cursor):
+                return None
+        else:
+            self.hits += 1
+        index = window.indexOf(cursor=cursor)
+        if index is None:
+            logger.info(msg=f"Video {mid}->{cursor} not found")
+            return None
+        target = index + step
+        while target < 0:
+            if (window.anchored and self.isFresh(window=window)) or not await window.loadNewer():
+                return None
+            index = window.indexOf(cursor=cursor)
+            if index is None:
+                return None
+            target = index + step
+        while target >= len(window.videos):
+            if not await window.loadOlder():
+                return None
+            index = window.indexOf(cursor=cursor)
+            if index is None:
+                return None
+            target = index + step
+        return window, target
+
 
 class Video:
     def __init__(
-        self, update, context, chatId, baseUrl, port, apiKey, groupKey, mid
+        self, update, context, chatId, client: ShinobiClient, videos: VideoCache, mid,
+        uploader: "VideoUploader | None" = None, transcoder: "Transcoder | None" = None,
+        fileIds: "FileIdCache | None" = None,
     ) -> None:
         self.UPDATE = update
         self.CONTEXT = context
         self.CHAT_ID = chatId
-        self.BASEURL = baseUrl
-        self.PORT = port
-        self.API_KEY = apiKey
-        self.GROUP_KEY = groupKey
+        self.CLIENT = client
+        self.VIDEOS = videos
         self.MID = mid
-        self.url = f"{self.BASEURL}:{self.PORT}/{self.API_KEY}/videos/{self.GROUP_KEY}/{self.MID}"
+        self.UPLOADER = uploader
+        self.TRANSCODER = transcoder
+        self.FILE_IDS = fileIds
         self.query = update.callback_query
 
-    async def getVideo(self, index=None, operation=None) -> bool:
+    async def getVideo(self, cursor=None, step=0, operation=None) -> bool:
         HERE = inspect.currentframe()
         assert HERE is not None
         tag = HERE.f_code.co_name  # type: ignore
-        url = f"{self.BASEURL}:{self.PORT}/{self.API_KEY}/videos/{self.GROUP_KEY}/{self.MID}"
-        videoList = await queryUrl(url=url)
-        if videoList:
-            videoListInJson = videoList.json().get("videos")
+        if cursor is None:
+            return False
+        located = await self.VIDEOS.locate(mid=self.MID, cursor=cursor, step=step)
+        if located:
+            window, index = located
             try:
-                if index is not None:
-                    if operation == None:
-                        if await self.videoListOperation(
-                            videoListInJson=videoListInJson,
-                            index=index,
-                            tag=tag,
-                            url=url,
-                        ):
-                            return True
-                    else:
-                        if await self.videoDoOperation(
-                            videoListInJson=videoListInJson,
-                            index=index,
-                            url=url,
-                            operation=operation,
-                        ):
-                            return True
+                if operation == None:
+                    if await self.videoListOperation(
+                        window=window,
+                        index=index,
+                        tag=tag,
+                    ):
+                        return True
+                else:
+                    if await self.videoDoOperation(
+                        window=window,
+                        index=index,
+                        operation=operation,
+                    ):
+                        return True
             except Exception as e:
                 if isinstance(e, error.TelegramError):
                     logger.error(msg=f"PTB error in {HERE.f_code.co_name}:\n {e}")
@@ -60,13 +340,13 @@ class Video:
             return True
         else:
             logger.error(msg="Error something went wrong requesting videos")
+            await self.query.answer("No more videos...\u26A0\ufe0f")
         return False
 
     async def videoListOperation(
-        self, videoListInJson: list, index: int, tag: str, url: str
+        self, window: VideoWindow, index: int, tag: str
     ) -> bool:
-        number = len(videoListInJson)
-        video = videoListInJson[index]
+        video = window.videos[index]
         objects = video["objects"]
         start_time = datetime.fromisoformat(video.get("time"))
         end_time = datetime.fromisoformat(video.get("end"))
@@ -74,112 +354,231 @@ class Video:
         time = start_time.strftime("%Y-%m-%d %H:%M:%S")
         size = humanize.naturalsize(value=video.get("size"))
         fileName = video.get("filename")
-        videoUrl = url + "/" + fileName
-        setRead = f"{videoUrl}/status/2"
+        videoUrl = self.CLIENT.videoUrl(mid=self.MID, fileName=fileName)
+        if window.anchored and window.total:
+            position = f"{index+1}/{window.total} - "
+        elif window.anchored:
+            position = f"{index+1} - "
+        else:
+            position = ""
         buttons = [
             [
                 InlineKeyboardButton(
                     text="set unread",
-                    callback_data={
-                        "tag": tag,
-                        "choice": index,
-                        "mid": self.MID,
-                        "operation": "unread",
-                    },
+                    callback_data=pack(
+                        tag=tag, mid=self.MID, cursor=fileName, operation="unread"
+                    ),
                 ),
                 InlineKeyboardButton(
                     text="delete",
-                    callback_data={
-                        "tag": tag,
-                        "choice": index,
-                        "mid": self.MID,
-                        "operation": "delete",
-                    },
+                    callback_data=pack(
+                        tag=tag, mid=self.MID, cursor=fileName, operation="delete"
+                    ),
                 ),
             ]
         ]
-        if index > 0:
+        if index > 0 or not window.anchored:
             buttons[0].insert(
                 0,
                 InlineKeyboardButton(
                     text="prev",
-                    callback_data={"tag": tag, "choice": index - 1, "mid": self.MID},
+                    callback_data=pack(tag=tag, mid=self.MID, cursor=fileName, step=-1),
                 ),
             )
-        if index < number - 1:
+        if index < len(window.videos) - 1 or not window.complete:
             buttons[0].append(
                 InlineKeyboardButton(
                     text="next",
-                    callback_data={"tag": tag, "choice": index + 1, "mid": self.MID},
+                    callback_data=pack(tag=tag, mid=self.MID, cursor=fileName, step=1),
                 )
             )
         reply_markup = InlineKeyboardMarkup(inline_keyboard=buttons)
         if video["status"] == 1:
-            response = await queryUrl(url=setRead)
-            if response:
-                if response.json()["ok"]:
-                    logger.debug(msg=f"Video {self.MID}->{fileName} set as read")
-                    await self.query.answer("Video set as read.\U0001F373")
-                else:
-                    logger.error(msg="Error something went wrong setting read status")
-                    await self.query.answer(
-                        "Error something went wrong setting read status... \u26A0\ufe0f"
-                    )
+            if await self.CLIENT.setVideoStatus(mid=self.MID, fileName=fileName, status=2):
+                video["status"] = 2
+                logger.debug(msg=f"Video {self.MID}->{fileName} set as read")
+                await self.query.answer("Video set as read.\U0001F373")
             else:
-                logger.error(
-                    msg="Error something went wrong requesting set read status"
+                logger.error(msg="Error something went wrong setting read status")
+                await self.query.answer(
+                    "Error something went wrong setting read status... \u26A0\ufe0f"
                 )
+        caption = f"<b>{position}{time} - {duration} - {size}\ndetected objects: {objects}</b>"
+        if await self.sendFileId(fileName=fileName, caption=caption, reply_markup=reply_markup):
+            return True
+        if self.UPLOADER and self.UPLOADER.fits(size=video.get("size")):
+            await self.CONTEXT.bot.send_chat_action(
+                chat_id=self.CHAT_ID, action=constants.ChatAction.UPLOAD_VIDEO
+            )
+            if sent := await self.UPLOADER.sendVideo(
+                baseUrl=self.CONTEXT.bot.base_url,
+                chatId=self.CHAT_ID,
+                mid=self.MID,
+                fileName=fileName,
+                caption=caption,
+                parse_mode="HTML",
+                supports_streaming=True,
+                reply_markup=reply_markup,
+            ):
+                logger.debug(msg=f"Video {self.MID}->{fileName} sent")
+                await self.remember(fileName=fileName, sent=sent)
+                return True
+        elif self.UPLOADER and self.TRANSCODER:
+            if await self.sendFileId(
+                fileName=fileName,
+                caption=caption.replace("</b>", "\n(preview)</b>"),
+                reply_markup=reply_markup,
+                variant=self.TRANSCODER.profile,
+            ):
+                return True
+            # made and sent in background, the preview may take minutes
+            await self.CONTEXT.bot.send_chat_action(
+                chat_id=self.CHAT_ID, action=constants.ChatAction.RECORD_VIDEO
+            )
+            task = asyncio.create_task(
+                coro=self.sendPreview(
+                    fileName=fileName,
+                    seconds=(end_time - start_time).total_seconds(),
+                    caption=caption,
+                    reply_markup=reply_markup,
+                    videoUrl=videoUrl,
+                ),
+                name="Preview",
+            )
+            _previews.add(task)
+            task.add_done_callback(_previews.discard)
+            return True
         try:
-            if await self.CONTEXT.bot.send_video(
+            if sent := await self.CONTEXT.bot.send_video(
                 chat_id=self.CHAT_ID,
                 video=videoUrl,
                 supports_streaming=True,
-                caption=f"<b>{index+1}/{number} - {time} - {duration} - {size}\ndetected objects: {objects}</b>",
+                caption=caption,
                 reply_markup=reply_markup,
                 parse_mode="HTML",
             ):
                 logger.debug(msg=f"Video {self.MID}->{fileName} sent")
+                await self.remember(fileName=fileName, sent=sent)
                 return True
         except error.TelegramError as e:
             logger.error(
                 msg=f"Error sending video (maybe exceed 20Mb), continuing with link: {e}"
             )
-            if await self.CONTEXT.bot.send_message(
+            return await self.sendLink(
+                fileName=fileName, caption=caption, reply_markup=reply_markup, videoUrl=videoUrl
+            )
+        return False
+
+    async def sendFileId(
+        self, fileName: str, caption: str, reply_markup: InlineKeyboardMarkup, variant: str = ""
+    ) -> bool:
+        """
+        Sends the video again by the file_id Telegram gave it the first time.
+        """
+        if self.FILE_IDS is None:
+            return False
+        fileId = self.FILE_IDS.getVideo(mid=self.MID, fileName=fileName, variant=variant)
+        if fileId is None:
+            return False
+        try:
+            await self.CONTEXT.bot.send_video(
                 chat_id=self.CHAT_ID,
-                text=f"<b>{index+1}/{number} - {time} - {duration} - {size}\ndetected objects: {objects}\n{videoUrl}</b>",
-                disable_web_page_preview=False,
+                video=fileId,
+                supports_streaming=True,
+                caption=caption,
                 reply_markup=reply_markup,
                 parse_mode="HTML",
-            ):
-                logger.debug(msg=f"Link to Video {self.MID}->{fileName} sent")
-                return True
+            )
+        except error.BadRequest as e:
+            logger.info(msg=f"File_id of video {self.MID}->{fileName} no longer valid: {e}")
+            await self.FILE_IDS.forgetVideo(mid=self.MID, fileName=fileName, variant=variant)
+            return False
+        logger.debug(msg=f"Video {self.MID}->{fileName} sent by file_id")
+        return True
+
+    async def remember(self, fileName: str, sent: Any, variant: str = "") -> None:
+        if self.FILE_IDS is None:
+            return
+        from fileIdCache import fileIdOf
+        fileId = fileIdOf(sent=sent)
+        if fileId:
+            await self.FILE_IDS.putVideo(
+                mid=self.MID, fileName=fileName, fileId=fileId, variant=variant
+            )
+
+    async def sendLink(
+        self, fileName: str, caption: str, reply_markup: InlineKeyboardMarkup, videoUrl: str
+    ) -> bool:
+        if await self.CONTEXT.bot.send_message(
+            chat_id=self.CHAT_ID,
+            text=caption.replace("</b>", f"\n{videoUrl}</b>"),
+            disable_web_page_preview=False,
+            reply_markup=reply_markup,
+            parse_mode="HTML",
+        ):
+            logger.debug(msg=f"Link to Video {self.MID}->{fileName} sent")
+            return True
         return False
 
+    async def sendPreview(
+        self,
+        fileName: str,
+        seconds: float,
+        caption: str,
+        reply_markup: InlineKeyboardMarkup,
+        videoUrl: str,
+    ) -> None:
+        """
+        Sends a preview of a video too big for Telegram, or its link when the preview
+        cannot be made.
+        """
+        assert self.UPLOADER is not None and self.TRANSCODER is not None
+        try:
+            path = await self.TRANSCODER.preview(
+                mid=self.MID, fileName=fileName, url=videoUrl, seconds=seconds
+            )
+            if path is not None and (sent := await self.UPLOADER.sendFile(
+                baseUrl=self.CONTEXT.bot.base_url,
+                chatId=self.CHAT_ID,
+                path=path,
+                caption=caption.replace("</b>", "\n(preview)</b>"),
+                parse_mode="HTML",
+                supports_streaming=True,
+                reply_markup=reply_markup,
+            )):
+                logger.debug(msg=f"Preview of Video {self.MID}->{fileName} sent")
+                await self.remember(fileName=fileName, sent=sent, variant=self.TRANSCODER.profile)
+                return
+            await self.sendLink(
+                fileName=fileName, caption=caption, reply_markup=reply_markup, videoUrl=videoUrl
+            )
+        except error.TelegramError as e:
+            logger.error(msg=f"PTB error sending preview of {self.MID}->{fileName}:\n {e}")
+
     async def videoDoOperation(
-        self, videoListInJson: list, index: int, url: str, operation: str
+        self, window: VideoWindow, index: int, operation: str
     ) -> bool:
-        video = videoListInJson[index]
+        video = window.videos[index]
         fileName = video.get("filename")
-        videoUrl = url + "/" + fileName
-        setUnread = f"{videoUrl}/status/1"
-        delete = f"{videoUrl}/delete"
         if operation == "unread":
-            url = setUnread
+            done = await self.CLIENT.setVideoStatus(mid=self.MID, fileName=fileName, status=1)
             caption = "set as unread"
         else:
-            url = delete
+            done = await self.CLIENT.deleteVideo(mid=self.MID, fileName=fileName)
             caption = "has been deleted"
-        response = await queryUrl(url=url)
-        if response:
-            if response.json()["ok"]:
-                logger.debug(msg=f"Video {self.MID}->{fileName} {caption}")
-                await self.query.answer(f"Video {caption}.\U0001F373")
-                return True
+        if done:
+            if operation == "unread":
+                video["status"] = 1
             else:
-                logger.error(msg="Error something went wrong doing things on video")
-                await self.query.answer(
-                    "Error something went wrong doing things on video... \u26A0\ufe0f"
-                )
+                window.remove(cursor=fileName)
+                if self.FILE_IDS is not None:
+                    await self.FILE_IDS.forgetVideo(mid=self.MID, fileName=fileName)
+            logger.debug(msg=f"Video {self.MID}->{fileName} {caption}")
+            await self.query.answer(f"Video {caption}.\U0001F373")
+            return True
         else:
-            logger.error(msg="Error something went wrong requesting videos")
+            logger.error(msg="Error something went wrong doing things on video")
+            await self.query.answer(
+                "Error something went wrong doing things on video... \u26A0\ufe0f"
+            )
         return False
@@ -0,0 +1,183 @@
+import logging
+import asyncio
+import time
+from typing import Any
+from settings import AddressKList
+from httpQueryUrl import queryUrl
+
+logger = logging.getLogger(name=__name__)
+
+class CircuitBreaker:
+    """
+    A class representing a circuit breaker for a single target: after `threshold`
+    consecutive failures the target is skipped for `cooldown` seconds, then one call
+    is let through to check whether it came back.
+    """
+    def __init__(self, threshold: int = 3, cooldown: float = 60) -> None:
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.failures: int = 0
+        self.openedAt: float | None = None
+        # a call is checking whether the target came back
+        self.probing: bool = False
+
+    def allow(self) -> bool:
+        if self.openedAt is None:
+            return True
+        if time.monotonic() - self.openedAt >= self.cooldown:
+            # half open, the others wait for this call, or for another cooldown if it
+            # never ends
+            self.openedAt = time.monotonic()
+            self.probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.openedAt = None
+        self.probing = False
+
+    def failure(self) -> bool:
+        """
+        Returns:
+            bool: True if this failure opened the circuit.
+        """
+        self.failures += 1
+        if self.probing:
+            self.probing = False
+            self.openedAt = time.monotonic()
+            return True
+        if self.failures >= self.threshold and self.openedAt is None:
+            self.openedAt = time.monotonic()
+            return True
+        return False
+
+    @property
+    def isOpen(self) -> bool:
+        return self.openedAt is not None
+
+
+class WebhookDispatcher:
+    """
+    A class representing the calls to the webhooks configured for monitor tags.
+    All the webhooks an event matches are called concurrently, each with its own
+    timeout, retries and circuit breaker, so a dead target never delays the others.
+    """
+    def __init__(
+        self,
+        webhooks: AddressKList | None,
+        timeout: float = 2,
+        retries: int = 2,
+        backoff: float = 0.5,
+        failureThreshold: int = 3,
+        cooldown: float = 60,
+    ) -> None:
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.failureThreshold = failureThreshold
+        self.cooldown = cooldown
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.calls: int = 0
+        self.failed: int = 0
+        self.skipped: int = 0
+        self.compile(webhooks=webhooks)
+
+    def compile(self, webhooks: AddressKList | None) -> None:
+        """
+        Builds the tag -> urls map, a tag can have a single url or a list of them.
+        """
+        byTag: dict[str, tuple[str, ...]] = {}
+        for tag, urls in (webhooks or {}).items():
+            if isinstance(urls, (list, tuple, set)):
+                byTag[str(object=tag).strip()] = tuple(str(object=url) for url in urls)
+            elif urls:
+                byTag[str(object=tag).strip()] = (str(object=urls),)
+        self.byTag = byTag
+        self.tags = frozenset(byTag)
+
+    def configure(
+        self, webhooks: AddressKList | None, timeout: float, retries: int, cooldown: float
+    ) -> None:
+        """
+        Applies new settings, breakers of urls still configured keep their state.
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.cooldown = cooldown
+        self.compile(webhooks=webhooks)
+        urls = {url for urls in self.byTag.values() for url in urls}
+        self.breakers = {url: breaker for url, breaker in self.breakers.items() if url in urls}
+        for breaker in self.breakers.values():
+            breaker.cooldown = cooldown
+
+    def __bool__(self) -> bool:
+        return bool(self.byTag)
+
+    def targets(self, tags: list[str] | None) -> list[str]:
+        if not tags or not self.tags:
+            return []
+        urls: dict[str, None] = {}
+        for tag in self.tags.intersection(tags):
+            urls.update(dict.fromkeys(self.byTag[tag]))
+        return list(urls)
+
+    def _breaker(self, url: str) -> CircuitBreaker:
+        breaker = self.breakers.get(url)
+        if breaker is None:
+            breaker = CircuitBreaker(threshold=self.failureThreshold, cooldown=self.cooldown)
+            self.breakers[url] = breaker
+        return breaker
+
+    async def call(self, url: str) -> bool:
+        breaker = self._breaker(url=url)
+        if not breaker.allow():
+            logger.debug(msg=f"Webhook {url} is failing, skipped until its cooldown ends")
+            self.skipped += 1
+            return False
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            self.calls += 1
+            try:
+                response = await queryUrl(url=url, timeout=self.timeout)
+            except Exception as e:
+                logger.error(msg=f"Error calling webhook {url}: {e}")
+                response = None
+            if response:
+                logger.debug(msg=f"Webhook {url} called successfully")
+                breaker.success()
+                return True
+            if attempt < self.retries:
+                await asyncio.sleep(delay=delay)
+                delay *= 2
+        self.failed += 1
+        if breaker.failure():
+            logger.warning(msg=f"Webhook {url} keeps failing, skipping it for {self.cooldown}s")
+        else:
+            logger.error(msg=f"Connection error, no response from {url}")
+        return False
+
+    async def dispatch(self, tags: list[str] | None) -> dict[str, bool]:
+        """
+        Calls the webhooks of `tags`.
+        Returns:
+            dict: url -> True if the call succeeded.
+        """
+        urls = self.targets(tags=tags)
+        if not urls:
+            logger.debug(msg="No webhooks for these tags")
+            return {}
+        results = await asyncio.gather(*(self.call(url=url) for url in urls))
+        return dict(zip(urls, results))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "open": [url for url, breaker in self.breakers.items() if breaker.isOpen],
+        }
+
+
+if __name__ == "__main__":
+    raise SystemExit